@@ -1,362 +1,3666 @@
 #!/usr/bin/env python3
 import re
+import os
 import sys
+import argparse
 import json
-import urllib.request
+import bisect
+import contextlib
+import cProfile
+import pstats
+import sqlite3
+import hashlib
+import unicodedata
+import email.utils
+import fnmatch
+import difflib
+import gzip
+import heapq
+import queue
+import random
+import collections
+import http.client
 import urllib.parse
 import time
-from typing import Dict, Optional, Tuple, List
+import threading
+import tracemalloc
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable, Dict, Iterable, Iterator, Optional, Tuple, List, Union
 import html
+import shutil
+import stat
+import tempfile
+from array import array
+import xml.parsers.expat
+import xml.sax.saxutils
 import xml.etree.ElementTree as ET
 
-# Añadimos constantes para palabras clave de ICU que no deben traducirse
-ICU_KEYWORDS = ['select', 'plural', 'VAR_SELECT', 'VAR_PLURAL', 'true', 'false', 'other', '=0', '=1', '=2']
+# Tipos de argumento ICU cuyos casos contienen mensajes traducibles
+ICU_CASE_TYPES = ('plural', 'select', 'selectordinal')
 
-def extract_icu_parts(text: str) -> Tuple[List[str], List[str]]:
+# Idiomas destino soportados por la aplicación
+SUPPORTED_LANGUAGES = ['en', 'fr', 'ru']
+
+# Estado de las ejecuciones (memoria de traducción, diarios, métricas, perfiles),
+# junto a este script: fuera de src/assets, que angular.json copia entero al build
+RUN_STATE_DIRNAME = '.translation-cache'
+
+# Memoria de traducción persistente (se guarda en RUN_STATE_DIRNAME)
+TRANSLATION_MEMORY_FILENAME = '.translation_memory.sqlite3'
+TRANSLATION_MEMORY_MAX_ENTRIES = 200000
+TRANSLATION_MEMORY_MAX_AGE_DAYS = 180
+
+# Memoria aproximada (fuzzy): índice de n-gramas de caracteres sobre las traducciones
+# conocidas. Solo se proponen coincidencias con al menos esta similitud; las que
+# difieren solo en números, puntuación de los extremos o mayúscula inicial se aplican
+FUZZY_NGRAM_SIZE = 3
+FUZZY_MIN_SIMILARITY = 0.75
+FUZZY_MIN_NGRAMS = 4
+# Entradas de los índices de n-gramas que se recorren como máximo en cada búsqueda
+FUZZY_MAX_POSTINGS = 2000
+FUZZY_MAX_CANDIDATES = 20
+FUZZY_RERANK = 3
+
+# Glosario por defecto (términos protegidos y traducciones forzadas), junto a este script
+GLOSSARY_FILENAME = 'translation_glossary.json'
+
+# Nota de XLIFF donde el modo incremental guarda la huella del source de cada unidad
+SOURCE_FINGERPRINT_NOTE = 'source-fingerprint'
+
+# Diario (write-ahead) de las unidades ya traducidas de cada idioma, junto a su
+# archivo de salida. Se vuelca a disco cada N registros o cada tantos segundos
+JOURNAL_FLUSH_RECORDS = 100
+JOURNAL_FLUSH_INTERVAL = 2.0
+
+# Bundles JSON para cargar las traducciones en tiempo de ejecución ($localize/loadTranslations):
+# uno por idioma con un hash de su contenido en el nombre, más un manifiesto
+BUNDLE_DIRNAME = 'bundles'
+BUNDLE_MANIFEST_FILENAME = 'manifest.json'
+BUNDLE_HASH_LENGTH = 16
+# Versión del contenido de los bundles: al cambiarla se regeneran aunque el XLIFF no cambie
+BUNDLE_FORMAT_VERSION = 2
+
+# Modo watch: cada cuánto se comprueba si el archivo de origen cambió (segundos)
+WATCH_POLL_INTERVAL = 0.2
+
+# Tamaño de bloque para leer y copiar archivos XLIFF en streaming
+XLIFF_CHUNK_SIZE = 64 * 1024
+
+# Modo por lotes: los segmentos se unen con saltos de línea, que los tres backends
+# conservan, y la respuesta se vuelve a dividir por el mismo delimitador
+BATCH_DELIMITER = '\n'
+BATCH_MAX_SEGMENTS = 64
+# Tamaño máximo (bytes UTF-8 del texto sin codificar) de una petición por backend
+BACKEND_PAYLOAD_LIMITS = {
+    'google': 4000,
+    'mymemory': 500,
+    'libretranslate': 2000,
+}
+# Tamaño máximo de un fragmento de texto largo: una frase más grande se divide por
+# cláusulas o palabras para que cualquier backend pueda recibirla
+SEGMENT_MAX_BYTES = min(BACKEND_PAYLOAD_LIMITS.values())
+# Peticiones simultáneas permitidas por backend (configurable por traductor)
+BACKEND_CONCURRENCY = {
+    'google': 4,
+    'mymemory': 2,
+    'libretranslate': 1,
+}
+# Token bucket por backend: (peticiones por segundo, ráfaga máxima)
+BACKEND_RATE_LIMITS = {
+    'google': (5.0, 10),
+    'mymemory': (2.0, 5),
+    'libretranslate': (1.0, 3),
+}
+# URL base de cada backend (configurable por traductor, p. ej. para un servidor propio)
+BACKEND_BASE_URLS = {
+    'google': 'https://translate.googleapis.com',
+    'mymemory': 'https://api.mymemory.translated.net',
+    'libretranslate': 'https://libretranslate.de',
+}
+# Conexiones keep-alive por host en la capa HTTP compartida
+HTTP_POOL_SIZE = 8
+
+# Espera por defecto tras un 429 sin cabecera Retry-After (segundos)
+RATE_LIMIT_DEFAULT_BACKOFF = 10.0
+
+# Métricas de ejecución: límites del histograma de latencia por backend (segundos),
+# informe JSON y textfile de Prometheus que se escriben junto a los archivos de salida
+METRICS_LATENCY_BUCKETS = (0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+METRICS_REPORT_FILENAME = 'translation_metrics.json'
+METRICS_TEXTFILE_FILENAME = 'translation_metrics.prom'
+METRICS_PREFIX = 'xliff_translation'
+
+# Perfilado (--profile): funciones y líneas de asignación mostradas, y volcado de pstats
+PROFILE_TOP = 25
+PROFILE_FILENAME = 'translation_profile.prof'
+
+# Enrutado adaptativo: resultados recientes considerados por backend y peso de la
+# latencia (EWMA). Un backend se abre (deja de recibir tráfico) tras N fallos seguidos
+# o si su tasa de éxito reciente cae por debajo del mínimo con suficientes muestras
+ROUTER_WINDOW = 50
+ROUTER_LATENCY_ALPHA = 0.2
+ROUTER_DEFAULT_LATENCY = 1.0
+ROUTER_FAILURE_THRESHOLD = 5
+ROUTER_MIN_SUCCESS_RATE = 0.5
+ROUTER_MIN_SAMPLES = 10
+# Cuánto mejor debe ser un backend para adelantar a otro preferido (por posición)
+ROUTER_PREFERENCE_WEIGHT = 0.5
+# Sondeo en segundo plano de backends abiertos (segundos)
+ROUTER_RESET_TIMEOUT = 30.0
+ROUTER_MAX_RESET_TIMEOUT = 300.0
+ROUTER_PROBE_TEXT = 'Hola'
+# Hedging: si el backend principal no responde dentro de este percentil de su
+# latencia reciente, se envía el mismo segmento a otro backend y gana la primera
+# respuesta válida. Las peticiones extra se limitan a una fracción de las principales
+HEDGE_PERCENTILE = 0.95
+HEDGE_MAX_RATIO = 0.1
+HEDGE_BURST = 5
+HEDGE_MIN_SAMPLES = 20
+# Reintentos diferidos: los segmentos que fallan en todos los backends esperan su propio
+# backoff exponencial (con jitter) y se reintentan entre las rondas de la primera pasada
+# y al terminarla, rotando el backend inicial, sin superar una fracción global de
+# reintentos sobre los segmentos enviados
+RETRY_BASE_DELAY = 1.0
+RETRY_MAX_DELAY = 30.0
+RETRY_MAX_ATTEMPTS = 3
+RETRY_MAX_RATIO = 0.2
+RETRY_BURST = 20
+# Espera máxima seguida (segundos) mientras vence un backoff: después se revisan el
+# plazo de la ejecución y el cierre del traductor
+RETRY_MAX_WAIT = 1.0
+BACKEND_NAMES = {
+    'google': 'Google Translate',
+    'mymemory': 'MyMemory',
+    'libretranslate': 'LibreTranslate',
+}
+
+# Token que sustituye a cada argumento ICU ({n}, {n, plural, ...}, #) dentro del
+# texto de un mensaje; solo el texto alrededor de los tokens se traduce
+ICU_TOKEN_PATTERN = re.compile(r'__ICU_PLACEHOLDER_(\d+)__')
+ICU_SPECIAL_CHARS = re.compile(r"[{}#']")
+ICU_ARGUMENT_NAME = re.compile(r'\s*([\w.]+)\s*')
+
+class IcuArgument:
+    """
+    Argumento plural/select compilado: fragmentos literales (cabecera, claves de
+    cada caso y llaves) intercalados con los mensajes de cada caso.
+    """
+    
+    __slots__ = ('parts',)
+    
+    def __init__(self, parts: List):
+        self.parts = parts
+    
+    def render(self, translations: Dict[str, str]) -> str:
+        return ''.join(part if isinstance(part, str) else part.render(translations) for part in self.parts)
+
+class IcuMessage:
+    """
+    Mensaje ICU MessageFormat compilado.
+    
+    'text' es el texto del mensaje con cada argumento sustituido por un token
+    __ICU_PLACEHOLDER_n__; 'arguments' guarda, por token, el argumento original
+    (texto literal para {n}, # o citas, IcuArgument para plural/select). Las hojas
+    traducibles son los textos que contienen alguna letra fuera de los tokens.
+    Los apóstrofos escapados ('') llegan a 'text' como un apóstrofo literal;
+    'escaped_text' guarda entonces el texto con sus escapes originales, y en la
+    traducción se vuelven a escapar los apóstrofos.
+    """
+    
+    __slots__ = ('text', 'arguments', 'translatable', 'leaves', 'escaped_text')
+    
+    def __init__(self, text: str, arguments: List, translatable: Optional[bool] = None,
+                 escaped_text: Optional[str] = None):
+        self.text = text
+        self.arguments = arguments
+        self.escaped_text = escaped_text
+        if translatable is None:
+            core = INLINE_TOKEN_PATTERN.sub('', ICU_TOKEN_PATTERN.sub('', text))
+            translatable = re.search(r'[^\W\d_]', core) is not None
+        self.translatable = translatable
+        # Hojas traducibles (texto sin espacios exteriores) de todo el árbol, sin repetir
+        leaves = [text.strip()] if self.translatable else []
+        for argument in arguments:
+            if isinstance(argument, IcuArgument):
+                for part in argument.parts:
+                    if not isinstance(part, str):
+                        leaves.extend(leaf for leaf in part.leaves if leaf not in leaves)
+        self.leaves = leaves
+    
+    @property
+    def is_plain(self) -> bool:
+        """Texto sin argumentos ICU: se traduce entero como hasta ahora."""
+        return not self.arguments
+    
+    def render(self, translations: Dict[str, str]) -> str:
+        """
+        Reconstruye el mensaje con las hojas traducidas (hoja -> traducción) en una
+        sola pasada; las hojas sin traducción se dejan como estaban.
+        """
+        text = self.text if self.escaped_text is None else self.escaped_text
+        if self.translatable:
+            core = self.text.strip()
+            translated = translations.get(core)
+            if translated is not None:
+                if self.escaped_text is not None:
+                    translated = translated.replace("'", "''")
+                start = len(self.text) - len(self.text.lstrip())
+                text = self.text[:start] + translated + self.text[start + len(core):]
+        if not self.arguments:
+            return text
+        
+        def argument(match: re.Match) -> str:
+            value = self.arguments[int(match.group(1))]
+            return value if isinstance(value, str) else value.render(translations)
+        return ICU_TOKEN_PATTERN.sub(argument, text)
+
+class _IcuParser:
+    """Analizador de una sola pasada (descenso recursivo) de ICU MessageFormat."""
+    
+    def __init__(self, text: str):
+        self.text = text
+        self.pos = 0
+    
+    def message(self, in_plural: bool) -> IcuMessage:
+        """Lee texto y argumentos hasta la llave de cierre del mensaje o el final."""
+        text = self.text
+        chunks: List[str] = []
+        # Los mismos fragmentos con los apóstrofos escapados tal como venían
+        escaped_chunks: List[str] = []
+        has_escapes = False
+        arguments: List = []
+        while self.pos < len(text):
+            match = ICU_SPECIAL_CHARS.search(text, self.pos)
+            end = match.start() if match else len(text)
+            if end > self.pos:
+                chunks.append(text[self.pos:end])
+                escaped_chunks.append(chunks[-1])
+                self.pos = end
+            if match is None:
+                break
+            char = match.group(0)
+            if char == '}':
+                break
+            if char == '{':
+                argument = self.argument(in_plural)
+            elif char == '#' and not in_plural:
+                chunks.append('#')
+                escaped_chunks.append('#')
+                self.pos += 1
+                continue
+            elif char == '#':
+                argument = '#'
+                self.pos += 1
+            elif text.startswith("''", self.pos):
+                # Apóstrofo escapado: para el backend es un apóstrofo más del texto
+                chunks.append("'")
+                escaped_chunks.append("''")
+                has_escapes = True
+                self.pos += 2
+                continue
+            else:
+                argument = self.quoted(in_plural)
+                if argument is None:
+                    chunks.append("'")
+                    escaped_chunks.append("'")
+                    self.pos += 1
+                    continue
+            chunks.append(f'__ICU_PLACEHOLDER_{len(arguments)}__')
+            escaped_chunks.append(chunks[-1])
+            arguments.append(argument)
+        return IcuMessage(''.join(chunks), arguments, escaped_text=''.join(escaped_chunks) if has_escapes else None)
+    
+    def quoted(self, in_plural: bool) -> Optional[str]:
+        """
+        Texto entre apóstrofos que escapa caracteres especiales ('{', '}', '#'). Se
+        conserva literal; un apóstrofo normal devuelve None.
+        """
+        text, start = self.text, self.pos
+        following = text[start + 1:start + 2]
+        if following in ('{', '}') or (following == '#' and in_plural):
+            end = text.find("'", start + 1)
+            end = len(text) - 1 if end < 0 else end
+            self.pos = end + 1
+            return text[start:self.pos]
+        return None
+    
+    def argument(self, in_plural: bool):
+        """Lee un argumento que empieza en '{' y devuelve su texto literal o un IcuArgument."""
+        text, start = self.text, self.pos
+        name = ICU_ARGUMENT_NAME.match(text, start + 1)
+        if name is None:
+            raise ValueError(f"ICU argument without name at {start}")
+        self.pos = name.end()
+        if text.startswith('}', self.pos):
+            self.pos += 1
+            return text[start:self.pos]
+        if not text.startswith(',', self.pos):
+            raise ValueError(f"Unexpected character in ICU argument at {self.pos}")
+        kind = ICU_ARGUMENT_NAME.match(text, self.pos + 1)
+        if kind is None:
+            raise ValueError(f"ICU argument without type at {self.pos}")
+        self.pos = kind.end()
+        if kind.group(1) not in ICU_CASE_TYPES:
+            # number, date, time...: el estilo se conserva literal hasta la llave de cierre
+            end = text.find('}', self.pos)
+            if end < 0:
+                raise ValueError("Unterminated ICU argument")
+            self.pos = end + 1
+            return text[start:self.pos]
+        if not text.startswith(',', self.pos):
+            raise ValueError(f"ICU {kind.group(1)} without cases at {self.pos}")
+        self.pos += 1
+        
+        nested_plural = in_plural or kind.group(1) != 'select'
+        parts: List = []
+        literal_start = start
+        while True:
+            # Espacios, 'offset:n' y la clave del caso, hasta la llave que abre su mensaje
+            while self.pos < len(text) and text[self.pos] not in '{}':
+                self.pos += 1
+            if self.pos >= len(text):
+                raise ValueError("Unterminated ICU argument")
+            if text[self.pos] == '}':
+                self.pos += 1
+                parts.append(text[literal_start:self.pos])
+                break
+            self.pos += 1
+            parts.append(text[literal_start:self.pos])
+            parts.append(self.message(nested_plural))
+            if not text.startswith('}', self.pos):
+                raise ValueError("Unterminated ICU case")
+            literal_start = self.pos
+            self.pos += 1
+        if len(parts) < 3:
+            raise ValueError(f"ICU {kind.group(1)} without cases")
+        return IcuArgument(parts)
+
+def parse_icu_message(text: str) -> IcuMessage:
+    """
+    Compila un texto con sintaxis ICU MessageFormat (plural/select anidados,
+    argumentos simples, # y citas). Si la sintaxis no es válida, o el texto no
+    tiene llaves, se devuelve como un mensaje plano que se traduce entero.
+    """
+    if '{' not in text:
+        return IcuMessage(text, [], translatable=True)
+    parser = _IcuParser(text)
+    try:
+        message = parser.message(in_plural=False)
+        if parser.pos != len(text):
+            raise ValueError(f"Unbalanced '}}' at {parser.pos}")
+    except ValueError:
+        return IcuMessage(text, [], translatable=True)
+    return message
+
+# Separadores de un texto largo, de mayor a menor: fin de frase o salto de línea,
+# fin de cláusula y espacio entre palabras. Los tokens no contienen espacios, así
+# que nunca quedan partidos
+SENTENCE_SEPARATOR = re.compile(r'\s*\n\s*|(?<=[.!?…])\s+')
+CLAUSE_SEPARATOR = re.compile(r'(?<=[,;:])\s+')
+WORD_SEPARATOR = re.compile(r'\s+')
+
+def _split_keeping(text: str, pattern: re.Pattern) -> List[str]:
+    """Divide por un patrón conservando los separadores en las posiciones impares."""
+    parts = []
+    last = 0
+    for match in pattern.finditer(text):
+        parts.append(text[last:match.start()])
+        parts.append(match.group(0))
+        last = match.end()
+    parts.append(text[last:])
+    return parts
+
+def _fit_segment(text: str, limit: int) -> List[str]:
+    """
+    Divide un fragmento que supera el límite por cláusulas y, si no basta, por
+    palabras, reagrupando de forma voraz las partes consecutivas que caben juntas.
+    Una sola palabra mayor que el límite se deja entera.
+    """
+    if len(text.encode('utf-8')) <= limit:
+        return [text]
+    for pattern in (CLAUSE_SEPARATOR, WORD_SEPARATOR):
+        parts = _split_keeping(text, pattern)
+        if len(parts) > 1:
+            break
+    else:
+        return [text]
+    
+    result: List[str] = []
+    current = parts[0]
+    for position in range(1, len(parts), 2):
+        separator, following = parts[position], parts[position + 1]
+        if len((current + separator + following).encode('utf-8')) <= limit:
+            current += separator + following
+        else:
+            result.extend(_fit_segment(current, limit))
+            result.append(separator)
+            current = following
+    result.extend(_fit_segment(current, limit))
+    return result
+
+class SegmentedText:
+    """
+    Texto de varias frases o largo dividido en frases completas, con los separadores
+    originales para reconstruirlo. Las frases que no caben en SEGMENT_MAX_BYTES se
+    dividen por cláusulas o palabras. Cada frase es una hoja independiente: se
+    guarda por separado en la memoria de traducción y se empaqueta con el resto de
+    segmentos del lote hasta el límite de cada backend.
+    """
+    
+    __slots__ = ('parts', 'leaves')
+    
+    def __init__(self, text: str, limit: int = SEGMENT_MAX_BYTES):
+        # Fragmentos en las posiciones pares, separadores en las impares
+        self.parts: List[str] = []
+        sentences = _split_keeping(text, SENTENCE_SEPARATOR)
+        for position, part in enumerate(sentences):
+            self.parts.extend(_fit_segment(part, limit) if position % 2 == 0 else [part])
+        leaves = []
+        for part in self.parts[::2]:
+            core = INLINE_TOKEN_PATTERN.sub('', ICU_TOKEN_PATTERN.sub('', part))
+            if re.search(r'[^\W\d_]', core) and part not in leaves:
+                leaves.append(part)
+        self.leaves = leaves
+    
+    @property
+    def is_split(self) -> bool:
+        return len(self.parts) > 1
+    
+    def render(self, translations: Dict[str, str]) -> str:
+        return ''.join(
+            translations.get(part, part) if position % 2 == 0 else part for position, part in enumerate(self.parts)
+        )
+
+# Tokens estables para los elementos en línea (<x id="..."/>) de un <source>. Los pares
+# START_*/CLOSE_* comparten número para poder validar que siguen bien anidados
+INLINE_TOKEN_PATTERN = re.compile(r'__INLINE_(PLACEHOLDER|OPEN|CLOSE)_(\d+)__')
+# Token que sustituye a cada término del glosario mientras el texto está en el backend
+GLOSSARY_TOKEN_PATTERN = re.compile(r'__TERM_(\d+)__')
+
+def inline_tokens_preserved(source: str, translated: str) -> bool:
+    """
+    Comprueba que la traducción conserva los tokens en línea del texto original:
+    los mismos tokens, cada uno una sola vez, y los pares de apertura y cierre
+    bien anidados. El resto del orden puede cambiar según el idioma.
+    
+    Una frase de un texto dividido (SegmentedText) puede contener solo la apertura
+    o solo el cierre de un par: esos tokens huérfanos deben seguir en el mismo
+    orden y fuera de cualquier par completo, para que el texto reconstruido quede
+    bien anidado.
+    """
+    expected = INLINE_TOKEN_PATTERN.findall(source)
+    found = INLINE_TOKEN_PATTERN.findall(translated)
+    if sorted(expected) != sorted(found) or len(set(found)) != len(found):
+        return False
+    opening = {number for kind, number in expected if kind == 'OPEN'}
+    closing = {number for kind, number in expected if kind == 'CLOSE'}
+    
+    def orphan(kind: str, number: str) -> bool:
+        return (kind == 'OPEN' and number not in closing) or (kind == 'CLOSE' and number not in opening)
+    
+    orphans = [token for token in expected if orphan(*token)]
+    opened: List[str] = []
+    found_orphans = []
+    for kind, number in found:
+        if orphan(kind, number):
+            # Un token huérfano dentro de un par completo lo cruzaría al reconstruir el texto
+            if opened:
+                return False
+            found_orphans.append((kind, number))
+        elif kind == 'OPEN':
+            opened.append(number)
+        elif kind == 'CLOSE' and (not opened or opened.pop() != number):
+            return False
+    return found_orphans == orphans
+
+def placeholders_preserved(source: str, translated: str) -> bool:
+    """Tokens en línea intactos, cada argumento ICU (token) exactamente una vez y los mismos términos del glosario."""
+    expected = ICU_TOKEN_PATTERN.findall(source)
+    if sorted(expected) != sorted(ICU_TOKEN_PATTERN.findall(translated)) or len(set(expected)) != len(expected):
+        return False
+    if sorted(GLOSSARY_TOKEN_PATTERN.findall(source)) != sorted(GLOSSARY_TOKEN_PATTERN.findall(translated)):
+        return False
+    return inline_tokens_preserved(source, translated)
+
+class Glossary:
+    """
+    Glosario de términos protegidos (marcas, símbolos bursátiles...) que no se
+    envían a traducir, y de términos con traducción forzada por idioma.
+    
+    Los términos se compilan una vez en un autómata de Aho-Corasick, de modo que
+    enmascarar un texto es un único recorrido lineal que sustituye cada término
+    (palabra completa, distinguiendo mayúsculas) por un token __TERM_n__. Los
+    tokens no dependen del idioma; restore los sustituye en una sola pasada por
+    el término original o por su traducción forzada para el idioma destino.
+    """
+    
+    def __init__(self, protected: Iterable[str] = (), translations: Optional[Dict[str, Dict[str, str]]] = None):
+        # Término -> traducción forzada por idioma ({} si solo se protege)
+        terms: Dict[str, Dict[str, str]] = {term: {} for term in protected if term}
+        for term, forced in (translations or {}).items():
+            if term:
+                terms.setdefault(term, {}).update(forced)
+        self.terms = list(terms)
+        self.translations = list(terms.values())
+        
+        # Autómata: transiciones, enlace de fallo y términos que terminan en cada estado
+        self._goto: List[Dict[str, int]] = [{}]
+        self._fail: List[int] = [0]
+        self._output: List[List[int]] = [[]]
+        for number, term in enumerate(self.terms):
+            state = 0
+            for char in term:
+                following = self._goto[state].get(char)
+                if following is None:
+                    following = self._goto[state][char] = len(self._goto)
+                    self._goto.append({})
+                    self._fail.append(0)
+                    self._output.append([])
+                state = following
+            self._output[state].append(number)
+        pending = collections.deque(self._goto[0].values())
+        while pending:
+            state = pending.popleft()
+            for char, following in self._goto[state].items():
+                pending.append(following)
+                fallback = self._fail[state]
+                while fallback and char not in self._goto[fallback]:
+                    fallback = self._fail[fallback]
+                self._fail[following] = self._goto[fallback].get(char, 0)
+                self._output[following] = self._output[following] + self._output[self._fail[following]]
+    
+    def __len__(self) -> int:
+        return len(self.terms)
+    
+    @classmethod
+    def load(cls, file_path: str) -> 'Glossary':
+        """
+        Lee un glosario JSON: {"protected": ["Visenture", ...], "translations":
+        {"término": {"en": "...", "fr": "..."}}}. En los idiomas sin traducción
+        forzada el término se conserva como en el original.
+        """
+        with open(file_path, 'r', encoding='utf-8') as f:
+            data = json.load(f)
+        return cls(data.get('protected', ()), data.get('translations'))
+    
+    @classmethod
+    def default(cls) -> Optional['Glossary']:
+        """Glosario GLOSSARY_FILENAME junto a este script, o None si no existe."""
+        file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), GLOSSARY_FILENAME)
+        return cls.load(file_path) if os.path.exists(file_path) else None
+    
+    @staticmethod
+    def _is_word_char(char: str) -> bool:
+        return char.isalnum() or char == '_'
+    
+    def mask(self, text: str) -> str:
+        """Sustituye cada término del glosario por su token (coincidencias más a la izquierda y más largas)."""
+        goto, fail, output, terms = self._goto, self._fail, self._output, self.terms
+        matches: List[Tuple[int, int, int]] = []
+        state = 0
+        for position, char in enumerate(text):
+            while state and char not in goto[state]:
+                state = fail[state]
+            state = goto[state].get(char, 0)
+            for number in output[state]:
+                start = position + 1 - len(terms[number])
+                # Solo palabras completas: 'ROI' no debe coincidir dentro de 'HEROICO'
+                if self._is_word_char(text[start]) and start > 0 and self._is_word_char(text[start - 1]):
+                    continue
+                if self._is_word_char(char) and position + 1 < len(text) and self._is_word_char(text[position + 1]):
+                    continue
+                matches.append((start, position + 1, number))
+        if not matches:
+            return text
+        
+        parts = []
+        last = 0
+        for start, end, number in sorted(matches, key=lambda match: (match[0], match[0] - match[1])):
+            if start < last:
+                continue
+            parts.append(text[last:start])
+            parts.append(f'__TERM_{number}__')
+            last = end
+        parts.append(text[last:])
+        return ''.join(parts)
+    
+    def fingerprint(self, masked: str, target_lang: str) -> str:
+        """
+        Huella de los términos presentes en un texto ya enmascarado y de su
+        traducción forzada al idioma destino, o '' si no contiene ninguno. Forma
+        parte de la clave de la memoria de traducción: al proteger un término nuevo
+        o cambiar su traducción forzada solo dejan de valer las traducciones de los
+        textos que lo contienen.
+        """
+        numbers = sorted({int(number) for number in GLOSSARY_TOKEN_PATTERN.findall(masked)})
+        terms = [(self.terms[number], self.translations[number].get(target_lang))
+                 for number in numbers if number < len(self.terms)]
+        if not terms:
+            return ''
+        return hashlib.sha1(json.dumps(terms, ensure_ascii=False).encode('utf-8')).hexdigest()[:12]
+    
+    def restore(self, text: str, target_lang: str) -> str:
+        """Sustituye los tokens por la traducción forzada del término o por el término original."""
+        def term(match: re.Match) -> str:
+            number = int(match.group(1))
+            if number >= len(self.terms):
+                return match.group(0)
+            return self.translations[number].get(target_lang, self.terms[number])
+        return GLOSSARY_TOKEN_PATTERN.sub(term, text)
+
+class TranslationMemory:
+    """
+    Memoria de traducción persistente en disco respaldada por SQLite.
+    
+    Cada entrada se identifica por (idioma origen, idioma destino, hash del texto
+    normalizado y de su variante) y guarda qué backend produjo la traducción y
+    cuándo. La variante (la huella del glosario, ver Glossary.fingerprint) separa
+    las traducciones de un mismo texto hechas con distintos términos protegidos.
+    Las entradas que superan la edad máxima o el tamaño máximo se eliminan al cerrar.
+    """
+    
+    # Número de escrituras acumuladas antes de confirmar la transacción
+    COMMIT_EVERY = 100
+    
+    def __init__(self, db_path: str, max_entries: int = TRANSLATION_MEMORY_MAX_ENTRIES,
+                 max_age_days: float = TRANSLATION_MEMORY_MAX_AGE_DAYS):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.max_age_days = max_age_days
+        self.hits = 0
+        self.misses = 0
+        self._pending_writes = 0
+        self._touched: Dict[Tuple[str, str, str], float] = {}
+        self._lock = threading.Lock()
+        
+        # La conexión se comparte entre hilos del motor concurrente, protegida por _lock
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute('PRAGMA journal_mode=WAL')
+        self.conn.execute('PRAGMA synchronous=NORMAL')
+        self.conn.execute("""
+            CREATE TABLE IF NOT EXISTS translations (
+                source_lang TEXT NOT NULL,
+                target_lang TEXT NOT NULL,
+                source_hash TEXT NOT NULL,
+                source_text TEXT NOT NULL,
+                target_text TEXT NOT NULL,
+                backend TEXT NOT NULL,
+                created_at REAL NOT NULL,
+                last_used_at REAL NOT NULL,
+                PRIMARY KEY (source_lang, target_lang, source_hash)
+            )
+        """)
+        self.conn.commit()
+    
+    @staticmethod
+    def normalize(text: str) -> str:
+        """Normaliza un texto (Unicode NFC y espacios colapsados) antes de calcular su hash."""
+        return ' '.join(unicodedata.normalize('NFC', text).split())
+    
+    @classmethod
+    def source_hash(cls, text: str, variant: str = '') -> str:
+        """Devuelve el hash SHA-256 del texto normalizado (y de su variante, si la tiene)."""
+        key = cls.normalize(text)
+        if variant:
+            key = f'{key}\0{variant}'
+        return hashlib.sha256(key.encode('utf-8')).hexdigest()
+    
+    def get(self, text: str, source_lang: str, target_lang: str, variant: str = '') -> Optional[str]:
+        """Busca una traducción guardada; devuelve None si no existe."""
+        key = (source_lang, target_lang, self.source_hash(text, variant))
+        with self._lock:
+            row = self.conn.execute(
+                'SELECT target_text FROM translations WHERE source_lang = ? AND target_lang = ? AND source_hash = ?',
+                key
+            ).fetchone()
+            if row is None:
+                self.misses += 1
+                return None
+            self.hits += 1
+            # La fecha de último uso se actualiza en bloque al cerrar
+            self._touched[key] = time.time()
+            return row[0]
+    
+    def put(self, text: str, translation: str, source_lang: str, target_lang: str, backend: str,
+            variant: str = ''):
+        """Guarda (o reemplaza) una traducción indicando el backend que la produjo."""
+        now = time.time()
+        with self._lock:
+            self.conn.execute(
+                'INSERT OR REPLACE INTO translations VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+                (source_lang, target_lang, self.source_hash(text, variant), self.normalize(text),
+                 translation, backend, now, now)
+            )
+            self._pending_writes += 1
+            if self._pending_writes >= self.COMMIT_EVERY:
+                self.conn.commit()
+                self._pending_writes = 0
+    
+    def entries(self, source_lang: str, target_lang: str) -> List[Tuple[str, str]]:
+        """Todas las traducciones guardadas de un par de idiomas como (texto normalizado, traducción)."""
+        with self._lock:
+            return self.conn.execute(
+                'SELECT source_text, target_text FROM translations WHERE source_lang = ? AND target_lang = ?',
+                (source_lang, target_lang)
+            ).fetchall()
+    
+    def evict(self) -> int:
+        """Elimina entradas demasiado antiguas y las menos usadas si se supera el tamaño máximo."""
+        removed = 0
+        if self.max_age_days is not None:
+            cutoff = time.time() - self.max_age_days * 86400
+            removed += self.conn.execute(
+                'DELETE FROM translations WHERE last_used_at < ?', (cutoff,)
+            ).rowcount
+        if self.max_entries is not None:
+            removed += self.conn.execute(
+                """DELETE FROM translations WHERE rowid IN (
+                       SELECT rowid FROM translations ORDER BY last_used_at DESC LIMIT -1 OFFSET ?
+                   )""", (self.max_entries,)
+            ).rowcount
+        return removed
+    
+    def flush(self):
+        """Registra los usos pendientes y confirma las escrituras acumuladas."""
+        with self._lock:
+            if self._touched:
+                self.conn.executemany(
+                    'UPDATE translations SET last_used_at = ? WHERE source_lang = ? AND target_lang = ? AND source_hash = ?',
+                    [(used_at,) + key for key, used_at in self._touched.items()]
+                )
+                self._touched.clear()
+            self.conn.commit()
+            self._pending_writes = 0
+    
+    def close(self):
+        """Registra los usos pendientes, aplica la política de expulsión y cierra la base de datos."""
+        self.flush()
+        with self._lock:
+            self.evict()
+            self.conn.commit()
+            self.conn.close()
+
+# Tokens ICU y en línea (se comparan enteros) o secuencias de dígitos
+FUZZY_TOKEN_PATTERN = re.compile(r'__(?:ICU_PLACEHOLDER|INLINE_(?:PLACEHOLDER|OPEN|CLOSE))_\d+__|\d+')
+# Puntuación y espacios al principio y al final de un texto ('#', llaves y comillas son sintaxis ICU)
+FUZZY_EDGES_PATTERN = re.compile(r"([^\w#{}']*)(.*?)([^\w#{}']*)", re.DOTALL)
+# Signos de apertura que solo usa el español: no se trasladan a la traducción
+FUZZY_SOURCE_ONLY_MARKS = str.maketrans('', '', '¿¡')
+
+def _fuzzy_numbers(text: str) -> List[str]:
+    """Secuencias de dígitos del texto, sin contar las de los tokens."""
+    return [match.group(0) for match in FUZZY_TOKEN_PATTERN.finditer(text) if not match.group(0).startswith('__')]
+
+def _fuzzy_shape(text: str) -> str:
+    """El texto con cada número sustituido por '0' (los tokens quedan intactos)."""
+    return FUZZY_TOKEN_PATTERN.sub(lambda match: match.group(0) if match.group(0).startswith('__') else '0', text)
+
+def _plural_class(number: str) -> Tuple[bool, bool, str]:
+    """
+    Forma gramatical que exige un número en los idiomas soportados: singular en
+    es/en (1), singular en fr (0 y 1) y one/few/many en ru (1, 21; 2-4, 22; 5-20...).
+    """
+    value = int(number)
+    if value % 10 == 1 and value % 100 != 11:
+        russian = 'one'
+    elif 2 <= value % 10 <= 4 and not 12 <= value % 100 <= 14:
+        russian = 'few'
+    else:
+        russian = 'many'
+    return value == 1, value <= 1, russian
+
+def fuzzy_key(text: str) -> str:
+    """Forma comparable de un texto: normalizado, en minúsculas y sin distinguir números."""
+    return _fuzzy_shape(TranslationMemory.normalize(text)).casefold()
+
+def adapt_fuzzy_match(text: str, source: str, target: str) -> Optional[str]:
+    """
+    Adapta la traducción de un texto casi idéntico cuando la única diferencia son
+    los números, la puntuación de los extremos o la mayúscula inicial, p. ej.
+    'Nuevos (7 días)' a partir de 'Nuevos (30 días)' -> 'Nouveaux (30 jours)'.
+    Los signos '¿' y '¡' no se trasladan, y un número solo se sustituye por otro
+    que exige la misma forma (singular o plural) en todos los idiomas.
+    Devuelve None si la diferencia no se puede trasladar con seguridad.
+    """
+    text_lead, text_core, text_trail = FUZZY_EDGES_PATTERN.fullmatch(text).groups()
+    source_lead, source_core, source_trail = FUZZY_EDGES_PATTERN.fullmatch(source).groups()
+    text_lead = text_lead.translate(FUZZY_SOURCE_ONLY_MARKS)
+    source_lead = source_lead.translate(FUZZY_SOURCE_ONLY_MARKS)
+    text_shape, source_shape = _fuzzy_shape(text_core), _fuzzy_shape(source_core)
+    # Fuera de los números solo puede cambiar la mayúscula de la primera letra
+    if not text_shape or text_shape[1:] != source_shape[1:] or text_shape[:1].casefold() != source_shape[:1].casefold():
+        return None
+    
+    adapted = target
+    text_numbers, source_numbers = _fuzzy_numbers(text_core), _fuzzy_numbers(source_core)
+    if text_numbers != source_numbers:
+        # Cada número del original debe cambiar siempre al mismo y aparecer igual en la traducción
+        replacements = {}
+        for old, new in zip(source_numbers, text_numbers):
+            if replacements.setdefault(old, new) != new or _plural_class(old) != _plural_class(new):
+                return None
+        if sorted(_fuzzy_numbers(target)) != sorted(source_numbers):
+            return None
+        adapted = FUZZY_TOKEN_PATTERN.sub(lambda match: replacements.get(match.group(0), match.group(0)), adapted)
+    
+    if text_lead != source_lead:
+        if not adapted.startswith(source_lead):
+            return None
+        adapted = text_lead + adapted[len(source_lead):].lstrip()
+    if text_trail != source_trail:
+        if not adapted.endswith(source_trail):
+            return None
+        adapted = adapted[:len(adapted) - len(source_trail)].rstrip() + text_trail
+    
+    if text_shape[:1] != source_shape[:1]:
+        letter = re.search(r'[^\W\d_]', adapted)
+        if letter is None:
+            return None
+        first = letter.group(0).upper() if text_shape[:1].isupper() else letter.group(0).lower()
+        adapted = adapted[:letter.start()] + first + adapted[letter.end():]
+    
+    if not adapted.strip() or not placeholders_preserved(text, adapted):
+        return None
+    return adapted
+
+class FuzzyMatch:
+    """Traducción conocida de un texto parecido, con su similitud y, si se pudo, la traducción adaptada."""
+    
+    __slots__ = ('source', 'target', 'similarity', 'adapted')
+    
+    def __init__(self, source: str, target: str, similarity: float, adapted: Optional[str] = None):
+        self.source = source
+        self.target = target
+        self.similarity = similarity
+        self.adapted = adapted
+
+class FuzzyIndex:
+    """
+    Memoria de traducción aproximada de un par de idiomas, en memoria.
+    
+    Los textos conocidos se indexan por n-gramas de caracteres (índice invertido)
+    y por su forma sin números ni puntuación de los extremos, que resuelve los casos
+    que se aplican directamente con un solo acceso a un diccionario. Para el resto
+    solo se consultan los n-gramas menos frecuentes del texto buscado, se verifican
+    los candidatos con más n-gramas en común y los mejores se reordenan por
+    distancia de edición (difflib).
+    """
+    
+    def __init__(self, ngram_size: int = FUZZY_NGRAM_SIZE):
+        self.ngram_size = ngram_size
+        self.sources: List[str] = []
+        self.targets: List[str] = []
+        # Texto original -> entrada, para que una traducción nueva reemplace a la anterior
+        self._entries: Dict[str, int] = {}
+        # N-grama -> entradas que lo contienen, y número de n-gramas de cada entrada
+        self._postings: Dict[str, array] = {}
+        self._sizes = array('I')
+        # Forma sin números, mayúscula inicial ni puntuación de los extremos -> entrada
+        self._shapes: Dict[str, int] = {}
+        self._lock = threading.Lock()
+    
+    def __len__(self) -> int:
+        return len(self.sources)
+    
+    def _ngrams(self, key: str) -> set:
+        padded = f' {key} '
+        size = self.ngram_size
+        return {padded[i:i + size] for i in range(len(padded) - size + 1)}
+    
+    @staticmethod
+    def _shape_key(key: str) -> str:
+        return FUZZY_EDGES_PATTERN.fullmatch(key).group(2)
+    
+    def add(self, source: str, target: str):
+        """Indexa (o actualiza) la traducción de un texto."""
+        if not target or target == source:
+            return
+        with self._lock:
+            entry = self._entries.get(source)
+            if entry is not None:
+                self.targets[entry] = target
+                return
+            entry = len(self.sources)
+            self._entries[source] = entry
+            self.sources.append(source)
+            self.targets.append(target)
+            key = fuzzy_key(source)
+            ngrams = self._ngrams(key)
+            self._sizes.append(len(ngrams))
+            for ngram in ngrams:
+                posting = self._postings.get(ngram)
+                if posting is None:
+                    posting = self._postings[ngram] = array('I')
+                posting.append(entry)
+            self._shapes[self._shape_key(key)] = entry
+    
+    def lookup(self, text: str, min_similarity: float = FUZZY_MIN_SIMILARITY) -> Optional[FuzzyMatch]:
+        """
+        Devuelve la traducción conocida más parecida con al menos min_similarity,
+        o None. Si solo difiere en números o puntuación, match.adapted es la
+        traducción ya adaptada al texto buscado.
+        """
+        key = fuzzy_key(text)
+        with self._lock:
+            entry = self._shapes.get(self._shape_key(key))
+            if entry is not None:
+                adapted = adapt_fuzzy_match(text, self.sources[entry], self.targets[entry])
+                if adapted is not None:
+                    return FuzzyMatch(self.sources[entry], self.targets[entry], 1.0, adapted)
+            
+            ngrams = self._ngrams(key)
+            if len(ngrams) < FUZZY_MIN_NGRAMS:
+                return None
+            # Candidatos de los n-gramas más raros: un texto parecido comparte la mayoría
+            # de los n-gramas, así que basta con una parte de ellos
+            counts = collections.Counter()
+            needed = len(ngrams) - int(min_similarity * len(ngrams)) + 1
+            postings = sorted((self._postings.get(ngram, ()) for ngram in ngrams), key=len)
+            visited = 0
+            for posting in postings[:needed]:
+                visited += len(posting)
+                if visited > FUZZY_MAX_POSTINGS and counts:
+                    break
+                counts.update(posting)
+            if not counts:
+                return None
+            
+            # Verificación con el coeficiente de Dice sobre todos los n-gramas, descartando
+            # antes por tamaño los que no pueden llegar a la similitud mínima
+            size = len(ngrams)
+            low, high = size * min_similarity / (2 - min_similarity), size * (2 - min_similarity) / min_similarity
+            scored = []
+            for entry, _ in counts.most_common(FUZZY_MAX_CANDIDATES):
+                if not low <= self._sizes[entry] <= high:
+                    continue
+                other = self._ngrams(fuzzy_key(self.sources[entry]))
+                scored.append((2 * len(ngrams & other) / (size + len(other)), entry))
+            
+            best = None
+            for _, entry in heapq.nlargest(FUZZY_RERANK, scored):
+                matcher = difflib.SequenceMatcher(None, key, fuzzy_key(self.sources[entry]), autojunk=False)
+                floor = best.similarity if best is not None else min_similarity
+                # Las cotas baratas de difflib descartan sin calcular la distancia completa
+                if matcher.real_quick_ratio() < floor or matcher.quick_ratio() < floor:
+                    continue
+                similarity = matcher.ratio()
+                if similarity >= floor:
+                    best = FuzzyMatch(self.sources[entry], self.targets[entry], similarity)
+            return best
+
+def parse_retry_after(value: Optional[str]) -> float:
+    """
+    Interpreta la cabecera Retry-After, que puede ser un número de segundos o
+    una fecha HTTP. Devuelve la espera en segundos.
+    """
+    if not value:
+        return RATE_LIMIT_DEFAULT_BACKOFF
+    value = value.strip()
+    if value.isdigit():
+        return float(value)
+    try:
+        retry_at = email.utils.parsedate_to_datetime(value)
+    except (TypeError, ValueError):
+        return RATE_LIMIT_DEFAULT_BACKOFF
+    return max(0.0, retry_at.timestamp() - time.time())
+
+class TokenBucket:
+    """
+    Limitador de peticiones tipo token bucket con adaptación automática.
+    
+    Los tokens se reponen de forma continua al ritmo actual hasta la ráfaga
+    máxima. Cada error reduce el ritmo a la mitad y cada éxito lo recupera
+    poco a poco hasta el valor configurado (AIMD). Un 429 además bloquea el
+    bucket hasta que vence el Retry-After.
+    """
+    
+    def __init__(self, rate: float, burst: int):
+        self.configured_rate = rate
+        self.rate = rate
+        self.min_rate = rate * 0.05
+        self.burst = max(1, burst)
+        self.tokens = float(self.burst)
+        self.blocked_until = 0.0
+        self.total_wait = 0.0
+        self._updated = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def _refill(self, now: float):
+        self.tokens = min(self.burst, self.tokens + (now - self._updated) * self.rate)
+        self._updated = now
+    
+    def acquire(self, deadline: Optional[float] = None) -> Optional[float]:
+        """
+        Espera hasta disponer de un token y lo consume. Devuelve los segundos
+        esperados, o None sin consumir nada si el token no llegaría antes de
+        deadline (time.monotonic()).
+        """
+        waited = 0.0
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self._refill(now)
+                if now < self.blocked_until:
+                    delay = self.blocked_until - now
+                elif self.tokens >= 1:
+                    self.tokens -= 1
+                    self.total_wait += waited
+                    return waited
+                else:
+                    delay = (1 - self.tokens) / self.rate
+            if deadline is not None and now + delay > deadline:
+                self.total_wait += waited
+                return None
+            time.sleep(delay)
+            waited += delay
+    
+    def on_success(self):
+        """Incremento aditivo del ritmo hasta el valor configurado."""
+        with self._lock:
+            self.rate = min(self.configured_rate, self.rate + self.configured_rate * 0.05)
+    
+    def on_error(self):
+        """Reducción multiplicativa del ritmo tras un error."""
+        with self._lock:
+            self._refill(time.monotonic())
+            self.rate = max(self.min_rate, self.rate * 0.5)
+    
+    def on_rate_limited(self, retry_after: float):
+        """Bloquea el bucket durante retry_after segundos y reduce el ritmo."""
+        with self._lock:
+            now = time.monotonic()
+            self._refill(now)
+            self.blocked_until = max(self.blocked_until, now + retry_after)
+            self.tokens = 0.0
+            self.rate = max(self.min_rate, self.rate * 0.5)
+
+class HttpStatusError(Exception):
+    """Respuesta HTTP con código de error (>= 400)."""
+    
+    def __init__(self, url: str, code: int, reason: str, headers: Dict[str, str]):
+        super().__init__(f"HTTP Error {code}: {reason}")
+        self.url = url
+        self.code = code
+        self.reason = reason
+        self.headers = headers
+
+class HttpTransport:
+    """
+    Capa HTTP compartida por todos los backends.
+    
+    Mantiene un pool de conexiones keep-alive por host (esquema, host, puerto) con
+    un tamaño máximo, de modo que la resolución DNS y los handshakes TCP/TLS se
+    pagan una vez por conexión y no una vez por petición. Opcionalmente pide las
+    respuestas comprimidas con gzip.
+    
+    Si se indica un observer, se le llama tras cada petición con
+    (url, código o None si no hubo respuesta, segundos, bytes enviados, bytes recibidos).
+    """
+    
+    # Errores típicos de una conexión keep-alive que el servidor ya cerró
+    STALE_CONNECTION_ERRORS = (http.client.RemoteDisconnected, ConnectionResetError, BrokenPipeError)
+    
+    def __init__(self, pool_size: int = HTTP_POOL_SIZE, use_gzip: bool = True,
+                 observer: Optional[Callable[[str, Optional[int], float, int, int], None]] = None):
+        self.pool_size = pool_size
+        self.use_gzip = use_gzip
+        self.observer = observer
+        self.connections_opened = 0
+        self._idle: Dict[Tuple[str, str, int], queue.LifoQueue] = {}
+        self._slots: Dict[Tuple[str, str, int], threading.BoundedSemaphore] = {}
+        self._lock = threading.Lock()
+    
+    def _pool(self, key: Tuple[str, str, int]) -> Tuple[queue.LifoQueue, threading.BoundedSemaphore]:
+        with self._lock:
+            if key not in self._idle:
+                self._idle[key] = queue.LifoQueue()
+                self._slots[key] = threading.BoundedSemaphore(self.pool_size)
+            return self._idle[key], self._slots[key]
+    
+    def _connect(self, key: Tuple[str, str, int], timeout: float) -> http.client.HTTPConnection:
+        scheme, host, port = key
+        connection_class = http.client.HTTPSConnection if scheme == 'https' else http.client.HTTPConnection
+        with self._lock:
+            self.connections_opened += 1
+        return connection_class(host, port, timeout=timeout)
+    
+    def request(self, method: str, url: str, body: Optional[bytes] = None,
+                headers: Optional[Dict[str, str]] = None, timeout: float = 10) -> bytes:
+        """
+        Hace una petición reutilizando una conexión del pool del host y devuelve el
+        cuerpo de la respuesta. Lanza HttpStatusError si el código es >= 400.
+        """
+        parts = urllib.parse.urlsplit(url)
+        port = parts.port or (443 if parts.scheme == 'https' else 80)
+        key = (parts.scheme, parts.hostname, port)
+        path = parts.path or '/'
+        if parts.query:
+            path += '?' + parts.query
+        
+        request_headers = dict(headers or {})
+        request_headers.setdefault('Connection', 'keep-alive')
+        if self.use_gzip:
+            request_headers.setdefault('Accept-Encoding', 'gzip')
+        
+        # Bytes enviados: línea de petición y cuerpo (sin cabeceras)
+        bytes_sent = len(method) + len(path) + len(body or b'')
+        started = time.monotonic()
+        idle, slots = self._pool(key)
+        try:
+            with slots:
+                try:
+                    connection, reused = idle.get_nowait(), True
+                except queue.Empty:
+                    connection, reused = self._connect(key, timeout), False
+                
+                while True:
+                    try:
+                        connection.timeout = timeout
+                        if connection.sock is not None:
+                            connection.sock.settimeout(timeout)
+                        connection.request(method, path, body=body, headers=request_headers)
+                        response = connection.getresponse()
+                        data = response.read()
+                        break
+                    except self.STALE_CONNECTION_ERRORS:
+                        connection.close()
+                        # Una conexión reutilizada pudo ser cerrada por el servidor: reintentar una vez
+                        if not reused:
+                            raise
+                        connection, reused = self._connect(key, timeout), False
+                    except BaseException:
+                        connection.close()
+                        raise
+                
+                if response.will_close:
+                    connection.close()
+                else:
+                    idle.put(connection)
+        except Exception:
+            self._observe(url, None, started, bytes_sent, 0)
+            raise
+        
+        self._observe(url, response.status, started, bytes_sent, len(data))
+        response_headers = {name.title(): value for name, value in response.getheaders()}
+        if response_headers.get('Content-Encoding', '').lower() == 'gzip':
+            data = gzip.decompress(data)
+        if response.status >= 400:
+            raise HttpStatusError(url, response.status, response.reason, response_headers)
+        return data
+    
+    def _observe(self, url: str, status: Optional[int], started: float, bytes_sent: int, bytes_received: int):
+        if self.observer is not None:
+            self.observer(url, status, time.monotonic() - started, bytes_sent, bytes_received)
+    
+    def close(self):
+        """Cierra todas las conexiones inactivas."""
+        with self._lock:
+            pools = list(self._idle.values())
+        for idle in pools:
+            while True:
+                try:
+                    idle.get_nowait().close()
+                except queue.Empty:
+                    break
+
+class RunTracer:
+    """
+    Trazas de una ejecución en formato Chrome trace-event (JSON), para abrirlas en
+    Perfetto (ui.perfetto.dev) o chrome://tracing.
+    
+    Cada span es un evento completo ('ph': 'X') con el hilo que lo ejecutó: las
+    fases (parse, mask, translate, write, bundle), cada lote o segmento enviado,
+    cada petición HTTP y cada espera en el token bucket o en la cola de reintentos.
+    """
+    
+    def __init__(self):
+        self.events: List[Dict] = []
+        self.pid = os.getpid()
+        self._origin = time.monotonic()
+        self._threads: Dict[int, str] = {}
+        self._lock = threading.Lock()
+    
+    def add(self, name: str, category: str, started: float, seconds: float, **args):
+        """Registra un span que empezó en 'started' (time.monotonic) y duró 'seconds'."""
+        thread_id = threading.get_ident()
+        event = {
+            'name': name, 'cat': category, 'ph': 'X', 'pid': self.pid, 'tid': thread_id,
+            'ts': round((started - self._origin) * 1e6, 1), 'dur': round(seconds * 1e6, 1),
+        }
+        if args:
+            event['args'] = args
+        with self._lock:
+            self.events.append(event)
+            if thread_id not in self._threads:
+                self._threads[thread_id] = threading.current_thread().name
+    
+    @contextlib.contextmanager
+    def span(self, name: str, category: str, **args):
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            self.add(name, category, started, time.monotonic() - started, **args)
+    
+    def to_chrome_trace(self) -> Dict:
+        with self._lock:
+            metadata = [{'name': 'process_name', 'ph': 'M', 'pid': self.pid, 'args': {'name': 'auto_translate_complete'}}]
+            metadata.extend(
+                {'name': 'thread_name', 'ph': 'M', 'pid': self.pid, 'tid': thread_id, 'args': {'name': name}}
+                for thread_id, name in self._threads.items()
+            )
+            return {'traceEvents': metadata + sorted(self.events, key=lambda event: event['ts']),
+                    'displayTimeUnit': 'ms'}
+    
+    def write(self, file_path: str):
+        directory = os.path.dirname(os.path.abspath(file_path))
+        os.makedirs(directory, exist_ok=True)
+        _write_text_atomic(file_path, json.dumps(self.to_chrome_trace(), ensure_ascii=False, separators=(',', ':')))
+        print(f"🧭 Trace: {file_path} ({len(self.events)} spans; open it in https://ui.perfetto.dev)")
+
+class RunMetrics:
+    """
+    Métricas de una ejecución, compartidas por todos los hilos del traductor.
+    
+    Por backend registra un histograma de latencia, los códigos de estado, los
+    bytes enviados y recibidos, el tiempo de espera en el token bucket y los
+    reintentos; además los aciertos y fallos de cada caché y el tiempo de cada
+    fase (parse, mask, translate, write). Se exporta como informe JSON y como
+    textfile de Prometheus. Con un tracer, las fases, las peticiones y las
+    esperas se registran además como spans.
+    """
+    
+    def __init__(self, buckets: Tuple[float, ...] = METRICS_LATENCY_BUCKETS, tracer: Optional[RunTracer] = None):
+        self.buckets = tuple(sorted(buckets))
+        self.tracer = tracer
+        self.started = time.time()
+        # backend -> [recuentos por bucket (el último es +Inf), suma de segundos]
+        self.latency: Dict[str, list] = {}
+        self.statuses: Dict[Tuple[str, str], int] = {}
+        self.bytes: Dict[Tuple[str, str], int] = {}
+        self.rate_limit_wait: Dict[str, float] = {}
+        self.cache: Dict[Tuple[str, str], int] = {}
+        self.retries: Dict[Tuple[str, str], int] = {}
+        self.stages: Dict[str, float] = {}
+        self._lock = threading.Lock()
+    
+    @staticmethod
+    def _add(counter: Dict, key, amount=1):
+        counter[key] = counter.get(key, 0) + amount
+    
+    def observe_request(self, backend: str, status: Optional[int], seconds: float,
+                        bytes_sent: int, bytes_received: int):
+        """Registra una petición HTTP; status es None si no hubo respuesta (timeout, conexión)."""
+        if self.tracer is not None:
+            self.tracer.add(f'{backend} request', 'http', time.monotonic() - seconds, seconds,
+                            status=status, bytes_sent=bytes_sent, bytes_received=bytes_received)
+        with self._lock:
+            histogram = self.latency.setdefault(backend, [[0] * (len(self.buckets) + 1), 0.0])
+            histogram[0][bisect.bisect_left(self.buckets, seconds)] += 1
+            histogram[1] += seconds
+            self._add(self.statuses, (backend, str(status) if status is not None else 'error'))
+            self._add(self.bytes, (backend, 'sent'), bytes_sent)
+            self._add(self.bytes, (backend, 'received'), bytes_received)
+    
+    def add_wait(self, backend: str, seconds: float):
+        """Tiempo que una petición esperó turno en el token bucket del backend."""
+        if self.tracer is not None and seconds > 0:
+            self.tracer.add('rate limit wait', 'throttle', time.monotonic() - seconds, seconds, backend=backend)
+        with self._lock:
+            self._add(self.rate_limit_wait, backend, seconds)
+    
+    def count_cache(self, cache: str, hit: bool):
+        with self._lock:
+            self._add(self.cache, (cache, 'hit' if hit else 'miss'))
+    
+    def count_retry(self, backend: str, reason: str, count: int = 1):
+        """Segmentos que se vuelven a pedir: lote dividido, línea desalineada o paso al siguiente backend."""
+        if count:
+            with self._lock:
+                self._add(self.retries, (backend, reason), count)
+    
+    def span(self, name: str, category: str, **args):
+        """Span de la traza (si hay tracer) alrededor de un bloque."""
+        if self.tracer is None:
+            return contextlib.nullcontext()
+        return self.tracer.span(name, category, **args)
+    
+    @contextlib.contextmanager
+    def stage(self, name: str):
+        """Acumula el tiempo de una fase; con varios idiomas en paralelo se suman los de cada hilo."""
+        started = time.monotonic()
+        try:
+            yield
+        finally:
+            elapsed = time.monotonic() - started
+            if self.tracer is not None:
+                self.tracer.add(name, 'stage', started, elapsed)
+            with self._lock:
+                self._add(self.stages, name, elapsed)
+    
+    def report(self, languages: Dict[str, Dict[str, int]]) -> Dict:
+        """Informe JSON de la ejecución con los recuentos por idioma de _write_translated_catalog."""
+        with self._lock:
+            backends = {}
+            for backend in sorted({backend for backend, _ in self.statuses} | set(self.rate_limit_wait)):
+                counts, total_seconds = self.latency.get(backend, [[0] * (len(self.buckets) + 1), 0.0])
+                requests = sum(counts)
+                cumulative = [sum(counts[:i + 1]) for i in range(len(counts))]
+                backends[backend] = {
+                    'requests': requests,
+                    'status_codes': {status: n for (name, status), n in sorted(self.statuses.items()) if name == backend},
+                    'bytes_sent': self.bytes.get((backend, 'sent'), 0),
+                    'bytes_received': self.bytes.get((backend, 'received'), 0),
+                    'latency_seconds': {
+                        'count': requests,
+                        'sum': total_seconds,
+                        'mean': total_seconds / requests if requests else None,
+                        'buckets': dict(zip([f'{bound:g}' for bound in self.buckets] + ['+Inf'], cumulative)),
+                    },
+                    'rate_limit_wait_seconds': self.rate_limit_wait.get(backend, 0.0),
+                    'retries': {reason: n for (name, reason), n in sorted(self.retries.items()) if name == backend},
+                }
+            caches = {}
+            for (cache, result), n in sorted(self.cache.items()):
+                caches.setdefault(cache, {'hit': 0, 'miss': 0})[result] = n
+            return {
+                'generated_at': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+                'duration_seconds': time.time() - self.started,
+                'languages': languages,
+                'stages_seconds': dict(self.stages),
+                'backends': backends,
+                'caches': caches,
+            }
+    
+    def to_prometheus(self, languages: Dict[str, Dict[str, int]]) -> str:
+        """Textfile de Prometheus (formato de exposición de texto) con las métricas de la ejecución."""
+        report = self.report(languages)
+        lines = []
+        
+        def family(name: str, kind: str, help_text: str, samples: List[Tuple[Dict[str, str], float]]):
+            lines.append(f'# HELP {METRICS_PREFIX}_{name} {help_text}')
+            lines.append(f'# TYPE {METRICS_PREFIX}_{name} {kind}')
+            for labels, value in samples:
+                lines.append(f'{METRICS_PREFIX}_{name}{_prometheus_labels(labels)} {value:.9g}')
+        
+        backends = report['backends']
+        lines.append(f'# HELP {METRICS_PREFIX}_request_duration_seconds Latency of translation requests.')
+        lines.append(f'# TYPE {METRICS_PREFIX}_request_duration_seconds histogram')
+        for backend, data in backends.items():
+            latency = data['latency_seconds']
+            for bound, count in latency['buckets'].items():
+                lines.append(f'{METRICS_PREFIX}_request_duration_seconds_bucket'
+                             f'{_prometheus_labels({"backend": backend, "le": bound})} {count}')
+            lines.append(f'{METRICS_PREFIX}_request_duration_seconds_sum{_prometheus_labels({"backend": backend})} {latency["sum"]:.9g}')
+            lines.append(f'{METRICS_PREFIX}_request_duration_seconds_count{_prometheus_labels({"backend": backend})} {latency["count"]}')
+        family('requests', 'gauge', 'Translation requests in the last run by HTTP status.', [
+            ({'backend': backend, 'status': status}, n)
+            for backend, data in backends.items() for status, n in data['status_codes'].items()
+        ])
+        family('bytes', 'gauge', 'Bytes sent and received in the last run.', [
+            ({'backend': backend, 'direction': direction}, data[f'bytes_{direction}'])
+            for backend, data in backends.items() for direction in ('sent', 'received')
+        ])
+        family('rate_limit_wait_seconds', 'gauge', 'Time spent waiting for the rate limiter in the last run.', [
+            ({'backend': backend}, data['rate_limit_wait_seconds']) for backend, data in backends.items()
+        ])
+        family('retries', 'gauge', 'Segments requested again in the last run.', [
+            ({'backend': backend, 'reason': reason}, n)
+            for backend, data in backends.items() for reason, n in data['retries'].items()
+        ])
+        family('cache_lookups', 'gauge', 'Cache lookups in the last run.', [
+            ({'cache': cache, 'result': result}, n)
+            for cache, results in report['caches'].items() for result, n in results.items()
+        ])
+        family('stage_seconds', 'gauge', 'Time spent in each stage of the last run.', [
+            ({'stage': stage}, seconds) for stage, seconds in report['stages_seconds'].items()
+        ])
+        family('units', 'gauge', 'Translation units in the last run.', [
+            ({'language': lang, 'state': state}, n)
+            for lang, counts in languages.items() for state, n in counts.items()
+        ])
+        family('run_duration_seconds', 'gauge', 'Duration of the last run.', [({}, report['duration_seconds'])])
+        family('last_run_timestamp_seconds', 'gauge', 'Unix time when the last run finished.', [({}, time.time())])
+        return '\n'.join(lines) + '\n'
+
+def _prometheus_labels(labels: Dict[str, str]) -> str:
+    """Etiquetas {nombre="valor",...} con los valores escapados según el formato de texto."""
+    if not labels:
+        return ''
+    def escape(value) -> str:
+        return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+    return '{' + ','.join(f'{name}="{escape(value)}"' for name, value in labels.items()) + '}'
+
+class BackendHealth:
+    """Resultados recientes, latencia media y estado del circuit breaker de un backend."""
+    
+    CLOSED = 'closed'
+    OPEN = 'open'
+    HALF_OPEN = 'half-open'
+    
+    def __init__(self, window: int = ROUTER_WINDOW):
+        self.outcomes = collections.deque(maxlen=window)
+        self.latencies = collections.deque(maxlen=window)
+        self.latency: Optional[float] = None
+        self.state = self.CLOSED
+        self.consecutive_failures = 0
+        self.opened_at = 0.0
+        self.reset_timeout = ROUTER_RESET_TIMEOUT
+        self.trips = 0
+    
+    @property
+    def success_rate(self) -> float:
+        if not self.outcomes:
+            return 1.0
+        return sum(self.outcomes) / len(self.outcomes)
+    
+    def cost(self) -> float:
+        """Tiempo esperado para obtener una respuesta válida (latencia / tasa de éxito)."""
+        latency = self.latency if self.latency is not None else ROUTER_DEFAULT_LATENCY
+        return latency / max(self.success_rate, 0.05)
+
+class BackendRouter:
+    """
+    Ordena los backends según su salud reciente en lugar de un orden fijo.
+    
+    Cada llamada registra éxito o fallo y su latencia. Un backend que acumula
+    fallos abre su circuit breaker y deja de recibir tráfico; un hilo en segundo
+    plano lo sondea periódicamente y lo vuelve a cerrar en cuanto responde. El
+    orden de preferencia original solo se altera cuando otro backend es
+    claramente más rápido o fiable.
+    """
+    
+    def __init__(self, backends: List[str], probe: Callable[[str], None],
+                 failure_threshold: int = ROUTER_FAILURE_THRESHOLD,
+                 min_success_rate: float = ROUTER_MIN_SUCCESS_RATE):
+        self.backends = list(backends)
+        self.health = {backend: BackendHealth() for backend in self.backends}
+        self.failure_threshold = failure_threshold
+        self.min_success_rate = min_success_rate
+        self._probe = probe
+        self._lock = threading.Lock()
+        self._stop = threading.Event()
+        self._prober: Optional[threading.Thread] = None
+    
+    def order(self) -> List[str]:
+        """Backends con el circuito cerrado, del más al menos saludable."""
+        with self._lock:
+            available = [backend for backend in self.backends if self.health[backend].state == BackendHealth.CLOSED]
+            return sorted(available, key=lambda backend: self.health[backend].cost()
+                          * (1 + ROUTER_PREFERENCE_WEIGHT * self.backends.index(backend)))
+    
+    def latency_percentile(self, backend: str, percentile: float) -> Optional[float]:
+        """Percentil de las latencias recientes con éxito, o None si hay pocas muestras."""
+        with self._lock:
+            samples = sorted(self.health[backend].latencies)
+        if len(samples) < HEDGE_MIN_SAMPLES:
+            return None
+        return samples[min(len(samples) - 1, int(percentile * len(samples)))]
+    
+    def is_available(self, backend: str) -> bool:
+        return self.health[backend].state == BackendHealth.CLOSED
+    
+    def record(self, backend: str, ok: bool, latency: float):
+        """Registra el resultado de una llamada y abre o cierra el circuito si corresponde."""
+        health = self.health.get(backend)
+        if health is None:
+            return
+        tripped = False
+        with self._lock:
+            health.outcomes.append(ok)
+            if health.latency is None:
+                health.latency = latency
+            else:
+                health.latency += ROUTER_LATENCY_ALPHA * (latency - health.latency)
+            if ok:
+                health.latencies.append(latency)
+                health.consecutive_failures = 0
+                if health.state != BackendHealth.CLOSED:
+                    # Empezar de cero: los fallos previos a la caída ya no describen al backend
+                    health.state = BackendHealth.CLOSED
+                    health.reset_timeout = ROUTER_RESET_TIMEOUT
+                    health.outcomes.clear()
+                    health.outcomes.append(True)
+                    health.latencies.clear()
+                    health.latencies.append(latency)
+                    health.latency = latency
+                    print(f"✅ {backend} recovered, routing traffic to it again")
+                return
+            health.consecutive_failures += 1
+            if health.state == BackendHealth.HALF_OPEN:
+                # El sondeo falló: seguir abierto y esperar más antes del siguiente
+                health.state = BackendHealth.OPEN
+                health.opened_at = time.monotonic()
+                health.reset_timeout = min(ROUTER_MAX_RESET_TIMEOUT, health.reset_timeout * 2)
+            elif health.state == BackendHealth.CLOSED and self._should_trip(health):
+                health.state = BackendHealth.OPEN
+                health.opened_at = time.monotonic()
+                health.trips += 1
+                tripped = True
+        if tripped:
+            print(f"⚠️ {backend} circuit opened after repeated failures; probing in background")
+            self._ensure_prober()
+    
+    def _should_trip(self, health: BackendHealth) -> bool:
+        if health.consecutive_failures >= self.failure_threshold:
+            return True
+        return len(health.outcomes) >= ROUTER_MIN_SAMPLES and health.success_rate < self.min_success_rate
+    
+    def _ensure_prober(self):
+        with self._lock:
+            if self._prober is not None or self._stop.is_set():
+                return
+            self._prober = threading.Thread(target=self._probe_loop, name='backend-prober', daemon=True)
+            self._prober.start()
+    
+    def _probe_loop(self):
+        """Sondea los backends abiertos hasta que todos vuelven a estar cerrados."""
+        while True:
+            with self._lock:
+                opened = [health for health in self.health.values() if health.state != BackendHealth.CLOSED]
+                if not opened or self._stop.is_set():
+                    self._prober = None
+                    return
+                now = time.monotonic()
+                due = []
+                for backend, health in self.health.items():
+                    if health.state == BackendHealth.OPEN and now - health.opened_at >= health.reset_timeout:
+                        health.state = BackendHealth.HALF_OPEN
+                        due.append(backend)
+                wait = min(max(0.1, health.opened_at + health.reset_timeout - now) for health in opened)
+            for backend in due:
+                try:
+                    self._probe(backend)
+                except Exception:
+                    pass
+                with self._lock:
+                    health = self.health[backend]
+                    if health.state == BackendHealth.HALF_OPEN:
+                        # El sondeo no llegó a registrar un éxito
+                        health.state = BackendHealth.OPEN
+                        health.opened_at = time.monotonic()
+                        health.reset_timeout = min(ROUTER_MAX_RESET_TIMEOUT, health.reset_timeout * 2)
+            if self._stop.wait(wait if not due else 0.1):
+                with self._lock:
+                    self._prober = None
+                return
+    
+    def summary(self) -> List[str]:
+        """Una línea por backend con su estado, tasa de éxito y latencia media."""
+        lines = []
+        with self._lock:
+            for backend in self.backends:
+                health = self.health[backend]
+                latency = f"{health.latency * 1000:.0f} ms" if health.latency is not None else "n/a"
+                lines.append(f"{backend}: {health.state}, {health.success_rate * 100:.0f}% ok "
+                             f"over {len(health.outcomes)} calls, {latency}, {health.trips} trips")
+        return lines
+    
+    def close(self):
+        """Detiene el hilo de sondeo."""
+        self._stop.set()
+
+class PreparedBatch:
+    """
+    Resultado de la fase de planificación de un lote para un idioma: traducciones
+    ya conocidas, segmentos únicos pendientes (ordenados de mayor a menor) con las
+    unidades que los usan, y los mensajes ICU o textos largos que se reconstruyen
+    a partir de sus hojas.
+    """
+    
+    def __init__(self, texts: List[str], target_lang: str, source_lang: str):
+        self.texts = texts
+        self.target_lang = target_lang
+        self.source_lang = source_lang
+        self.results = list(texts)
+        self.cached = 0
+        self.resumed = 0
+        # Textos resueltos adaptando una traducción casi idéntica, y parecidos propuestos para revisar
+        self.fuzzy = 0
+        self.proposals: Dict[str, FuzzyMatch] = {}
+        # Texto normalizado -> [(índice de la unidad o None si es una hoja, texto limpio)]
+        self.pending: Dict[str, List[Tuple[Optional[int], str]]] = {}
+        # Texto normalizado -> prioridad de la primera unidad que lo usa (menor = antes)
+        self.ranks: Dict[str, Tuple] = {}
+        # Unidades que se reconstruyen a partir de hojas (mensajes ICU o textos largos)
+        self.messages: Dict[int, Union[IcuMessage, SegmentedText]] = {}
+        # Hojas ya conocidas o planificadas, y hojas largas divididas en frases
+        self.leaf_translations: Dict[str, str] = {}
+        self.planned_leaves = set()
+        self.split_leaves: Dict[str, SegmentedText] = {}
+        # Unidades que siguieron fallando tras agotar sus reintentos diferidos, y
+        # unidades que no llegaron a enviarse a ningún backend por el límite de tiempo
+        self.failed_units = set()
+        self.skipped_units = set()
+    
+    @property
+    def pending_units(self) -> int:
+        return sum(len(units) for units in self.pending.values())
+    
+    def units_using(self, segments: List[str]) -> set:
+        """Índices de las unidades que dependen de alguno de los segmentos (directamente o por sus hojas)."""
+        units = set()
+        leaves = set()
+        for segment in segments:
+            for index, clean_text in self.pending.get(segment, ()):
+                if index is None:
+                    leaves.add(clean_text)
+                else:
+                    units.add(index)
+        # Una hoja larga dividida en frases falla si falla alguna de sus frases
+        leaves.update(leaf for leaf, segmented in self.split_leaves.items() if leaves.intersection(segmented.leaves))
+        units.update(index for index, message in self.messages.items() if leaves.intersection(message.leaves))
+        return units
+
+class RetryQueue:
+    """
+    Cola de reintentos diferidos de segmentos.
+    
+    Cada segmento que falla en todos los backends espera su propio backoff
+    exponencial con jitter antes del siguiente intento, de modo que un fallo no
+    detiene al resto: se sigue con los demás segmentos y la cola se vacía en
+    pasadas posteriores. Tras max_attempts reintentos el segmento se da por perdido.
+    """
+    
+    def __init__(self, base_delay: float = RETRY_BASE_DELAY, max_delay: float = RETRY_MAX_DELAY,
+                 max_attempts: int = RETRY_MAX_ATTEMPTS):
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        self.max_attempts = max_attempts
+        # (momento del próximo intento, orden de llegada, segmento, intento)
+        self._heap: List[Tuple[float, int, str, int]] = []
+        self._arrivals = 0
+    
+    def __len__(self) -> int:
+        return len(self._heap)
+    
+    def defer(self, segment: str, attempt: int = 1) -> bool:
+        """Programa el intento número 'attempt'. Devuelve False si ya no quedan intentos."""
+        if attempt > self.max_attempts:
+            return False
+        delay = min(self.max_delay, self.base_delay * 2 ** (attempt - 1)) * random.uniform(0.5, 1.0)
+        heapq.heappush(self._heap, (time.monotonic() + delay, self._arrivals, segment, attempt))
+        self._arrivals += 1
+        return True
+    
+    def next_ready_at(self) -> Optional[float]:
+        return self._heap[0][0] if self._heap else None
+    
+    def pop_ready(self, now: float) -> List[Tuple[str, int]]:
+        """Saca los segmentos cuyo backoff ya venció, como (segmento, intento)."""
+        ready = []
+        while self._heap and self._heap[0][0] <= now:
+            _, _, segment, attempt = heapq.heappop(self._heap)
+            ready.append((segment, attempt))
+        return ready
+    
+    def drain(self) -> List[str]:
+        """Vacía la cola y devuelve los segmentos que quedaban."""
+        segments = [segment for _, _, segment, _ in sorted(self._heap)]
+        self._heap = []
+        return segments
+
+class AutomaticTranslator:
+    """
+    Traductor completamente automático que toma todos los textos del archivo XLIFF
+    y los traduce usando APIs gratuitas sin necesidad de diccionarios predefinidos.
+    """
+    
+    def __init__(self, translation_memory: Optional[TranslationMemory] = None, batch_mode: bool = True,
+                 concurrency: Optional[Dict[str, int]] = None,
+                 rate_limits: Optional[Dict[str, Tuple[float, int]]] = None,
+                 transport: Optional[HttpTransport] = None, base_urls: Optional[Dict[str, str]] = None,
+                 metrics: Optional[RunMetrics] = None, priority: Optional['UnitPriority'] = None,
+                 time_budget: Optional[float] = None, hedge: bool = False,
+                 hedge_percentile: float = HEDGE_PERCENTILE, hedge_max_ratio: float = HEDGE_MAX_RATIO,
+                 fuzzy: bool = True, glossary: Union[Glossary, bool, None] = None):
+        self.translation_cache = {}
+        self._mask_cache: Dict[str, IcuMessage] = {}
+        self.translation_memory = translation_memory
+        self.batch_mode = batch_mode
+        # Términos que no se envían a los backends: texto -> texto enmascarado (común a todos los idiomas).
+        # Sin glosario se usa el de por defecto (Glossary.default); con glossary=False, ninguno
+        if glossary is None:
+            glossary = Glossary.default()
+        self.glossary = glossary if glossary else None
+        self._glossary_masks: Dict[str, str] = {}
+        # Memoria aproximada por par de idiomas, construida al primer uso
+        self.fuzzy = fuzzy
+        self._fuzzy_indexes: Dict[Tuple[str, str], FuzzyIndex] = {}
+        # Archivos de idioma ya incorporados al índice (lo que se escribe después ya está en él)
+        self._fuzzy_seeded = set()
+        # Métricas de la ejecución (latencia, estados, bytes, cachés, fases)
+        self.metrics = metrics if metrics is not None else RunMetrics()
+        # Conexiones HTTP compartidas por todos los backends
+        self.transport = transport if transport is not None else HttpTransport(observer=self._observe_http)
+        self.base_urls = dict(BACKEND_BASE_URLS)
+        if base_urls:
+            self.base_urls.update({backend: url.rstrip('/') for backend, url in base_urls.items()})
+        
+        # Límite de peticiones en vuelo por backend
+        self.concurrency = dict(BACKEND_CONCURRENCY)
+        if concurrency:
+            self.concurrency.update(concurrency)
+        self._backend_slots = {
+            backend: threading.BoundedSemaphore(max(1, limit)) for backend, limit in self.concurrency.items()
+        }
+        
+        # Un token bucket por backend: (peticiones por segundo, ráfaga)
+        configured_rates = dict(BACKEND_RATE_LIMITS)
+        if rate_limits:
+            configured_rates.update(rate_limits)
+        self.rate_limiters = {
+            backend: TokenBucket(rate, burst) for backend, (rate, burst) in configured_rates.items()
+        }
+        
+        # Orden de las unidades y plazo de la ejecución: al agotarse no sale ninguna
+        # petición más y las unidades que faltan quedan pendientes
+        self.priority = priority
+        self.deadline = time.monotonic() + time_budget if time_budget is not None else None
+        self.budget_exhausted = False
+        
+        # Orden de backends según su salud, con circuit breaker por backend
+        self.router = BackendRouter(['google', 'mymemory', 'libretranslate'], self._probe_backend)
+        
+        # Peticiones de respaldo (hedging) a un segundo backend, desactivadas por defecto
+        self.hedge = hedge
+        self.hedge_percentile = hedge_percentile
+        self.hedge_max_ratio = hedge_max_ratio
+        self.hedge_stats = {'requests': 0, 'hedged': 0, 'won': 0}
+        self._hedge_lock = threading.Lock()
+        
+        # Reintentos diferidos: segmentos enviados, reintentos hechos, recuperados y perdidos
+        self.retry_stats = {'segments': 0, 'deferred': 0, 'retried': 0, 'recovered': 0, 'gave_up': 0}
+        self._retry_lock = threading.Lock()
+        # Se activa al cerrar el traductor e interrumpe la espera de los backoffs
+        self._closed = threading.Event()
+        self._hedge_pool: Optional[ThreadPoolExecutor] = None
+    
+    def start_run(self):
+        """
+        Empieza una nueva ejecución con el mismo traductor (modo watch): las métricas,
+        las estadísticas de reintentos y hedging y los contadores de la memoria de
+        traducción vuelven a cero, así que los informes reflejan solo esa ejecución.
+        Las cachés, la memoria aproximada y las conexiones se conservan.
+        """
+        self.metrics = RunMetrics(self.metrics.buckets, tracer=self.metrics.tracer)
+        with self._hedge_lock:
+            self.hedge_stats = dict.fromkeys(self.hedge_stats, 0)
+        with self._retry_lock:
+            self.retry_stats = dict.fromkeys(self.retry_stats, 0)
+        if self.translation_memory is not None:
+            self.translation_memory.hits = self.translation_memory.misses = 0
+    
+    def close(self):
+        """Cierra las conexiones HTTP abiertas. La memoria de traducción la cierra quien la creó."""
+        self._closed.set()
+        self.router.close()
+        if self._hedge_pool is not None:
+            self._hedge_pool.shutdown(wait=False)
+        self.transport.close()
+    
+    def _observe_http(self, url: str, status: Optional[int], seconds: float, bytes_sent: int, bytes_received: int):
+        """Observer de HttpTransport: atribuye cada petición a su backend por la URL base."""
+        backend = next((name for name, base_url in self.base_urls.items() if url.startswith(base_url)), 'other')
+        self.metrics.observe_request(backend, status, seconds, bytes_sent, bytes_received)
+    
+    def _out_of_time(self) -> bool:
+        """Indica si se agotó el tiempo de la ejecución (y lo recuerda para el resumen)."""
+        if self.deadline is not None and time.monotonic() >= self.deadline:
+            self.budget_exhausted = True
+        return self.budget_exhausted
+    
+    def _store_translation(self, clean_text: str, translated: str, target_lang: str,
+                           source_lang: str, backend: str):
+        """Guarda una traducción en la caché del proceso y en la memoria persistente."""
+        self.translation_cache[f"{source_lang}_{target_lang}_{clean_text}"] = translated
+        if self.translation_memory is not None:
+            self.translation_memory.put(clean_text, translated, source_lang, target_lang, backend,
+                                        self._glossary_variant(clean_text, target_lang))
+        fuzzy_index = self._fuzzy_indexes.get((source_lang, target_lang))
+        if fuzzy_index is not None:
+            fuzzy_index.add(clean_text, translated)
+    
+    def fuzzy_index(self, target_lang: str, source_lang: str = 'es') -> FuzzyIndex:
+        """
+        Índice aproximado de un par de idiomas. Se construye la primera vez con lo
+        que guarda la memoria de traducción de ejecuciones anteriores y después
+        incorpora cada traducción nueva.
+        """
+        fuzzy_index = self._fuzzy_indexes.get((source_lang, target_lang))
+        if fuzzy_index is None:
+            fuzzy_index = FuzzyIndex()
+            if self.translation_memory is not None:
+                for source_text, target_text in self.translation_memory.entries(source_lang, target_lang):
+                    fuzzy_index.add(source_text, target_text)
+            self._fuzzy_indexes[(source_lang, target_lang)] = fuzzy_index
+        return fuzzy_index
+    
+    def _mask(self, clean_text: str) -> IcuMessage:
+        """
+        Compila las expresiones ICU del texto. El resultado no depende del idioma
+        destino, así que se calcula una vez y se reutiliza entre idiomas.
+        """
+        message = self._mask_cache.get(clean_text)
+        self.metrics.count_cache('mask', message is not None)
+        if message is None:
+            message = parse_icu_message(clean_text)
+            self._mask_cache[clean_text] = message
+        return message
+    
+    def _protect(self, segment: str) -> str:
+        """Enmascara los términos del glosario de un segmento antes de enviarlo a un backend."""
+        if self.glossary is None:
+            return segment
+        masked = self._glossary_masks.get(segment)
+        if masked is None:
+            masked = self._glossary_masks[segment] = self.glossary.mask(segment)
+        return masked
+    
+    def _unprotect(self, translated: str, target_lang: str) -> str:
+        """Restaura en la traducción los términos del glosario (o su traducción forzada)."""
+        return self.glossary.restore(translated, target_lang) if self.glossary is not None else translated
+    
+    def _glossary_variant(self, clean_text: str, target_lang: str) -> str:
+        """Variante de la memoria de traducción para un texto: la huella de sus términos del glosario."""
+        if self.glossary is None:
+            return ''
+        return self.glossary.fingerprint(self._protect(clean_text), target_lang)
+    
+    @staticmethod
+    def _needs_backend(masked: str) -> bool:
+        """Si a un segmento con términos del glosario le queda alguna letra fuera de los tokens."""
+        core = GLOSSARY_TOKEN_PATTERN.sub('', INLINE_TOKEN_PATTERN.sub('', ICU_TOKEN_PATTERN.sub('', masked)))
+        return re.search(r'[^\W\d_]', core) is not None
+    
+    def is_glossary_only(self, clean_text: str) -> bool:
+        """
+        Si el texto está formado solo por términos del glosario: su traducción es el
+        propio término (o su traducción forzada) y se da por traducido aunque
+        coincida con el original.
+        """
+        masked = self._protect(clean_text)
+        return masked != clean_text and not self._needs_backend(masked)
+    
+    @staticmethod
+    def _segment(clean_text: str) -> Optional[SegmentedText]:
+        """
+        Divide en frases un texto que tiene más de una o que no cabe en
+        SEGMENT_MAX_BYTES; None si se traduce entero. Cada frase se guarda por
+        separado, así que al editar una sola frase solo se vuelve a pedir esa.
+        """
+        if len(clean_text.encode('utf-8')) <= SEGMENT_MAX_BYTES and not SENTENCE_SEPARATOR.search(clean_text):
+            return None
+        segmented = SegmentedText(clean_text)
+        return segmented if segmented.is_split else None
+    
+    def _lookup_translation(self, clean_text: str, target_lang: str, source_lang: str) -> Optional[str]:
+        """Busca una traducción en la caché del proceso y luego en la memoria persistente."""
+        cache_key = f"{source_lang}_{target_lang}_{clean_text}"
+        in_process = cache_key in self.translation_cache
+        self.metrics.count_cache('process', in_process)
+        if in_process:
+            return self.translation_cache[cache_key]
+        
+        # Verificar en la memoria de traducción persistente antes de cualquier petición HTTP
+        if self.translation_memory is not None:
+            remembered = self.translation_memory.get(clean_text, source_lang, target_lang,
+                                                     self._glossary_variant(clean_text, target_lang))
+            self.metrics.count_cache('translation_memory', remembered is not None)
+            if remembered is not None:
+                self.translation_cache[cache_key] = remembered
+                return remembered
+        return None
+    
+    def _call_backend(self, translate_func: Callable[[str, str, str], Optional[str]], backend: str,
+                      text: str, target_lang: str, source_lang: str,
+                      sent: Optional[threading.Event] = None,
+                      cancelled: Optional[threading.Event] = None) -> Optional[str]:
+        """
+        Llama a un backend respetando su límite de peticiones simultáneas y su
+        token bucket. Los errores HTTP 429 bloquean el backend durante el tiempo
+        indicado por Retry-After; cualquier error reduce su ritmo de peticiones.
+        
+        Para el hedging, 'sent' se activa cuando la petición sale (o no llega a
+        salir) y 'cancelled' permite descartarla si aún espera turno. Con el
+        tiempo de la ejecución agotado (o si el turno llegaría tarde) no se envía.
+        """
+        limiter = self.rate_limiters[backend]
+        try:
+            with self._backend_slots[backend]:
+                if (cancelled is not None and cancelled.is_set()) or self._out_of_time():
+                    return None
+                waited = limiter.acquire(self.deadline)
+                if waited is None:
+                    self.budget_exhausted = True
+                    return None
+                self.metrics.add_wait(backend, waited)
+                if cancelled is not None and cancelled.is_set():
+                    return None
+                if sent is not None:
+                    sent.set()
+                return self._send(translate_func, backend, limiter, text, target_lang, source_lang)
+        finally:
+            if sent is not None:
+                sent.set()
+    
+    def _send(self, translate_func: Callable[[str, str, str], Optional[str]], backend: str, limiter: TokenBucket,
+              text: str, target_lang: str, source_lang: str) -> Optional[str]:
+        """Ejecuta la petición y comunica el resultado al token bucket y al router."""
+        started = time.monotonic()
+        try:
+            translated = translate_func(text, target_lang, source_lang)
+        except HttpStatusError as e:
+            if e.code == 429:
+                # Limitado pero sano: lo gestiona el token bucket, no el circuit breaker
+                limiter.on_rate_limited(parse_retry_after(e.headers.get('Retry-After')))
+            else:
+                limiter.on_error()
+                self.router.record(backend, False, time.monotonic() - started)
+            raise
+        except Exception:
+            limiter.on_error()
+            self.router.record(backend, False, time.monotonic() - started)
+            raise
+        limiter.on_success()
+        self.router.record(backend, True, time.monotonic() - started)
+        return translated
+    
+    def _request(self, translate_func: Callable[[str, str, str], Optional[str]], backend: str,
+                 text: str, target_lang: str, source_lang: str) -> Tuple[Optional[str], str]:
+        """
+        Envía un texto (o un lote) al backend indicado. Con hedging activo, si la
+        respuesta tarda más que el percentil configurado de su latencia reciente,
+        el mismo texto se envía también al siguiente backend sano y gana la primera
+        respuesta válida. Devuelve (traducción, backend que respondió).
+        
+        El perdedor se cancela si aún no ha salido; si ya está en vuelo, su
+        respuesta se descarta (la conexión vuelve al pool al terminar).
+        """
+        if not self.hedge:
+            return self._call_backend(translate_func, backend, text, target_lang, source_lang), backend
+        with self._hedge_lock:
+            self.hedge_stats['requests'] += 1
+        delay = self.router.latency_percentile(backend, self.hedge_percentile)
+        secondary = self._hedge_target(backend, text)
+        if delay is None or secondary is None:
+            return self._call_backend(translate_func, backend, text, target_lang, source_lang), backend
+        
+        pool = self._get_hedge_pool()
+        sent, cancel_primary = threading.Event(), threading.Event()
+        primary = pool.submit(self._call_backend, translate_func, backend, text, target_lang, source_lang,
+                              sent, cancel_primary)
+        # El plazo cuenta desde que la petición sale, no desde que espera turno en el limitador
+        sent.wait()
+        done, _ = wait([primary], timeout=delay)
+        if done or not self._take_hedge_budget():
+            return primary.result(), backend
+        
+        cancel_secondary = threading.Event()
+        hedge = pool.submit(self._call_backend, self._backend_function(secondary), secondary, text,
+                            target_lang, source_lang, None, cancel_secondary)
+        contenders = {primary: (backend, cancel_primary), hedge: (secondary, cancel_secondary)}
+        fallback: Optional[Tuple[str, str]] = None
+        error: Optional[Exception] = None
+        pending = set(contenders)
+        while pending:
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+            for future in done:
+                try:
+                    translated = future.result()
+                except Exception as e:
+                    error = error or e
+                    continue
+                answered_by = contenders[future][0]
+                if self._is_valid_answer(text, translated):
+                    for loser in pending:
+                        contenders[loser][1].set()
+                    if future is hedge:
+                        with self._hedge_lock:
+                            self.hedge_stats['won'] += 1
+                    return translated, answered_by
+                if translated and fallback is None:
+                    fallback = (translated, answered_by)
+        if fallback is not None:
+            return fallback
+        if error is not None:
+            raise error
+        return None, backend
+    
+    def _get_hedge_pool(self) -> ThreadPoolExecutor:
+        with self._hedge_lock:
+            if self._hedge_pool is None:
+                # Hilos suficientes para todas las peticiones en vuelo más sus respaldos
+                workers = 2 * sum(max(1, limit) for limit in self.concurrency.values()) + 4
+                self._hedge_pool = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='hedge')
+            return self._hedge_pool
+    
+    def _hedge_target(self, backend: str, text: str) -> Optional[str]:
+        """Siguiente backend sano que admite el tamaño del texto."""
+        size = len(text.encode('utf-8'))
+        for candidate in self.router.order():
+            if candidate != backend and size <= BACKEND_PAYLOAD_LIMITS[candidate]:
+                return candidate
+        return None
+    
+    def _take_hedge_budget(self) -> bool:
+        """Reserva una petición extra si no se supera la fracción permitida."""
+        with self._hedge_lock:
+            allowed = HEDGE_BURST + self.hedge_max_ratio * self.hedge_stats['requests']
+            if self.hedge_stats['hedged'] >= allowed:
+                return False
+            self.hedge_stats['hedged'] += 1
+            return True
+    
+    @staticmethod
+    def _is_valid_answer(text: str, translated: Optional[str]) -> bool:
+        """Respuesta no vacía, distinta del original, con el mismo número de líneas y de tokens."""
+        if not translated or not translated.strip() or translated.strip() == text.strip():
+            return False
+        if sorted(INLINE_TOKEN_PATTERN.findall(text)) != sorted(INLINE_TOKEN_PATTERN.findall(translated)):
+            return False
+        if sorted(ICU_TOKEN_PATTERN.findall(text)) != sorted(ICU_TOKEN_PATTERN.findall(translated)):
+            return False
+        if sorted(GLOSSARY_TOKEN_PATTERN.findall(text)) != sorted(GLOSSARY_TOKEN_PATTERN.findall(translated)):
+            return False
+        return translated.replace('\r\n', '\n').count(BATCH_DELIMITER) == text.count(BATCH_DELIMITER)
+    
+    def _probe_backend(self, backend: str):
+        """Petición mínima a un backend abierto; el resultado lo registra _call_backend."""
+        self._call_backend(self._backend_function(backend), backend, ROUTER_PROBE_TEXT, 'en', 'es')
+    
+    def translate_text(self, text: str, target_lang: str, source_lang: str = 'es') -> str:
+        """
+        Traduce un texto automáticamente usando múltiples APIs como fallback.
+        Preserva expresiones ICU y entidades HTML.
+        """
+        # Limpiar y validar texto
+        clean_text = text.strip()
+        if not clean_text or len(clean_text) < 2:
+            return text
+        
+        # Compilar las expresiones ICU; si no queda texto traducible, devolver el original
+        message = self._mask(clean_text)
+        if not message.leaves:
+            return text
+        
+        if not message.is_plain:
+            # Solo se traducen las hojas de cada caso plural/select, todas en un lote;
+            # las que no se pudieron traducir se dejan en el idioma original
+            translations = {
+                leaf: translated
+                for leaf, translated in zip(message.leaves, self.translate_batch(message.leaves, target_lang, source_lang))
+                if translated != leaf
+            }
+            return message.render(translations) if translations else text
+        
+        # Verificar en caché y en la memoria de traducción
+        cached = self._lookup_translation(clean_text, target_lang, source_lang)
+        if cached is not None:
+            return cached
+        
+        # Textos de varias frases o muy largos: se traducen por frases en un mismo lote
+        segmented = self._segment(clean_text)
+        if segmented is not None:
+            translations = {
+                leaf: translated
+                for leaf, translated in zip(segmented.leaves, self.translate_batch(segmented.leaves, target_lang, source_lang))
+                if translated != leaf or self.is_glossary_only(leaf)
+            }
+            if not translations:
+                return text
+            translated_full = segmented.render(translations)
+            if len(translations) == len(segmented.leaves):
+                self._store_translation(clean_text, translated_full, target_lang, source_lang, 'segmented')
+            return translated_full
+        
+        # Los términos del glosario viajan como tokens; si no queda nada más, no hay petición
+        text_to_translate = self._protect(clean_text)
+        if self.is_glossary_only(clean_text):
+            translated = self._unprotect(text_to_translate, target_lang)
+            self._store_translation(clean_text, translated, target_lang, source_lang, 'glossary')
+            return translated
+        
+        # Intentar los backends del más al menos saludable
+        translated = None
+        for translate_func, backend in self._services():
+            try:
+                with self.metrics.span('segment', 'translate', backend=backend, target_lang=target_lang):
+                    translated, answered_by = self._request(translate_func, backend, text_to_translate, target_lang, source_lang)
+                if translated and not placeholders_preserved(text_to_translate, translated):
+                    print(f"{BACKEND_NAMES[backend]} returned damaged placeholders, trying next backend")
+                    continue
+                if translated and translated != text_to_translate:
+                    translated = self._unprotect(translated, target_lang)
+                    self._store_translation(clean_text, translated, target_lang, source_lang, answered_by)
+                    return translated
+            except Exception as e:
+                print(f"{BACKEND_NAMES[backend]} failed: {e}")
+        
+        # Si todo falla, devolver el texto original; los lotes (translate_prepared)
+        # reintentan después estos segmentos desde su cola de reintentos diferidos
+        return text  # Devolvemos el texto original completo con las expresiones ICU intactas
+    
+    def translate_batch(self, texts: List[str], target_lang: str, source_lang: str = 'es') -> List[str]:
+        """
+        Traduce una lista de textos agrupando varios segmentos en cada petición.
+        
+        Los textos se enmascaran igual que en translate_text, se deduplican y se
+        empaquetan hasta el límite de carga útil de cada backend. Solo los segmentos
+        cuya respuesta llega desalineada se vuelven a pedir de forma individual.
+        Devuelve las traducciones en el mismo orden; los textos que no se pudieron
+        traducir se devuelven sin cambios. Sin modo por lotes (batch_mode=False),
+        cada segmento único se pide por separado.
+        """
+        return self.translate_prepared(self.prepare_batch(texts, target_lang, source_lang))
+    
+    def prepare_batch(self, texts: List[str], target_lang: str, source_lang: str = 'es',
+                      resumed: Optional[Dict[int, str]] = None, ranks: Optional[List[Tuple]] = None) -> 'PreparedBatch':
+        """
+        Fase de planificación de translate_batch, sin ninguna petición de red:
+        resuelve lo que ya está en caché o en la memoria de traducción, enmascara
+        y normaliza el resto y agrupa las unidades por segmento único. Las unidades
+        de 'resumed' (índice -> traducción recuperada del diario) no se planifican.
+        Con 'ranks' (prioridad de cada texto, menor = antes) los segmentos de las
+        unidades prioritarias se envían primero.
+        """
+        batch = PreparedBatch(texts, target_lang, source_lang)
+        order = sorted(range(len(texts)), key=ranks.__getitem__) if ranks else range(len(texts))
+        
+        for index in order:
+            text = texts[index]
+            rank = ranks[index] if ranks else ()
+            if resumed and index in resumed:
+                batch.results[index] = resumed[index]
+                batch.resumed += 1
+                continue
+            clean_text = text.strip()
+            if not clean_text or len(clean_text) < 2:
+                continue
+            
+            message = self._mask(clean_text)
+            if not message.leaves:
+                continue
+            
+            if not message.is_plain:
+                # Mensaje ICU: se planifican sus hojas, compartidas con el resto del lote
+                batch.messages[index] = message
+                for leaf in message.leaves:
+                    self._plan_text(batch, None, leaf, rank)
+                continue
+            self._plan_text(batch, index, clean_text, rank)
+        
+        # Por prioridad y, dentro de cada nivel, de mayor a menor: el empaquetado voraz
+        # llena mejor cada petición
+        batch.pending = dict(sorted(
+            batch.pending.items(), key=lambda item: (batch.ranks[item[0]], -len(item[0].encode('utf-8')))
+        ))
+        return batch
+    
+    def _plan_text(self, batch: 'PreparedBatch', index: Optional[int], clean_text: str, rank: Tuple = ()):
+        """
+        Resuelve desde caché o memoria de traducción, o encola para traducir, un
+        texto del lote: una unidad (index) o una hoja (None). Los textos de varias
+        frases o largos se dividen en frases, que se planifican como hojas. Como las
+        unidades se planifican por prioridad, cada segmento conserva la de la
+        primera unidad que lo usa.
+        """
+        if index is None:
+            if clean_text in batch.leaf_translations or clean_text in batch.planned_leaves:
+                return
+            batch.planned_leaves.add(clean_text)
+        
+        cached = self._lookup_translation(clean_text, batch.target_lang, batch.source_lang)
+        if cached is not None:
+            if index is None:
+                batch.leaf_translations[clean_text] = cached
+            else:
+                batch.results[index] = cached
+            batch.cached += 1
+            return
+        
+        # Los textos de varias frases o muy largos se traducen por frases
+        segmented = self._segment(clean_text)
+        if segmented is not None:
+            if index is None:
+                batch.split_leaves[clean_text] = segmented
+            else:
+                batch.messages[index] = segmented
+            for leaf in segmented.leaves:
+                self._plan_text(batch, None, leaf, rank)
+            return
+        
+        # Un texto formado solo por términos del glosario se resuelve sin petición
+        if self.is_glossary_only(clean_text):
+            translated = self._unprotect(self._protect(clean_text), batch.target_lang)
+            self._store_translation(clean_text, translated, batch.target_lang, batch.source_lang, 'glossary')
+            if index is None:
+                batch.leaf_translations[clean_text] = translated
+            else:
+                batch.results[index] = translated
+            batch.cached += 1
+            return
+        
+        # Un texto casi idéntico a otro ya traducido (solo cambian números o puntuación)
+        # reutiliza esa traducción; si solo se parece, se propone y se traduce igualmente.
+        # Los textos con términos del glosario no: la traducción parecida puede ser
+        # anterior a que se protegiera el término
+        if self.fuzzy and self._protect(clean_text) == clean_text:
+            match = self.fuzzy_index(batch.target_lang, batch.source_lang).lookup(clean_text)
+            self.metrics.count_cache('fuzzy', match is not None and match.adapted is not None)
+            if match is not None and match.adapted is not None:
+                self._store_translation(clean_text, match.adapted, batch.target_lang, batch.source_lang, 'fuzzy')
+                if index is None:
+                    batch.leaf_translations[clean_text] = match.adapted
+                else:
+                    batch.results[index] = match.adapted
+                batch.fuzzy += 1
+                return
+            if match is not None:
+                batch.proposals[clean_text] = match
+        
+        # Textos que solo difieren en espacios o en la forma Unicode comparten petición
+        segment = TranslationMemory.normalize(clean_text)
+        batch.ranks.setdefault(segment, rank)
+        batch.pending.setdefault(segment, []).append((index, clean_text))
+    
+    def translate_prepared(self, batch: 'PreparedBatch',
+                           on_translated: Optional[Callable[[int, str], None]] = None) -> List[str]:
+        """
+        Ejecuta un lote ya planificado con prepare_batch y devuelve las traducciones.
+        Si se indica on_translated, se le llama con (índice, traducción) en cuanto
+        cada unidad queda traducida, posiblemente desde varios hilos.
+        """
+        texts, target_lang, source_lang = batch.texts, batch.target_lang, batch.source_lang
+        results = list(batch.results)
+        
+        def deliver(partial: Dict[str, Tuple[str, Optional[str]]]):
+            for segment, (translated, _) in partial.items():
+                for index, _ in batch.pending.get(segment, ()):
+                    if index is not None:
+                        on_translated(index, translated)
+        
+        leaf_translations = dict(batch.leaf_translations)
+        on_resolved = deliver if on_translated is not None else None
+        # Segmentos para los que algún backend devolvió el mismo texto: no se reintentan
+        unchanged = set()
+        # Segmentos que llegaron a algún backend (el resto los saltó el límite de tiempo)
+        attempted = set()
+        resolved: Dict[str, Tuple[str, Optional[str]]] = {}
+        
+        def translate(segment: str) -> str:
+            if self._out_of_time():
+                return segment
+            attempted.add(segment)
+            return self.translate_text(segment, target_lang, source_lang)
+        
+        # La primera pasada va por rondas; los segmentos que fallan en todos los backends
+        # pasan a la cola de reintentos diferidos, que se atiende entre ronda y ronda
+        with self._retry_lock:
+            self.retry_stats['segments'] += len(batch.pending)
+        retry_queue = RetryQueue()
+        gave_up: List[str] = []
+        with ThreadPoolExecutor(max_workers=max(self.concurrency.values())) as pool:
+            for segments in self._first_pass_rounds(list(batch.pending)):
+                if self._out_of_time():
+                    break
+                if self.batch_mode:
+                    resolved.update(self._translate_segments(segments, target_lang, source_lang, on_resolved,
+                                                             unchanged=unchanged, attempted=attempted))
+                else:
+                    # Sin modo por lotes: una petición por segmento único (translate_text ya lo guarda);
+                    # los semáforos por backend limitan cuántas peticiones quedan en vuelo
+                    for segment, translated in zip(segments, pool.map(translate, segments)):
+                        if translated != segment:
+                            resolved[segment] = (translated, None)
+                            if on_translated is not None:
+                                deliver({segment: (translated, None)})
+                
+                failed = [segment for segment in segments if segment not in resolved and segment not in unchanged]
+                if failed and not self._out_of_time():
+                    for segment in failed:
+                        retry_queue.defer(segment)
+                    with self._retry_lock:
+                        self.retry_stats['deferred'] += len(failed)
+                self._retry_ready(retry_queue, resolved, target_lang, source_lang, on_resolved, gave_up)
+        self._retry_deferred(retry_queue, resolved, target_lang, source_lang, on_resolved, gave_up)
+        batch.failed_units = batch.units_using(gave_up)
+        if self.budget_exhausted:
+            failed = [segment for segment in batch.pending if segment not in resolved and segment not in unchanged]
+            batch.skipped_units = batch.units_using([segment for segment in failed if segment not in attempted])
+        
+        for segment, units in batch.pending.items():
+            if segment not in resolved:
+                continue
+            translated, backend = resolved[segment]
+            for index, clean_text in units:
+                if backend is not None or clean_text != segment:
+                    self._store_translation(clean_text, translated, target_lang, source_lang, backend or 'single')
+                if index is None:
+                    leaf_translations[clean_text] = translated
+                else:
+                    results[index] = translated
+        
+        # Las hojas largas (dentro de mensajes ICU) se reconstruyen primero a partir de sus frases
+        for leaf, segmented in batch.split_leaves.items():
+            self._render_segmented(segmented, leaf, leaf_translations, target_lang, source_lang)
+        
+        # Los mensajes ICU y los textos largos se reconstruyen con las hojas traducidas;
+        # si ninguna se tradujo, la unidad queda sin traducir
+        for index, message in batch.messages.items():
+            if isinstance(message, SegmentedText):
+                translated = self._render_segmented(message, texts[index].strip(), leaf_translations,
+                                                    target_lang, source_lang)
+                if translated is None:
+                    continue
+                results[index] = translated
+            elif any(leaf in leaf_translations for leaf in message.leaves):
+                results[index] = message.render(leaf_translations)
+            else:
+                continue
+            if on_translated is not None:
+                on_translated(index, results[index])
+        
+        return results
+    
+    def _render_segmented(self, segmented: SegmentedText, clean_text: str, leaf_translations: Dict[str, str],
+                          target_lang: str, source_lang: str) -> Optional[str]:
+        """
+        Reconstruye un texto dividido en frases. Solo se guarda entero en la memoria
+        de traducción si se tradujeron todas sus frases.
+        """
+        translated = [leaf for leaf in segmented.leaves if leaf in leaf_translations]
+        if not translated:
+            return None
+        result = segmented.render(leaf_translations)
+        if len(translated) == len(segmented.leaves):
+            self._store_translation(clean_text, result, target_lang, source_lang, 'segmented')
+        leaf_translations[clean_text] = result
+        return result
+    
+    def _first_pass_rounds(self, segments: List[str]) -> List[List[str]]:
+        """
+        Divide los segmentos de la primera pasada en rondas de tantas peticiones
+        como admite a la vez el backend preferido, para que la cola de reintentos
+        diferidos se revise entre una ronda y la siguiente.
+        """
+        order = self.router.order()
+        if not order:
+            return [segments] if segments else []
+        if not self.batch_mode:
+            slots = max(self.concurrency.values())
+            return [segments[start:start + slots] for start in range(0, len(segments), slots)]
+        slots = max(1, self.concurrency[order[0]])
+        batches = self._pack_batches(segments, BACKEND_PAYLOAD_LIMITS[order[0]])
+        return [[segment for batch in batches[start:start + slots] for segment in batch]
+                for start in range(0, len(batches), slots)]
+    
+    def _retry_ready(self, retry_queue: RetryQueue, resolved: Dict[str, Tuple[str, Optional[str]]],
+                     target_lang: str, source_lang: str,
+                     on_resolved: Optional[Callable[[Dict[str, Tuple[str, str]]], None]], gave_up: List[str]) -> bool:
+        """
+        Reintenta, sin esperar, los segmentos de la cola cuyo backoff ya venció,
+        empezando por un backend distinto en cada intento, y añade a 'resolved' los
+        que se recuperan. Los que agotan sus intentos (o el presupuesto global de
+        reintentos) se añaden a 'gave_up'. Devuelve False si el presupuesto se agotó.
+        """
+        ready = retry_queue.pop_ready(time.monotonic())
+        if not ready:
+            return True
+        if not self.router.order():
+            # Todos los circuitos abiertos: el intento se pierde pero no gasta presupuesto
+            gave_up.extend(segment for segment, attempt in ready if not retry_queue.defer(segment, attempt + 1))
+            return True
+        granted = self._take_retry_budget(len(ready))
+        if granted < len(ready):
+            # Presupuesto global de reintentos agotado: lo que queda se da por perdido
+            gave_up.extend(segment for segment, _ in ready[granted:])
+            gave_up.extend(retry_queue.drain())
+            ready = ready[:granted]
+        if not ready:
+            return False
+        print(f"🔁 Retrying {len(ready)} failed segments...")
+        
+        max_segments = BATCH_MAX_SEGMENTS if self.batch_mode else 1
+        attempts: Dict[int, List[str]] = {}
+        for segment, attempt in ready:
+            attempts.setdefault(attempt, []).append(segment)
+        unchanged = set()
+        for attempt, group in attempts.items():
+            recovered = self._translate_segments(group, target_lang, source_lang, on_resolved, rotation=attempt,
+                                                 max_segments=max_segments, unchanged=unchanged)
+            resolved.update(recovered)
+            with self._retry_lock:
+                self.retry_stats['recovered'] += len(recovered)
+        
+        for segment, attempt in ready:
+            if segment in resolved or segment in unchanged:
+                continue
+            if not retry_queue.defer(segment, attempt + 1):
+                gave_up.append(segment)
+        return True
+    
+    def _retry_deferred(self, retry_queue: RetryQueue, resolved: Dict[str, Tuple[str, Optional[str]]],
+                        target_lang: str, source_lang: str,
+                        on_resolved: Optional[Callable[[Dict[str, Tuple[str, str]]], None]], gave_up: List[str]):
+        """
+        Vacía la cola de reintentos al terminar la primera pasada: reintenta lo que
+        está listo y, si no queda nada listo, espera al siguiente backoff en tramos
+        de como mucho RETRY_MAX_WAIT segundos. Se detiene al agotarse el tiempo de la
+        ejecución o al cerrarse el traductor; lo que quede en la cola no cuenta como
+        perdido (ver _retry_ready).
+        """
+        while retry_queue and not self._out_of_time() and not self._closed.is_set():
+            wake_at = retry_queue.next_ready_at()
+            now = time.monotonic()
+            if wake_at > now:
+                if self.deadline is not None and wake_at > self.deadline:
+                    break
+                with self.metrics.span('retry backoff', 'throttle', queued=len(retry_queue)):
+                    self._closed.wait(min(RETRY_MAX_WAIT, wake_at - now))
+                continue
+            if not self._retry_ready(retry_queue, resolved, target_lang, source_lang, on_resolved, gave_up):
+                break
+        
+        with self._retry_lock:
+            self.retry_stats['gave_up'] += len(gave_up)
+    
+    def _take_retry_budget(self, count: int) -> int:
+        """Reserva hasta 'count' reintentos sin superar la fracción global permitida."""
+        with self._retry_lock:
+            allowed = int(RETRY_BURST + RETRY_MAX_RATIO * self.retry_stats['segments']) - self.retry_stats['retried']
+            granted = max(0, min(count, allowed))
+            self.retry_stats['retried'] += granted
+            return granted
+    
+    def estimate_requests(self, batch: 'PreparedBatch', backend: str) -> int:
+        """Peticiones necesarias si un solo backend atendiera todo el lote."""
+        return len(self._pack_batches(list(batch.pending), BACKEND_PAYLOAD_LIMITS[backend]))
+    
+    def estimate_seconds(self, backend: str, requests: int) -> float:
+        """
+        Tiempo aproximado para enviar 'requests' peticiones a un backend: el mayor
+        entre el límite del token bucket y la concurrencia por la latencia media.
+        """
+        if not requests:
+            return 0.0
+        limiter = self.rate_limiters[backend]
+        rate_bound = max(0, requests - limiter.burst) / limiter.configured_rate
+        latency = self.router.health[backend].latency or ROUTER_DEFAULT_LATENCY
+        concurrency_bound = -(-requests // max(1, self.concurrency[backend])) * latency
+        return max(rate_bound, concurrency_bound)
+    
+    def _backend_function(self, backend: str) -> Callable[[str, str, str], Optional[str]]:
+        return getattr(self, f'_translate_with_{backend}')
+    
+    def _services(self) -> List[Tuple[Callable[[str, str, str], Optional[str]], str]]:
+        """Backends de traducción disponibles, ordenados por el router según su salud."""
+        return [(self._backend_function(backend), backend) for backend in self.router.order()]
+    
+    def _translate_segments(self, segments: List[str], target_lang: str, source_lang: str,
+                            on_resolved: Optional[Callable[[Dict[str, Tuple[str, str]]], None]] = None,
+                            rotation: int = 0, max_segments: int = BATCH_MAX_SEGMENTS,
+                            unchanged: Optional[set] = None, attempted: Optional[set] = None
+                            ) -> Dict[str, Tuple[str, str]]:
+        """
+        Traduce segmentos enmascarados por lotes probando cada backend en el orden
+        que indica el router (desplazado 'rotation' posiciones en los reintentos);
+        los backends con el circuito abierto se omiten. Los lotes de un mismo
+        backend se envían en paralelo hasta su límite de concurrencia. Devuelve un
+        diccionario segmento -> (traducción, backend); on_resolved recibe los
+        resultados de cada lote en cuanto llegan, 'unchanged' acumula los segmentos
+        que algún backend devolvió sin traducir y 'attempted' los que llegaron a
+        enviarse a algún backend.
+        """
+        resolved: Dict[str, Tuple[str, str]] = {}
+        remaining = segments
+        
+        services = self._services()
+        if rotation and services:
+            services = services[rotation % len(services):] + services[:rotation % len(services)]
+        for position, (translate_func, backend) in enumerate(services):
+            if not remaining or self._out_of_time():
+                break
+            batches = self._pack_batches(remaining, BACKEND_PAYLOAD_LIMITS[backend], max_segments)
+            with ThreadPoolExecutor(max_workers=max(1, self.concurrency[backend])) as pool:
+                # Cada lote escribe en un diccionario propio; se combinan en orden al final
+                partials = list(pool.map(
+                    lambda batch: self._deliver(
+                        self._translate_batch_with(translate_func, backend, batch, target_lang, source_lang, {},
+                                                   unchanged, attempted),
+                        on_resolved
+                    ),
+                    batches
+                ))
+            for partial in partials:
+                resolved.update(partial)
+            remaining = [segment for segment in remaining if segment not in resolved]
+            if position + 1 < len(services) and not self._out_of_time():
+                self.metrics.count_retry(backend, 'fallback', len(remaining))
+        
+        return resolved
+    
+    @staticmethod
+    def _deliver(partial: Dict[str, Tuple[str, str]],
+                 on_resolved: Optional[Callable[[Dict[str, Tuple[str, str]]], None]]) -> Dict[str, Tuple[str, str]]:
+        if on_resolved is not None and partial:
+            on_resolved(partial)
+        return partial
+    
+    @staticmethod
+    def _pack_batches(segments: List[str], payload_limit: int, max_segments: int = BATCH_MAX_SEGMENTS) -> List[List[str]]:
+        """Agrupa segmentos de forma voraz sin superar el límite de carga útil del backend."""
+        batches = []
+        current: List[str] = []
+        current_size = 0
+        for segment in segments:
+            size = len(segment.encode('utf-8')) + len(BATCH_DELIMITER)
+            if current and (current_size + size > payload_limit or len(current) >= max_segments):
+                batches.append(current)
+                current, current_size = [], 0
+            current.append(segment)
+            current_size += size
+        if current:
+            batches.append(current)
+        return batches
+    
+    def _translate_batch_with(self, translate_func, backend: str, batch: List[str], target_lang: str,
+                              source_lang: str, resolved: Dict[str, Tuple[str, str]],
+                              unchanged: Optional[set] = None, attempted: Optional[set] = None
+                              ) -> Dict[str, Tuple[str, str]]:
+        """
+        Envía un lote a un backend y reparte la respuesta entre sus segmentos.
+        Si el número de líneas no coincide, el lote se divide en dos mitades hasta
+        llegar a peticiones individuales. Devuelve el diccionario de resultados.
+        Los segmentos del lote se añaden a 'attempted' salvo que la petición no
+        llegue a salir porque se agotó el tiempo.
+        """
+        # Si el circuito se abrió mientras tanto, los segmentos quedan para el siguiente backend;
+        # si se acabó el tiempo, quedan pendientes
+        if not self.router.is_available(backend) or self._out_of_time():
+            return resolved
+        masked = [self._protect(segment) for segment in batch]
+        payload = BATCH_DELIMITER.join(masked)
+        try:
+            with self.metrics.span('batch', 'translate', backend=backend, target_lang=target_lang,
+                                   segments=len(batch), bytes=len(payload.encode('utf-8'))):
+                translated, answered_by = self._request(translate_func, backend, payload, target_lang, source_lang)
+        except Exception as e:
+            print(f"{backend} batch failed: {e}")
+            if attempted is not None:
+                attempted.update(batch)
+            return resolved
+        # Sin respuesta con el tiempo agotado: la petición no llegó a enviarse
+        if attempted is not None and (translated or not self.budget_exhausted):
+            attempted.update(batch)
+        if not translated:
+            return resolved
+        
+        if len(batch) == 1:
+            parts = [translated]
+        else:
+            parts = translated.replace('\r\n', '\n').split(BATCH_DELIMITER)
+            if len(parts) != len(batch):
+                self.metrics.count_retry(backend, 'split', len(batch))
+                middle = len(batch) // 2
+                self._translate_batch_with(translate_func, backend, batch[:middle], target_lang, source_lang, resolved,
+                                           unchanged, attempted)
+                self._translate_batch_with(translate_func, backend, batch[middle:], target_lang, source_lang, resolved,
+                                           unchanged, attempted)
+                return resolved
+        
+        misaligned = []
+        for segment, sent, part in zip(batch, masked, parts):
+            part = part.strip()
+            # Igual al original: se deja para el siguiente backend, como en translate_text
+            if part == sent:
+                if unchanged is not None:
+                    unchanged.add(segment)
+                continue
+            # Placeholders o términos perdidos, duplicados o desordenados, o respuesta vacía:
+            # la línea no corresponde al segmento (o el backend la estropeó) y se pide por separado
+            if not part or not placeholders_preserved(sent, part):
+                misaligned.append(segment)
+                continue
+            resolved[segment] = (self._unprotect(part, target_lang), answered_by)
+        
+        if len(batch) > 1:
+            self.metrics.count_retry(backend, 'misaligned', len(misaligned))
+            for segment in misaligned:
+                self._translate_batch_with(translate_func, backend, [segment], target_lang, source_lang, resolved,
+                                           unchanged, attempted)
+        return resolved
+    
+    def _translate_with_google(self, text: str, target_lang: str, source_lang: str) -> Optional[str]:
+        """Traduce usando Google Translate API gratuita."""
+        # Codificar texto para URL
+        encoded_text = urllib.parse.quote(text)
+        
+        # Construir URL
+        url = f"{self.base_urls['google']}/translate_a/single?client=gtx&sl={source_lang}&tl={target_lang}&dt=t&q={encoded_text}"
+        
+        # Hacer petición
+        response = self.transport.request('GET', url, headers={
+            'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
+        }, timeout=10)
+        result = json.loads(response.decode())
+        
+        if result and len(result) > 0 and result[0] and len(result[0]) > 0:
+            # Google divide la respuesta en oraciones; hay que unirlas todas
+            return ''.join(chunk[0] for chunk in result[0] if chunk and chunk[0])
+        
+        return None
+    
+    def _translate_with_mymemory(self, text: str, target_lang: str, source_lang: str) -> Optional[str]:
+        """Traduce usando MyMemory API (gratuita)."""
+        # MyMemory usa códigos de idioma diferentes
+        lang_map = {
+            'es': 'es',
+            'en': 'en',
+            'fr': 'fr',
+            'ru': 'ru'
+        }
+        
+        source_code = lang_map.get(source_lang, source_lang)
+        target_code = lang_map.get(target_lang, target_lang)
+        
+        # Codificar texto para URL
+        encoded_text = urllib.parse.quote(text)
+        
+        # Construir URL
+        url = f"{self.base_urls['mymemory']}/get?q={encoded_text}&langpair={source_code}|{target_code}"
+        
+        # Hacer petición
+        response = self.transport.request('GET', url, headers={
+            'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36'
+        }, timeout=10)
+        result = json.loads(response.decode())
+        
+        if result and 'responseData' in result and result['responseData']:
+            translated_text = result['responseData']['translatedText']
+            if translated_text and translated_text.lower() != text.lower():
+                return translated_text
+        
+        return None
+    
+    def _translate_with_libretranslate(self, text: str, target_lang: str, source_lang: str) -> Optional[str]:
+        """Traduce usando LibreTranslate (servidor público si está disponible)."""
+        # Datos para la petición POST
+        data = {
+            'q': text,
+            'source': source_lang,
+            'target': target_lang,
+            'format': 'text'
+        }
+        
+        # Codificar datos
+        data_encoded = urllib.parse.urlencode(data).encode('utf-8')
+        
+        # Hacer petición a servidor público de LibreTranslate
+        response = self.transport.request(
+            'POST',
+            f"{self.base_urls['libretranslate']}/translate",
+            body=data_encoded,
+            headers={
+                'Content-Type': 'application/x-www-form-urlencoded',
+                'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36'
+            },
+            timeout=15
+        )
+        result = json.loads(response.decode())
+        
+        if result and 'translatedText' in result:
+            translated_text = result['translatedText']
+            if translated_text and translated_text.lower() != text.lower():
+                return translated_text
+        
+        return None
+
+def translate_xlf_file_automatic(source_file_path: str, target_lang: str, output_dir: str = None,
+                                 translation_memory_path: str = None, incremental: bool = False,
+                                 dry_run: bool = False, metrics_dir: str = None, resume: bool = False,
+                                 bundles: bool = True, trace_file: str = None, **translator_options):
+    """
+    Traduce un archivo XLIFF de manera completamente automática.
+    Crea una copia del archivo original para el idioma objetivo y lo traduce.
+    Las traducciones se reutilizan entre ejecuciones mediante la memoria de
+    traducción persistente (por defecto en RUN_STATE_DIRNAME).
+    Con incremental=True se fusiona con el archivo de idioma existente y solo se
+    traducen las unidades nuevas o cuyo source ha cambiado.
+    Con dry_run=True solo se muestra el plan (segmentos y coste estimado) sin traducir.
+    Cada unidad traducida se anota en un diario (ver _journal_path); con
+    resume=True se recuperan las unidades de una ejecución interrumpida.
+    Las métricas de la ejecución se escriben en metrics_dir (por defecto
+    RUN_STATE_DIRNAME) como JSON y como textfile de Prometheus.
+    Con bundles=True se genera además el bundle JSON del idioma para cargarlo en
+    tiempo de ejecución (ver write_translation_bundles).
+    Con trace_file se escribe la traza de la ejecución (ver RunTracer).
+    Las opciones adicionales (p. ej. concurrency) se pasan a AutomaticTranslator.
+    Devuelve un resumen de la ejecución (ver _run_summary).
     """
-    Extrae partes de expresiones ICU que no deben ser traducidas y devuelve un texto limpio
-    junto con los placeholders y las partes originales.
+    # Determinar directorio de salida
+    if output_dir is None:
+        output_dir = os.path.dirname(source_file_path)
+    
+    if translation_memory_path is None:
+        translation_memory_path = os.path.join(_run_state_dir(), TRANSLATION_MEMORY_FILENAME)
+    translation_memory = TranslationMemory(translation_memory_path)
+    translator = AutomaticTranslator(translation_memory, **translator_options)
+    if trace_file:
+        translator.metrics.tracer = RunTracer()
+    try:
+        languages = _translate_xlf_with(translator, source_file_path, target_lang, output_dir, incremental, dry_run, resume)
+        if not dry_run:
+            if bundles:
+                _write_bundles(translator, source_file_path, output_dir, list(languages))
+            _write_metrics_reports(translator, languages, metrics_dir or _run_state_dir())
+        return _run_summary(translator, languages)
+    finally:
+        translator.close()
+        translation_memory.close()
+        if trace_file:
+            translator.metrics.tracer.write(trace_file)
+
+def _xliff_namespace(root: ET.Element) -> str:
+    """Devuelve el namespace del documento en formato '{uri}' o '' si no tiene."""
+    # Obtener el namespace, si existe
+    # Esto es crucial para encontrar elementos con prefijos como 'ns0:'
+    namespace_match = re.match(r'\{.*\}', root.tag)
+    return namespace_match.group(0) if namespace_match else ''
+
+def _local_name(tag: str) -> str:
+    """Nombre de una etiqueta sin el namespace."""
+    return tag.rsplit('}', 1)[-1]
+
+def _xliff_tags(root: ET.Element) -> Tuple[str, str, str]:
+    """Devuelve las etiquetas (trans-unit, source, target) con el namespace del documento."""
+    ns = _xliff_namespace(root)
+    
+    # Usamos el namespace completo si está presente
+    trans_unit_tag = f'{ns}trans-unit' if ns else 'trans-unit'
+    source_tag = f'{ns}source' if ns else 'source'
+    target_tag = f'{ns}target' if ns else 'target'
+    return trans_unit_tag, source_tag, target_tag
+
+def source_fingerprint(source_element: ET.Element) -> str:
+    """
+    Huella del contenido de un <source>, incluidos los elementos en línea.
+    No depende del namespace ni de los espacios, así que es comparable entre el
+    catálogo extraído y los archivos de idioma ya generados.
+    """
+    def canonical(element: ET.Element) -> str:
+        parts = [TranslationMemory.normalize(element.text or '')]
+        for child in element:
+            attributes = ' '.join(f'{name}="{value}"' for name, value in sorted(child.attrib.items()))
+            parts.append(f'<{_local_name(child.tag)} {attributes}>{canonical(child)}</>')
+            parts.append(TranslationMemory.normalize(child.tail or ''))
+        return ''.join(parts)
+    
+    return hashlib.sha256(canonical(source_element).encode('utf-8')).hexdigest()[:16]
+
+def serialize_element(element: ET.Element) -> str:
+    """
+    Serializa un elemento sin prefijos de namespace, para insertarlo en un
+    documento cuyo namespace por defecto ya es el de XLIFF.
+    """
+    tag = _local_name(element.tag)
+    attributes = ''.join(
+        f' {_local_name(name)}={xml.sax.saxutils.quoteattr(value)}' for name, value in element.attrib.items()
+    )
+    content = xml.sax.saxutils.escape(element.text or '')
+    for child in element:
+        content += serialize_element(child) + xml.sax.saxutils.escape(child.tail or '')
+    if not content and len(element) == 0:
+        return f'<{tag}{attributes}/>'
+    return f'<{tag}{attributes}>{content}</{tag}>'
+
+class InlineSegment:
+    """
+    Contenido mixto de un <source> (texto y elementos <x/> en línea) como un único
+    texto enmascarado con tokens estables, junto con el elemento original de cada
+    token para reconstruir la misma estructura en el <target>.
+    """
+    
+    __slots__ = ('text', 'elements')
+    
+    def __init__(self, source_element: ET.Element):
+        parts = [source_element.text or '']
+        self.elements: Dict[str, str] = {}
+        # Aperturas pendientes: (sufijo del id tras START_, número de token)
+        open_tags: List[Tuple[str, int]] = []
+        for number, child in enumerate(source_element):
+            element_id = child.get('id', '')
+            if element_id.startswith('START_'):
+                token = f'__INLINE_OPEN_{number}__'
+                open_tags.append((element_id[len('START_'):], number))
+            elif element_id.startswith('CLOSE_') and open_tags and open_tags[-1][0] == element_id[len('CLOSE_'):]:
+                token = f'__INLINE_CLOSE_{open_tags.pop()[1]}__'
+            else:
+                token = f'__INLINE_PLACEHOLDER_{number}__'
+            self.elements[token] = serialize_element(child)
+            parts.append(token)
+            parts.append(child.tail or '')
+        self.text = ''.join(parts)
+    
+    @property
+    def has_text(self) -> bool:
+        """Si queda algo que traducir (alguna letra) fuera de los tokens."""
+        return re.search(r'[^\W\d_]', INLINE_TOKEN_PATTERN.sub('', self.text)) is not None
+
+def build_target(translated_text: str, elements: Optional[Dict[str, str]] = None) -> bytes:
+    """
+    Construye el <target> serializado a partir de un texto traducido, sustituyendo
+    cada token en línea por su elemento original.
+    """
+    if not elements:
+        return f'<target>{xml.sax.saxutils.escape(translated_text)}</target>'.encode('utf-8')
+    content = []
+    last = 0
+    for match in INLINE_TOKEN_PATTERN.finditer(translated_text):
+        content.append(xml.sax.saxutils.escape(translated_text[last:match.start()]))
+        content.append(elements[match.group(0)])
+        last = match.end()
+    content.append(xml.sax.saxutils.escape(translated_text[last:]))
+    return f'<target>{"".join(content)}</target>'.encode('utf-8')
+
+class XliffUnitSpan:
+    """
+    Posición en bytes de una trans-unit dentro del archivo, con lo necesario para
+    reescribirla sin tocar el resto del documento.
+    """
+    __slots__ = ('unit_id', 'start', 'end', 'insert_at', 'child_indent', 'target_start', 'target_end', 'target_raw')
+    
+    def __init__(self, unit_id: Optional[str], start: int):
+        self.unit_id = unit_id
+        self.start = start
+        self.end = start
+        # Final del último hijo directo: aquí se insertan los elementos nuevos
+        self.insert_at = start
+        self.child_indent = b''
+        self.target_start: Optional[int] = None
+        self.target_end: Optional[int] = None
+        self.target_raw: Optional[bytes] = None
+
+class XliffStreamReader:
+    """
+    Lector SAX (expat) de archivos XLIFF que recorre las trans-unit de una en una.
+    
+    Por cada unidad devuelve su posición en bytes (XliffUnitSpan) y un elemento
+    ElementTree con su contenido. Solo se mantiene en memoria la unidad actual,
+    así que el consumo no crece con el tamaño del catálogo.
+    """
+    
+    def __init__(self, file_path: str, chunk_size: int = XLIFF_CHUNK_SIZE):
+        self.file_path = file_path
+        self.chunk_size = chunk_size
+    
+    def __iter__(self) -> Iterator[Tuple[XliffUnitSpan, ET.Element]]:
+        self._parser = xml.parsers.expat.ParserCreate(namespace_separator='}')
+        self._parser.buffer_text = True
+        self._parser.StartElementHandler = self._start
+        self._parser.EndElementHandler = self._end
+        self._parser.CharacterDataHandler = self._data
+        
+        self._buffer = bytearray()
+        self._buffer_offset = 0
+        self._builder: Optional[ET.TreeBuilder] = None
+        self._span: Optional[XliffUnitSpan] = None
+        self._depth = 0
+        self._just_started = False
+        self._ready: List[Tuple[XliffUnitSpan, ET.Element]] = []
+        
+        with open(self.file_path, 'rb') as f:
+            while True:
+                chunk = f.read(self.chunk_size)
+                self._buffer += chunk
+                self._parser.Parse(chunk, not chunk)
+                yield from self._ready
+                self._ready.clear()
+                
+                # Descartar los bytes que ya no pertenecen a una unidad abierta. Fuera de
+                # una unidad se conserva desde el último '<', que puede ser una etiqueta
+                # que expat aún no ha terminado de leer
+                if self._builder is not None:
+                    keep_from = self._span.start
+                else:
+                    keep_from = self._buffer_offset + max(0, self._buffer.rfind(b'<'))
+                del self._buffer[:keep_from - self._buffer_offset]
+                self._buffer_offset = keep_from
+                if not chunk:
+                    break
+    
+    @staticmethod
+    def _qualified(name: str) -> str:
+        # expat entrega 'uri}nombre'; ElementTree usa '{uri}nombre'
+        return '{' + name if '}' in name else name
+    
+    def _element_end(self) -> int:
+        """Posición absoluta justo después de la etiqueta de cierre actual."""
+        index = self._parser.CurrentByteIndex
+        relative = index - self._buffer_offset
+        # En un elemento vacío (<x/>) expat ya apunta al final de la etiqueta
+        if self._just_started and self._buffer[relative - 2:relative] == b'/>':
+            return index
+        return self._buffer.index(b'>', relative) + 1 + self._buffer_offset
+    
+    def _start(self, name: str, attributes: Dict[str, str]):
+        self._just_started = True
+        # Fuera de una trans-unit no se construye nada
+        if self._builder is None and _local_name(name) != 'trans-unit':
+            return
+        tag = self._qualified(name)
+        attributes = {self._qualified(key): value for key, value in attributes.items()}
+        
+        if self._builder is None:
+            self._span = XliffUnitSpan(attributes.get('id'), self._parser.CurrentByteIndex)
+            self._builder = ET.TreeBuilder()
+            self._depth = 0
+        else:
+            self._depth += 1
+            if self._depth == 1:
+                index = self._parser.CurrentByteIndex
+                local = _local_name(tag)
+                if local == 'source':
+                    # La sangría del <source> se reutiliza para los elementos insertados
+                    relative = index - self._buffer_offset
+                    line_start = self._buffer.rfind(b'\n', 0, relative) + 1
+                    indent = bytes(self._buffer[line_start:relative])
+                    if not indent.strip():
+                        self._span.child_indent = indent
+                elif local == 'target' and self._span.target_start is None:
+                    self._span.target_start = index
+        self._builder.start(tag, attributes)
+    
+    def _end(self, name: str):
+        if self._builder is None:
+            return
+        tag = self._qualified(name)
+        self._builder.end(tag)
+        
+        if self._depth <= 1:
+            end = self._element_end()
+            span = self._span
+            if self._depth == 0:
+                span.end = end
+                self._ready.append((span, self._builder.close()))
+                self._builder = None
+            else:
+                span.insert_at = end
+                if _local_name(tag) == 'target' and span.target_end is None:
+                    span.target_end = end
+                    span.target_raw = bytes(self._buffer[span.target_start - self._buffer_offset:end - self._buffer_offset])
+        self._depth -= 1
+        self._just_started = False
+    
+    def _data(self, text: str):
+        self._just_started = False
+        if self._builder is not None:
+            self._builder.data(text)
+
+def _file_signature(file_path: str) -> Tuple[int, int]:
+    """Tamaño y fecha de modificación, para detectar cambios entre lectura y escritura."""
+    stat = os.stat(file_path)
+    return stat.st_size, stat.st_mtime_ns
+
+def _published_mode(file_path: str) -> int:
+    """
+    Permisos del archivo que se va a publicar: los del archivo existente o, si es
+    nuevo, los que daría open() (0666 menos la umask). mkstemp crea los temporales
+    con 0600, que el servidor web no podría leer.
+    """
+    try:
+        return stat.S_IMODE(os.stat(file_path).st_mode)
+    except FileNotFoundError:
+        umask = os.umask(0)
+        os.umask(umask)
+        return 0o666 & ~umask
+
+def write_patched_copy(source_file_path: str, output_file: str, patches: List[Tuple[int, int, bytes]],
+                       expected_signature: Optional[Tuple[int, int]] = None):
+    """
+    Escribe output_file copiando source_file_path byte a byte y sustituyendo los
+    rangos (inicio, fin) de cada parche por sus bytes. Las regiones sin parche
+    conservan su formato original. Se escribe en un archivo temporal del mismo
+    directorio que se renombra al terminar, así que la salida nunca queda a medias.
+    """
+    if expected_signature is not None and _file_signature(source_file_path) != expected_signature:
+        raise RuntimeError(f"{source_file_path} changed while it was being translated")
+    
+    output_dir = os.path.dirname(os.path.abspath(output_file))
+    fd, temp_path = tempfile.mkstemp(dir=output_dir, prefix=f'.{os.path.basename(output_file)}.', suffix='.tmp')
+    try:
+        with open(source_file_path, 'rb') as src, os.fdopen(fd, 'wb') as out:
+            cursor = 0
+            for start, end, data in patches:
+                remaining = start - cursor
+                while remaining > 0:
+                    block = src.read(min(XLIFF_CHUNK_SIZE, remaining))
+                    if not block:
+                        break
+                    out.write(block)
+                    remaining -= len(block)
+                out.write(data)
+                src.seek(end)
+                cursor = end
+            shutil.copyfileobj(src, out, XLIFF_CHUNK_SIZE)
+            out.flush()
+            os.fsync(out.fileno())
+        os.chmod(temp_path, _published_mode(output_file))
+        os.replace(temp_path, output_file)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+class TranslationJournal:
+    """
+    Diario write-ahead de las unidades traducidas de un idioma (JSON Lines).
+    
+    Cada unidad se anota en cuanto se traduce con su id, idioma, huella del source
+    y traducción. Las escrituras se agrupan y se vuelcan a disco (con fsync) cada
+    JOURNAL_FLUSH_RECORDS registros o JOURNAL_FLUSH_INTERVAL segundos, así que un
+    corte pierde como mucho el último intervalo. Si la ejecución se reanuda, el
+    diario se lee y se sigue ampliando; si no, se empieza de cero. El archivo no
+    se toca hasta la primera anotación.
+    """
+    
+    def __init__(self, path: str, target_lang: str, resume: bool = False):
+        self.path = path
+        self.target_lang = target_lang
+        self.resume = resume
+        # id de la unidad -> (huella del source, traducción) de una ejecución anterior
+        self.entries: Dict[str, Tuple[str, str]] = self._load() if resume else {}
+        self._buffer: List[str] = []
+        self._file = None
+        self._flushed_at = time.monotonic()
+        self._lock = threading.Lock()
+    
+    def _load(self) -> Dict[str, Tuple[str, str]]:
+        entries = {}
+        if not os.path.exists(self.path):
+            return entries
+        with open(self.path, 'r', encoding='utf-8') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    # Última línea a medio escribir cuando se cortó la ejecución
+                    continue
+                if record.get('lang') == self.target_lang and record.get('id'):
+                    entries[record['id']] = (record.get('source'), record['target'])
+        return entries
+    
+    def append(self, unit_id: str, fingerprint: Optional[str], target: str):
+        record = {'id': unit_id, 'lang': self.target_lang, 'source': fingerprint, 'target': target}
+        with self._lock:
+            self._buffer.append(json.dumps(record, ensure_ascii=False) + '\n')
+            if len(self._buffer) >= JOURNAL_FLUSH_RECORDS or time.monotonic() - self._flushed_at >= JOURNAL_FLUSH_INTERVAL:
+                self._flush()
+    
+    def _flush(self):
+        if self._buffer:
+            if self._file is None:
+                self._file = open(self.path, 'a' if self.resume else 'w', encoding='utf-8')
+            self._file.write(''.join(self._buffer))
+            self._file.flush()
+            os.fsync(self._file.fileno())
+            self._buffer = []
+        self._flushed_at = time.monotonic()
+    
+    def close(self):
+        """Vuelca lo pendiente y cierra el diario, que se conserva para --resume."""
+        with self._lock:
+            self._flush()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+    
+    def discard(self):
+        """Cierra y borra el diario una vez escrito el archivo del idioma."""
+        with self._lock:
+            self._buffer = []
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+def _run_state_dir() -> str:
+    """Directorio del estado de las ejecuciones (RUN_STATE_DIRNAME junto a este script), creado si hace falta."""
+    state_dir = os.path.join(os.path.dirname(os.path.abspath(__file__)), RUN_STATE_DIRNAME)
+    os.makedirs(state_dir, exist_ok=True)
+    return state_dir
+
+def _journal_path(output_file: str) -> str:
+    """
+    Diario de un archivo de idioma en el directorio de estado
+    (.../locale/messages.fr.xlf -> messages.fr.xlf.<hash del directorio>.journal).
+    """
+    directory = os.path.dirname(os.path.abspath(output_file))
+    digest = hashlib.sha1(directory.encode('utf-8')).hexdigest()[:8]
+    return os.path.join(_run_state_dir(), f'{os.path.basename(output_file)}.{digest}.journal')
+
+class ParsedCatalog:
+    """
+    Archivo XLIFF de origen leído una sola vez en streaming, con las unidades que
+    necesitan traducción ya identificadas. Solo guarda textos y posiciones en
+    bytes, no el árbol; se comparte entre todos los idiomas destino.
+    """
+    
+    def __init__(self, source_file_path: str):
+        self.source_file_path = source_file_path
+        self.source_signature = _file_signature(source_file_path)
+        
+        self.total_translations = 0
+        self.skipped_translations = 0
+        # (posición de la unidad en el documento, texto original, texto limpio)
+        self.units_to_translate: List[Tuple[int, str, str]] = []
+        # Posición en bytes, id y huella del source de cada unidad, por posición
+        self.spans: List[XliffUnitSpan] = []
+        self.unit_ids: List[Optional[str]] = []
+        self.fingerprints: List[Optional[str]] = []
+        # Archivos de la aplicación donde aparece cada unidad (context-group sourcefile)
+        self.sourcefiles: List[Tuple[str, ...]] = []
+        # Elementos en línea por token de las unidades con contenido mixto, por posición
+        self.inline_elements: Dict[int, Dict[str, str]] = {}
+        # Unidades sin texto traducible (solo elementos en línea): el target copia el source
+        self.verbatim_targets: Dict[int, bytes] = {}
+        
+        for position, (span, trans_unit) in enumerate(XliffStreamReader(source_file_path)):
+            _, source_tag, target_tag = _xliff_tags(trans_unit)
+            self.total_translations += 1
+            source_element = trans_unit.find(source_tag)
+            target_element = trans_unit.find(target_tag)
+            span.target_raw = None
+            self.spans.append(span)
+            self.unit_ids.append(span.unit_id)
+            self.fingerprints.append(source_fingerprint(source_element) if source_element is not None else None)
+            self.sourcefiles.append(tuple(
+                (context.text or '').strip() for context in trans_unit.iter(f'{_xliff_namespace(trans_unit)}context')
+                if context.get('context-type') == 'sourcefile'
+            ))
+            
+            if source_element is not None and len(source_element):
+                # Contenido mixto: el texto y los elementos <x/> se traducen como un solo segmento
+                segment = InlineSegment(source_element)
+                self.inline_elements[position] = segment.elements
+                if not segment.has_text:
+                    self.skipped_translations += 1
+                    if target_element is None:
+                        self.verbatim_targets[position] = build_target(segment.text, segment.elements)
+                    continue
+                source_text = segment.text
+            elif source_element is not None and source_element.text is not None:
+                source_text = source_element.text
+            else:
+                source_text = None
+            
+            if source_text is not None:
+                source_text_clean = source_text.strip()
+                
+                # Solo traducir textos que no estén vacíos
+                # ElementTree ya maneja las entidades HTML
+                if not source_text_clean:
+                    self.skipped_translations += 1
+                    continue
+                
+                # Verificar si ya tiene target
+                if target_element is None:
+                    self.units_to_translate.append((position, source_text, source_text_clean))
+                else:
+                    # Ya tiene target, verificar si necesita actualización
+                    if len(target_element):
+                        current_target = InlineSegment(target_element).text.strip()
+                    else:
+                        current_target = target_element.text.strip() if target_element.text else ""
+                    
+                    # Solo actualizar si el target está vacío o es igual al source
+                    if not current_target or current_target == source_text_clean:
+                        self.units_to_translate.append((position, source_text, source_text_clean))
+            else:
+                # Si no hay source_element o source_text, saltar
+                self.skipped_translations += 1
+    
+def _output_path(source_file_path: str, target_lang: str, output_dir: str) -> str:
+    """Nombre del archivo de salida para un idioma (messages.xlf -> messages.<lang>.xlf)."""
+    base_name = os.path.basename(source_file_path)
+    name_without_ext = os.path.splitext(base_name)[0]
+    return os.path.join(output_dir, f"{name_without_ext}.{target_lang}.xlf")
+
+class LanguagePlan:
+    """
+    Unidades que hay que traducir para un idioma concreto.
+    
+    En modo incremental se fusiona el catálogo recién extraído con el archivo de
+    idioma existente por id de trans-unit: se conservan los targets cuyo source no
+    ha cambiado (según su huella), se descartan los ids obsoletos y solo se envían
+    a traducir las unidades nuevas o modificadas.
+    """
+    
+    def __init__(self, catalog: ParsedCatalog, target_lang: str, output_dir: str, incremental: bool = False):
+        self.target_lang = target_lang
+        self.output_file = _output_path(catalog.source_file_path, target_lang, output_dir)
+        self.incremental = incremental
+        self.units_to_translate = catalog.units_to_translate
+        # Posición de la unidad -> target conservado del archivo existente (ya serializado)
+        self.kept_targets: Dict[int, bytes] = {}
+        self.obsolete_ids: List[str] = []
+        # Índice en units_to_translate -> traducción recuperada del diario (--resume)
+        self.resumed: Dict[int, str] = {}
+        self._translatable_positions = {unit[0] for unit in catalog.units_to_translate}
+        
+        if incremental and os.path.exists(self.output_file):
+            self._merge_existing(catalog)
+    
+    def _merge_existing(self, catalog: ParsedCatalog):
+        existing = _read_existing_targets(self.output_file)
+        
+        for position, (unit_id, fingerprint) in enumerate(zip(catalog.unit_ids, catalog.fingerprints)):
+            previous = existing.get(unit_id)
+            if previous is None or fingerprint is None:
+                continue
+            previous_fingerprint, previous_target = previous
+            if previous_fingerprint == fingerprint:
+                self.kept_targets[position] = previous_target
+        
+        fresh_ids = set(catalog.unit_ids)
+        self.obsolete_ids = [unit_id for unit_id in existing if unit_id not in fresh_ids]
+        self.units_to_translate = [unit for unit in catalog.units_to_translate if unit[0] not in self.kept_targets]
+    
+    def resume_from(self, catalog: ParsedCatalog, journal: TranslationJournal):
+        """Recupera del diario las unidades ya traducidas cuyo source no ha cambiado."""
+        for index, (position, _, _) in enumerate(self.units_to_translate):
+            entry = journal.entries.get(catalog.unit_ids[position])
+            if entry is not None and entry[0] == catalog.fingerprints[position]:
+                self.resumed[index] = entry[1]
+    
+    def journal_writer(self, catalog: ParsedCatalog, journal: TranslationJournal) -> Callable[[int, str], None]:
+        """Callback para translate_prepared que anota en el diario cada unidad traducida."""
+        def record(index: int, translated: str):
+            position = self.units_to_translate[index][0]
+            if catalog.unit_ids[position] is not None:
+                journal.append(catalog.unit_ids[position], catalog.fingerprints[position], translated)
+        return record
+    
+    @property
+    def kept_translatable(self) -> int:
+        """Unidades traducibles que no se envían porque su target se conserva."""
+        return sum(1 for position in self.kept_targets if position in self._translatable_positions)
+    
+    @property
+    def source_texts(self) -> List[str]:
+        return [source_text_clean for _, _, source_text_clean in self.units_to_translate]
+
+class UnitPriority:
+    """
+    Orden en que se traducen las unidades, para que con un tiempo limitado se
+    terminen primero las pantallas importantes.
+    
+    Cada patrón se compara con los archivos de origen de la unidad (context-group
+    sourcefile): un patrón con comodines se evalúa con fnmatch y uno sin ellos
+    basta con que aparezca en la ruta (p. ej. 'login' o 'funds'). Primero van las
+    unidades del primer patrón que coincide, luego las del segundo y al final las
+    que no coinciden con ninguno. Con shortest_first, dentro de cada nivel van
+    antes los textos cortos.
+    """
+    
+    def __init__(self, patterns: Optional[List[str]] = None, shortest_first: bool = False):
+        self.patterns = list(patterns or [])
+        self.shortest_first = shortest_first
+    
+    @staticmethod
+    def _matches(pattern: str, sourcefile: str) -> bool:
+        if any(char in pattern for char in '*?['):
+            return fnmatch.fnmatch(sourcefile, pattern)
+        return pattern in sourcefile
+    
+    def rank(self, sourcefiles: Tuple[str, ...], text: str) -> Tuple[int, int]:
+        """Prioridad de una unidad: (nivel del primer patrón que coincide, longitud); menor = antes."""
+        level = next(
+            (i for i, pattern in enumerate(self.patterns) if any(self._matches(pattern, f) for f in sourcefiles)),
+            len(self.patterns)
+        )
+        return level, len(text) if self.shortest_first else 0
+    
+    def describe(self) -> str:
+        order = ', '.join(self.patterns) if self.patterns else 'document order'
+        return f"{order}{' (shortest first)' if self.shortest_first else ''}"
+
+class TranslationPlan:
+    """
+    Planificación global previa a cualquier petición de red.
+    
+    Reúne los segmentos traducibles del catálogo para todos los idiomas destino,
+    descuenta lo que ya está en caché o en la memoria de traducción y deduplica
+    el resto. Con esos lotes estima cuántas peticiones haría cada backend y cuánto
+    tardaría con los límites configurados; la ejecución reutiliza los mismos lotes.
+    """
+    
+    def __init__(self, translator: AutomaticTranslator, catalog: ParsedCatalog, language_plans: List[LanguagePlan]):
+        self.translator = translator
+        self.catalog = catalog
+        self.language_plans = {plan.target_lang: plan for plan in language_plans}
+        # Los archivos de idioma existentes también alimentan la memoria aproximada
+        if translator.fuzzy:
+            for plan in language_plans:
+                if plan.output_file not in translator._fuzzy_seeded and os.path.exists(plan.output_file):
+                    translator._fuzzy_seeded.add(plan.output_file)
+                    fuzzy_index = translator.fuzzy_index(plan.target_lang)
+                    for source_text, target_text in _read_translated_pairs(plan.output_file):
+                        fuzzy_index.add(source_text, target_text)
+        self.batches = {
+            plan.target_lang: translator.prepare_batch(plan.source_texts, plan.target_lang, resumed=plan.resumed,
+                                                       ranks=self._ranks(plan))
+            for plan in language_plans
+        }
+    
+    def _ranks(self, plan: LanguagePlan) -> Optional[List[Tuple[int, int]]]:
+        priority = self.translator.priority
+        if priority is None:
+            return None
+        return [priority.rank(self.catalog.sourcefiles[position], source_text_clean)
+                for position, _, source_text_clean in plan.units_to_translate]
     
-    Args:
-        text: El texto que puede contener expresiones ICU
-        
-    Returns:
-        Tuple con:
-        - Una lista de placeholders usados para reemplazar las partes ICU
-        - Una lista de las partes ICU originales
-    """
-    # Detectar si es una expresión ICU completa
-    icu_pattern = r'\{([^{}]+(?:\{[^{}]*\}[^{}]*)+)\}'
-    icu_keyword_pattern = r'\b(select|plural|VAR_SELECT|VAR_PLURAL|true|false|other|=\d+)\b'
+    @property
+    def unique_segments(self) -> int:
+        """Segmentos de origen distintos que aún necesitan alguna traducción."""
+        segments = set()
+        for batch in self.batches.values():
+            segments.update(batch.pending)
+        return len(segments)
     
-    placeholders = []
-    original_parts = []
+    def estimate(self) -> List[Tuple[str, int, float]]:
+        """(backend, peticiones, segundos) si cada backend atendiera todos los idiomas, en orden de uso."""
+        estimates = []
+        for backend in self.translator.router.order():
+            requests = sum(self.translator.estimate_requests(batch, backend) for batch in self.batches.values())
+            estimates.append((backend, requests, self.translator.estimate_seconds(backend, requests)))
+        return estimates
     
-    # Reemplazar partes de ICU con placeholders
-    matches = re.finditer(icu_pattern, text)
-    for idx, match in enumerate(matches):
-        full_icu_expr = match.group(0)
-        icu_content = match.group(1)
+    def print_summary(self):
+        units = sum(len(plan.units_to_translate) for plan in self.language_plans.values())
+        cached = sum(batch.cached for batch in self.batches.values())
+        fuzzy = sum(batch.fuzzy for batch in self.batches.values())
+        proposals = sum(len(batch.proposals) for batch in self.batches.values())
+        resumed = sum(batch.resumed for batch in self.batches.values())
+        pending = sum(batch.pending_units for batch in self.batches.values())
+        segments = sum(len(batch.pending) for batch in self.batches.values())
         
-        # Verificar si tiene palabras clave ICU
-        if re.search(icu_keyword_pattern, icu_content):
-            placeholder = f"__ICU_PLACEHOLDER_{idx}__"
-            placeholders.append(placeholder)
-            original_parts.append(full_icu_expr)
-    
-    return placeholders, original_parts
+        print(f"\n=== Translation Plan ===")
+        print(f"Languages: {', '.join(self.batches)}")
+        print(f"Units to translate: {units}")
+        print(f"Already translated (cache/translation memory): {cached}")
+        if fuzzy or proposals:
+            print(f"Reused from near-identical translations: {fuzzy} ({proposals} similar ones proposed for review)")
+        if resumed:
+            print(f"Resumed from journal: {resumed}")
+        print(f"Unique source segments: {self.unique_segments}")
+        print(f"Segments to request: {segments} for {pending} units ({pending - segments} duplicates removed)")
+        if self.translator.priority is not None:
+            print(f"Priority: {self.translator.priority.describe()}")
+        if self.translator.deadline is not None:
+            print(f"Time budget: {max(0.0, self.translator.deadline - time.monotonic()):.0f}s left")
+        for lang, batch in self.batches.items():
+            icu_messages = sum(1 for message in batch.messages.values() if isinstance(message, IcuMessage))
+            print(f"  {lang}: {len(batch.pending)} segments, {icu_messages} ICU messages, "
+                  f"{len(batch.messages) - icu_messages} texts split into sentences")
+        print("Estimated cost if served by each backend:")
+        for backend, requests, seconds in self.estimate():
+            limiter = self.translator.rate_limiters[backend]
+            print(f"  {backend}: {requests} requests, ~{seconds:.0f}s at {limiter.configured_rate:g} req/s "
+                  f"(burst {limiter.burst}, {self.translator.concurrency[backend]} concurrent)")
 
-def restore_icu_parts(text: str, placeholders: List[str], original_parts: List[str]) -> str:
+def _read_existing_targets(output_file: str) -> Dict[str, Tuple[str, bytes]]:
     """
-    Restaura las expresiones ICU originales en el texto traducido.
-    
-    Args:
-        text: El texto traducido con placeholders
-        placeholders: Lista de placeholders usados
-        original_parts: Lista de partes ICU originales
+    Lee en streaming un archivo de idioma existente y devuelve id -> (huella del
+    source, target serializado) de las unidades con un target realmente traducido. Si la unidad no guarda su huella se calcula a partir de
+    su propio <source>.
+    """
+    existing = {}
+    for span, trans_unit in XliffStreamReader(output_file):
+        ns = _xliff_namespace(trans_unit)
+        _, source_tag, target_tag = _xliff_tags(trans_unit)
+        source_element = trans_unit.find(source_tag)
+        target_element = trans_unit.find(target_tag)
+        if span.unit_id is None or source_element is None or target_element is None:
+            continue
         
-    Returns:
-        El texto con las expresiones ICU restauradas
+        # Un target vacío o igual al source nunca se llegó a traducir
+        source_text = (source_element.text or '').strip()
+        current_target = (target_element.text or '').strip()
+        if not len(target_element) and (not current_target or current_target == source_text):
+            continue
+        
+        notes = [note for note in trans_unit.findall(f'{ns}note') if note.get('from') == SOURCE_FINGERPRINT_NOTE]
+        fingerprint = notes[0].text if notes else source_fingerprint(source_element)
+        # Se conserva el target tal cual estaba escrito salvo que use un prefijo de namespace
+        if span.target_raw is not None and span.target_raw.startswith(b'<target'):
+            target = span.target_raw
+        else:
+            target = serialize_element(target_element).encode('utf-8')
+        existing[span.unit_id] = (fingerprint, target)
+    return existing
+
+def _read_translated_pairs(output_file: str) -> List[Tuple[str, str]]:
     """
-    result = text
-    for placeholder, original in zip(placeholders, original_parts):
-        result = result.replace(placeholder, original)
-    return result
+    Lee en streaming un archivo de idioma existente y devuelve (texto del source,
+    texto del target) de sus unidades traducidas, con los elementos en línea como
+    tokens. Las unidades cuyo target no usa los mismos elementos que su source con
+    los mismos tokens se omiten.
+    """
+    pairs = []
+    for _, trans_unit in XliffStreamReader(output_file):
+        _, source_tag, target_tag = _xliff_tags(trans_unit)
+        source_element = trans_unit.find(source_tag)
+        target_element = trans_unit.find(target_tag)
+        if source_element is None or target_element is None:
+            continue
+        if len(source_element):
+            source, target = InlineSegment(source_element), InlineSegment(target_element)
+            if any(source.elements.get(token) != element for token, element in target.elements.items()):
+                continue
+            source_text, target_text = source.text.strip(), target.text.strip()
+        elif len(target_element):
+            continue
+        else:
+            source_text, target_text = (source_element.text or '').strip(), (target_element.text or '').strip()
+        if source_text and target_text and target_text != source_text:
+            pairs.append((source_text, target_text))
+    return pairs
 
-class AutomaticTranslator:
+def _run_summary(translator: AutomaticTranslator, languages: Dict[str, Dict[str, int]]) -> Dict:
+    """Resumen de una ejecución: recuentos por idioma, aciertos de la memoria de traducción y métricas."""
+    translation_memory = translator.translation_memory
+    return {
+        'languages': languages,
+        'translation_memory': {'hits': translation_memory.hits, 'misses': translation_memory.misses},
+        'metrics': translator.metrics.report(languages),
+    }
+
+def _summary_line(summary: Dict) -> str:
+    """Una línea con lo esencial de _run_summary: unidades, peticiones, aciertos de la memoria y duración."""
+    counts = summary['languages'].values()
+    requests = sum(backend['requests'] for backend in summary['metrics']['backends'].values())
+    return (f"{sum(count['translated'] for count in counts)}/{sum(count['units'] for count in counts)} units translated, "
+            f"{requests} requests, {summary['translation_memory']['hits']} translation memory hits, "
+            f"{summary['metrics']['duration_seconds']:.2f}s")
+
+def _write_text_atomic(file_path: str, text: str):
+    """Escribe un archivo de texto mediante un temporal que se renombra, para no dejarlo a medias."""
+    directory = os.path.dirname(os.path.abspath(file_path))
+    fd, temp_path = tempfile.mkstemp(dir=directory, prefix=f'.{os.path.basename(file_path)}.', suffix='.tmp')
+    try:
+        with os.fdopen(fd, 'w', encoding='utf-8') as f:
+            f.write(text)
+        os.chmod(temp_path, _published_mode(file_path))
+        os.replace(temp_path, file_path)
+    except BaseException:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+def _write_metrics_reports(translator: AutomaticTranslator, languages: Dict[str, Dict[str, int]], metrics_dir: str):
+    """Escribe el informe JSON y el textfile de Prometheus de la ejecución."""
+    os.makedirs(metrics_dir, exist_ok=True)
+    report = translator.metrics.report(languages)
+    report['hedge'] = dict(translator.hedge_stats)
+    report['deferred_retries'] = dict(translator.retry_stats)
+    report['connections_opened'] = translator.transport.connections_opened
+    report_file = os.path.join(metrics_dir, METRICS_REPORT_FILENAME)
+    _write_text_atomic(report_file, json.dumps(report, indent=2, ensure_ascii=False) + '\n')
+    _write_text_atomic(os.path.join(metrics_dir, METRICS_TEXTFILE_FILENAME), translator.metrics.to_prometheus(languages))
+    print(f"📊 Metrics: {report_file}")
+
+def runtime_message(target_element: ET.Element) -> str:
     """
-    Traductor completamente automático que toma todos los textos del archivo XLIFF
-    y los traduce usando APIs gratuitas sin necesidad de diccionarios predefinidos.
+    Texto de un <target> en el formato de traducciones de $localize: cada
+    elemento en línea (<x id="INTERPOLATION"/>...) pasa a ser {$INTERPOLATION}.
     """
-    
-    def __init__(self):
-        self.translation_cache = {}
-        self.request_count = 0
-        self.max_requests_per_minute = 30  # Límite conservador
-        
-    def translate_text(self, text: str, target_lang: str, source_lang: str = 'es') -> str:
-        """
-        Traduce un texto automáticamente usando múltiples APIs como fallback.
-        Preserva expresiones ICU y entidades HTML.
-        """
-        # Limpiar y validar texto
-        clean_text = text.strip()
-        if not clean_text or len(clean_text) < 2:
-            return text
-        
-        # Detectar y extraer expresiones ICU para preservarlas
-        icu_placeholders, icu_originals = extract_icu_parts(clean_text)
-        
-        # Si hay expresiones ICU, reemplazarlas con placeholders antes de traducir
-        text_to_translate = clean_text
-        for placeholder, original in zip(icu_placeholders, icu_originals):
-            text_to_translate = text_to_translate.replace(original, placeholder)
-            
-        # Si después de extraer ICU el texto está vacío, devolver el original
-        if not text_to_translate.strip():
-            return text
-            
-        # Manejar textos muy largos dividiéndolos en oraciones
-        max_len = 2000  # Reducido para mayor seguridad
-        if len(clean_text) > max_len:
-            # Primero intentar dividir por oraciones
-            parts = re.split(r'(?<=[\.\!\?])\s+', clean_text)
-            
-            # Si una oración sigue siendo demasiado larga o solo hay una oración larga, 
-            # dividir por comas, puntos y coma o cualquier otro delimitador adecuado
-            translated_parts = []
-            for part in parts:
-                if len(part) > max_len:
-                    subparts = re.split(r'(?<=[\,\;\:])\s+', part)
-                    for subpart in subparts:
-                        # Si aún así es muy largo, dividir en fragmentos más pequeños
-                        if len(subpart) > max_len:
-                            # Dividir en fragmentos de longitud segura
-                            for i in range(0, len(subpart), max_len//2):  # Usar la mitad del máximo para garantizar superposición
-                                chunk = subpart[i:i+max_len//2]
-                                if chunk:
-                                    translated_parts.append(self.translate_text(chunk, target_lang, source_lang))
-                        else:
-                            if subpart:
-                                translated_parts.append(self.translate_text(subpart, target_lang, source_lang))
-                else:
-                    if part:
-                        translated_parts.append(self.translate_text(part, target_lang, source_lang))
-                    
-            translated_full = ' '.join(translated_parts)
-            cache_key = f"{source_lang}_{target_lang}_{clean_text}"
-            self.translation_cache[cache_key] = translated_full
-            return translated_full
+    parts = [target_element.text or '']
+    for child in target_element:
+        parts.append(f"{{${child.get('id', '')}}}")
+        parts.append(child.tail or '')
+    return ''.join(parts)
 
-        # Verificar en caché
-        cache_key = f"{source_lang}_{target_lang}_{clean_text}"
-        if cache_key in self.translation_cache:
-            return self.translation_cache[cache_key]
-        
-        # Control de rate limiting
-        if self.request_count >= self.max_requests_per_minute:
-            print("Rate limit reached, waiting...")
-            time.sleep(20)
-            self.request_count = 0
-        
-        # Intentar diferentes métodos de traducción
-        translated = None
-        
-        # Método 1: Google Translate (gratuito)
-        try:
-            translated = self._translate_with_google(text_to_translate, target_lang, source_lang)
-            if translated and translated != text_to_translate:
-                # Restaurar expresiones ICU en el texto traducido
-                if icu_placeholders:
-                    translated = restore_icu_parts(translated, icu_placeholders, icu_originals)
-                self.translation_cache[cache_key] = translated
-                return translated
-        except Exception as e:
-            print(f"Google Translate failed: {e}")
-        
-        # Método 2: MyMemory API (gratuito)
-        try:
-            translated = self._translate_with_mymemory(text_to_translate, target_lang, source_lang)
-            if translated and translated != text_to_translate:
-                # Restaurar expresiones ICU en el texto traducido
-                if icu_placeholders:
-                    translated = restore_icu_parts(translated, icu_placeholders, icu_originals)
-                self.translation_cache[cache_key] = translated
-                return translated
-        except Exception as e:
-            print(f"MyMemory failed: {e}")
-        
-        # Método 3: LibreTranslate (si está disponible)
-        try:
-            translated = self._translate_with_libretranslate(text_to_translate, target_lang, source_lang)
-            if translated and translated != text_to_translate:
-                # Restaurar expresiones ICU en el texto traducido
-                if icu_placeholders:
-                    translated = restore_icu_parts(translated, icu_placeholders, icu_originals)
-                self.translation_cache[cache_key] = translated
-                return translated
-        except Exception as e:
-            print(f"LibreTranslate failed: {e}")
-        
-        # Sistema de reintentos con espera exponencial
-        max_retries = 0
-        retry_count = 0
-        
-        while retry_count < max_retries:
-            retry_count += 1
-            delay = 2 ** retry_count  # Retraso exponencial: 2, 4, 8 segundos
-            
-            print(f"Translation attempt failed. Retrying in {delay} seconds (attempt {retry_count}/{max_retries})...")
-            time.sleep(delay)
-            
-            # Reintentar en orden diferente para maximizar posibilidades de éxito
-            services = [
-                (self._translate_with_google, "Google"),
-                (self._translate_with_mymemory, "MyMemory"),
-                (self._translate_with_libretranslate, "LibreTranslate")
-            ]
-            
-            # Alternar el orden de los servicios a probar en cada reintento
-            retry_services = services[retry_count % len(services):] + services[:retry_count % len(services)]
-            
-            for translate_func, service_name in retry_services:
-                try:
-                    translated = translate_func(text_to_translate, target_lang, source_lang)
-                    if translated and translated != text_to_translate:
-                        # Restaurar expresiones ICU en el texto traducido
-                        if icu_placeholders:
-                            translated = restore_icu_parts(translated, icu_placeholders, icu_originals)
-                        self.translation_cache[cache_key] = translated
-                        return translated
-                except Exception as e:
-                    print(f"{service_name} retry failed: {e}")
-        
-        # Si todo falla después de los reintentos, devolver texto original
-        return text  # Devolvemos el texto original completo con las expresiones ICU intactas
-    
-    def _translate_with_google(self, text: str, target_lang: str, source_lang: str) -> Optional[str]:
-        """Traduce usando Google Translate API gratuita."""
-        try:
-            self.request_count += 1
-            
-            # Codificar texto para URL
-            encoded_text = urllib.parse.quote(text)
-            
-            # Construir URL
-            url = f"https://translate.googleapis.com/translate_a/single?client=gtx&sl={source_lang}&tl={target_lang}&dt=t&q={encoded_text}"
-            
-            # Hacer petición
-            req = urllib.request.Request(url, headers={
-                'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36'
-            })
-            
-            with urllib.request.urlopen(req, timeout=10) as response:
-                result = json.loads(response.read().decode())
-                
-                if result and len(result) > 0 and result[0] and len(result[0]) > 0:
-                    translated_text = result[0][0][0]
-                    # Pequeña pausa para evitar rate limiting
-                    time.sleep(0.2)
-                    return translated_text
-                    
-        except Exception as e:
-            print(f"Google Translate error: {e}")
-            return None
-        
-        return None
+def _read_runtime_translations(locale_file: str) -> Dict[str, str]:
+    """
+    Lee en streaming un archivo de idioma y devuelve id -> traducción de las
+    unidades con target, sin espacios exteriores (como la carga desde XLIFF de main.ts).
+    """
+    translations = {}
+    for span, trans_unit in XliffStreamReader(locale_file):
+        _, _, target_tag = _xliff_tags(trans_unit)
+        target_element = trans_unit.find(target_tag)
+        if span.unit_id is None or target_element is None:
+            continue
+        message = runtime_message(target_element).strip()
+        if message:
+            translations[span.unit_id] = message
+    return translations
+
+def write_translation_bundles(locale_files: Dict[str, str], bundle_dir: str) -> Dict[str, Dict]:
+    """
+    Genera, para cada idioma (idioma -> archivo XLIFF traducido), un bundle JSON
+    minificado {"locale", "translations": {id: traducción}} llamado
+    messages.<idioma>.<hash del contenido>.json, y actualiza el manifiesto que
+    indica qué archivo corresponde a cada idioma. Los idiomas cuyo XLIFF no cambió
+    desde el último bundle (según el manifiesto) no se vuelven a leer, y un bundle
+    con el mismo contenido no se reescribe. Devuelve las entradas del manifiesto.
+    """
+    os.makedirs(bundle_dir, exist_ok=True)
+    manifest_path = os.path.join(bundle_dir, BUNDLE_MANIFEST_FILENAME)
+    try:
+        with open(manifest_path, 'r', encoding='utf-8') as f:
+            manifest = json.load(f)
+    except (OSError, ValueError):
+        manifest = {}
+    locales = manifest.setdefault('locales', {})
     
-    def _translate_with_mymemory(self, text: str, target_lang: str, source_lang: str) -> Optional[str]:
-        """Traduce usando MyMemory API (gratuita)."""
-        try:
-            self.request_count += 1
-            
-            # MyMemory usa códigos de idioma diferentes
-            lang_map = {
-                'es': 'es',
-                'en': 'en',
-                'fr': 'fr',
-                'ru': 'ru'
-            }
-            
-            source_code = lang_map.get(source_lang, source_lang)
-            target_code = lang_map.get(target_lang, target_lang)
-            
-            # Codificar texto para URL
-            encoded_text = urllib.parse.quote(text)
-            
-            # Construir URL
-            url = f"https://api.mymemory.translated.net/get?q={encoded_text}&langpair={source_code}|{target_code}"
-            
-            # Hacer petición
-            req = urllib.request.Request(url, headers={
-                'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36'
-            })
-            
-            with urllib.request.urlopen(req, timeout=10) as response:
-                result = json.loads(response.read().decode())
-                
-                if result and 'responseData' in result and result['responseData']:
-                    translated_text = result['responseData']['translatedText']
-                    if translated_text and translated_text.lower() != text.lower():
-                        time.sleep(0.1)
-                        return translated_text
-                        
-        except Exception as e:
-            print(f"MyMemory error: {e}")
-            return None
+    changed = False
+    for lang, locale_file in locale_files.items():
+        entry = locales.get(lang)
+        signature = list(_file_signature(locale_file))
+        if (entry is not None and entry.get('source_signature') == signature
+                and entry.get('format') == BUNDLE_FORMAT_VERSION and os.path.exists(os.path.join(bundle_dir, entry['file']))):
+            print(f"📦 {lang}: bundle up to date ({entry['file']})")
+            continue
         
-        return None
+        translations = _read_runtime_translations(locale_file)
+        content = json.dumps({'locale': lang, 'translations': translations},
+                             ensure_ascii=False, separators=(',', ':'), sort_keys=True)
+        digest = hashlib.sha256(content.encode('utf-8')).hexdigest()[:BUNDLE_HASH_LENGTH]
+        file_name = f"{os.path.splitext(os.path.basename(locale_file))[0]}.{digest}.json"
+        bundle_path = os.path.join(bundle_dir, file_name)
+        if not os.path.exists(bundle_path):
+            _write_text_atomic(bundle_path, content)
+            print(f"📦 {lang}: {file_name} ({len(translations)} messages)")
+        else:
+            print(f"📦 {lang}: bundle unchanged ({file_name})")
+        # El bundle anterior deja de estar referenciado
+        if entry is not None and entry.get('file') != file_name:
+            previous = os.path.join(bundle_dir, entry['file'])
+            if os.path.exists(previous):
+                os.remove(previous)
+        locales[lang] = {'file': file_name, 'format': BUNDLE_FORMAT_VERSION, 'hash': digest,
+                         'messages': len(translations),
+                         'source': os.path.basename(locale_file), 'source_signature': signature}
+        changed = True
     
-    def _translate_with_libretranslate(self, text: str, target_lang: str, source_lang: str) -> Optional[str]:
-        """Traduce usando LibreTranslate (servidor público si está disponible)."""
-        try:
-            self.request_count += 1
-            
-            # Datos para la petición POST
-            data = {
-                'q': text,
-                'source': source_lang,
-                'target': target_lang,
-                'format': 'text'
-            }
-            
-            # Codificar datos
-            data_encoded = urllib.parse.urlencode(data).encode('utf-8')
-            
-            # Hacer petición a servidor público de LibreTranslate
-            req = urllib.request.Request(
-                'https://libretranslate.de/translate',
-                data=data_encoded,
-                headers={
-                    'Content-Type': 'application/x-www-form-urlencoded',
-                    'User-Agent': 'Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36'
-                }
-            )
-            
-            with urllib.request.urlopen(req, timeout=15) as response:
-                result = json.loads(response.read().decode())
-                
-                if result and 'translatedText' in result:
-                    translated_text = result['translatedText']
-                    if translated_text and translated_text.lower() != text.lower():
-                        time.sleep(0.3)
-                        return translated_text
-                        
-        except Exception as e:
-            print(f"LibreTranslate error: {e}")
-            return None
-        
-        return None
+    if changed:
+        _write_text_atomic(manifest_path, json.dumps(manifest, indent=2, sort_keys=True, ensure_ascii=False) + '\n')
+    return locales
 
-def translate_xlf_file_automatic(source_file_path: str, target_lang: str, output_dir: str = None):
+def _write_bundles(translator: AutomaticTranslator, source_file_path: str, output_dir: str, languages: List[str]):
+    """Fase de bundles tras la traducción, para los idiomas cuyo archivo existe."""
+    locale_files = {lang: _output_path(source_file_path, lang, output_dir) for lang in languages}
+    locale_files = {lang: path for lang, path in locale_files.items() if os.path.exists(path)}
+    if locale_files:
+        with translator.metrics.stage('bundle'):
+            write_translation_bundles(locale_files, os.path.join(output_dir, BUNDLE_DIRNAME))
+
+def _translate_xlf_with(translator: AutomaticTranslator, source_file_path: str, target_lang: str, output_dir: str,
+                        incremental: bool = False, dry_run: bool = False, resume: bool = False) -> Dict[str, Dict[str, int]]:
     """
-    Traduce un archivo XLIFF de manera completamente automática.
-    Crea una copia del archivo original para el idioma objetivo y lo traduce.
+    Ejecuta la traducción de un archivo XLIFF con un traductor ya configurado.
+    Devuelve los recuentos de _write_translated_catalog por idioma.
+    """
+    print(f"🚀 Starting automatic translation to {target_lang}...")
+    metrics = translator.metrics
+    with metrics.stage('parse'):
+        catalog = ParsedCatalog(source_file_path)
+        plan = LanguagePlan(catalog, target_lang, output_dir, incremental)
+        journal = TranslationJournal(_journal_path(plan.output_file), target_lang, resume)
+        plan.resume_from(catalog, journal)
+    with metrics.stage('mask'):
+        translation_plan = TranslationPlan(translator, catalog, [plan])
+    translation_plan.print_summary()
+    if dry_run:
+        return {}
+    print("⏳ This may take several minutes depending on the number of strings...")
+    try:
+        with metrics.stage('translate'):
+            translated_texts = translator.translate_prepared(translation_plan.batches[target_lang],
+                                                             plan.journal_writer(catalog, journal))
+        with metrics.stage('write'):
+            batch = translation_plan.batches[target_lang]
+            result = _write_translated_catalog(translator, catalog, plan, translated_texts, output_dir,
+                                               batch.failed_units, batch.proposals, batch.skipped_units)
+        # El archivo ya está escrito: el diario deja de hacer falta
+        journal.discard()
+        return {target_lang: result}
+    finally:
+        journal.close()
+
+def _write_translated_catalog(translator: AutomaticTranslator, catalog: ParsedCatalog, plan: LanguagePlan,
+                              translated_texts: List[str], output_dir: str,
+                              failed_units: frozenset = frozenset(),
+                              proposals: Optional[Dict[str, FuzzyMatch]] = None,
+                              skipped_units: frozenset = frozenset(), log_dir: Optional[str] = None) -> Dict[str, int]:
+    """
+    Aplica las traducciones copiando el archivo de origen con parches sobre las
+    unidades afectadas y escribe el archivo del idioma y su registro (en log_dir,
+    por defecto output_dir). Las unidades
+    de failed_units (índices que siguieron fallando tras sus reintentos) y las de
+    skipped_units (índices que el límite de tiempo dejó sin enviar, pendientes
+    para la próxima ejecución) se informan aparte, y las traducciones parecidas de proposals (texto -> coincidencia
+    de la memoria aproximada) se listan en el registro para revisarlas.
     """
-    import os
-    import shutil
     import datetime
     
-    translator = AutomaticTranslator()
-    
-    # Determinar directorio de salida
-    if output_dir is None:
-        output_dir = os.path.dirname(source_file_path)
-    
-    # Crear nombre del archivo de salida
-    base_name = os.path.basename(source_file_path)
-    name_without_ext = os.path.splitext(base_name)[0]
-    output_file = os.path.join(output_dir, f"{name_without_ext}.{target_lang}.xlf")
+    source_file_path = catalog.source_file_path
+    target_lang = plan.target_lang
+    output_file = plan.output_file
     
     # Crear nombre del archivo de registro
     timestamp = datetime.datetime.now().strftime("%Y%m%d_%H%M%S")
-    log_file = os.path.join(output_dir, f"translation_{target_lang}_{timestamp}.log")
+    if log_dir:
+        os.makedirs(log_dir, exist_ok=True)
+    log_file = os.path.join(log_dir or output_dir, f"translation_{target_lang}_{timestamp}.log")
     
-    print(f"🚀 Starting automatic translation to {target_lang}...")
+    print(f"\n💾 Writing {target_lang} translation...")
     print(f"📁 Source file: {source_file_path}")
     print(f"📁 Output file: {output_file}")
     print(f"📝 Log file: {log_file}")
-    print("⏳ This may take several minutes depending on the number of strings...")
     
     # Iniciar registro de log
     with open(log_file, 'w', encoding='utf-8') as log:
@@ -366,116 +3670,71 @@ def translate_xlf_file_automatic(source_file_path: str, target_lang: str, output
         log.write(f"Date: {datetime.datetime.now().strftime('%Y-%m-%d %H:%M:%S')}\n")
         log.write("="*50 + "\n\n")
     
-    # Crear copia del archivo original
-    try:
-        shutil.copy2(source_file_path, output_file)
-        print(f"✅ Created copy for {target_lang}: {output_file}")
-    except Exception as e:
-        print(f"❌ Error creating copy: {e}")
-        return
-    
-    # Parsear el archivo XLIFF
-    tree = ET.parse(output_file)
-    root = tree.getroot()
-    
-    # Obtener el namespace, si existe
-    # Esto es crucial para encontrar elementos con prefijos como 'ns0:'
-    namespace_match = re.match(r'\{.*\}', root.tag)
-    ns = namespace_match.group(0) if namespace_match else ''
-    
-    # Buscar todas las unidades de traducción
-    # Usamos el namespace completo si está presente
-    trans_unit_tag = f'{ns}trans-unit' if ns else 'trans-unit'
-    source_tag = f'{ns}source' if ns else 'source'
-    target_tag = f'{ns}target' if ns else 'target'
-
-    total_translations = 0
+    total_translations = catalog.total_translations
     successful_translations = 0
-    skipped_translations = 0
+    skipped_translations = catalog.skipped_translations
     missing_translations = [] # Lista para mantener seguimiento de traducciones faltantes
+    pending_units = [] # Unidades que el límite de tiempo dejó sin enviar
+    pending_positions = []
+    retry_failures = [] # Unidades que siguieron fallando tras los reintentos diferidos
     
-    for trans_unit in root.iter(trans_unit_tag):
-        total_translations += 1
-        source_element = trans_unit.find(source_tag)
-        target_element = trans_unit.find(target_tag)
-        
-        if source_element is not None and source_element.text is not None:
-            source_text = source_element.text
-            source_text_clean = source_text.strip()
+    # Posición de la unidad -> <target> serializado que hay que escribir
+    new_targets: Dict[int, bytes] = dict(plan.kept_targets)
+    for position, target in catalog.verbatim_targets.items():
+        new_targets.setdefault(position, target)
+    
+    # Aplicar las traducciones en el orden del documento
+    for index, ((position, source_text, source_text_clean), translated_text) in enumerate(zip(plan.units_to_translate, translated_texts)):
+        inline_elements = catalog.inline_elements.get(position)
+        # Una traducción guardada antes de validar los tokens no debe romper la estructura
+        if inline_elements and translated_text and not inline_tokens_preserved(source_text_clean, translated_text):
+            translated_text = None
+        if translated_text and (translated_text != source_text_clean or translator.is_glossary_only(source_text_clean)):
+            successful_translations += 1
             
-            # Solo traducir textos que no contengan elementos XML complejos y no estén vacíos
-            # ElementTree ya maneja las entidades HTML, así que no necesitamos buscar '<x id=' o '</'
-            if not source_text_clean:
-                skipped_translations += 1
-                continue
+            # Preservar espacios del texto original
+            if source_text.startswith(' ') and not translated_text.startswith(' '):
+                translated_text = ' ' + translated_text
+            if source_text.endswith(' ') and not translated_text.endswith(' '):
+                translated_text = translated_text + ' '
             
-            # Verificar si ya tiene target
-            if target_element is None:
-                # Traducir el texto
-                translated_text = translator.translate_text(source_text_clean, target_lang)
-                
-                if translated_text and translated_text != source_text_clean:
-                    successful_translations += 1
-                    
-                    # Preservar espacios del texto original
-                    if source_text.startswith(' ') and not translated_text.startswith(' '):
-                        translated_text = ' ' + translated_text
-                    if source_text.endswith(' ') and not translated_text.endswith(' '):
-                        translated_text = translated_text + ' '
-                    
-                    # Añadir elemento target
-                    new_target_element = ET.SubElement(trans_unit, target_tag)
-                    new_target_element.text = translated_text
-                else:
-                    # Si no se pudo traducir o la traducción es igual al original, añadir a faltantes
-                    unit_id = trans_unit.get('id', 'unknown')
-                    missing_translations.append((unit_id, source_text_clean))
-            else:
-                # Ya tiene target, verificar si necesita actualización
-                current_target = target_element.text.strip() if target_element.text else ""
-                
-                # Solo actualizar si el target está vacío o es igual al source
-                if not current_target or current_target == source_text_clean:
-                    translated_text = translator.translate_text(source_text_clean, target_lang)
-                    
-                    if translated_text and translated_text != source_text_clean:
-                        successful_translations += 1
-                        
-                        # Preservar espacios
-                        if source_text.startswith(' ') and not translated_text.startswith(' '):
-                            translated_text = ' ' + translated_text
-                        if source_text.endswith(' ') and not translated_text.endswith(' '):
-                            translated_text = translated_text + ' '
-                        
-                        # Actualizar target
-                        target_element.text = translated_text
-                    else:
-                        unit_id = trans_unit.get('id', 'unknown')
-                        print(f"✗ Failed to update: '{source_text_clean}' (ID: {unit_id})")
-                        missing_translations.append((unit_id, source_text_clean))
+            new_targets[position] = build_target(translated_text, inline_elements)
         else:
-            # Si no hay source_element o source_text, saltar
-            skipped_translations += 1
-            
-    # Escribir el archivo actualizado
-    # Usamos ET.tostring para obtener el XML como string y luego lo escribimos
-    # ET.indent para un formato legible (Python 3.9+)
-    try:
-        ET.indent(tree, space="  ", level=0) # Para un formato legible
-    except AttributeError:
-        # Fallback para versiones de Python < 3.9
-        pass 
-    
-    # Asegurarse de que la declaración XML esté presente y el encoding sea UTF-8
-    xml_declaration = '<?xml version="1.0" encoding="UTF-8" ?>\n'
+            unit_id = catalog.unit_ids[position] or 'unknown'
+            if catalog.spans[position].target_start is not None:
+                print(f"✗ Failed to update: '{source_text_clean}' (ID: {unit_id})")
+            # Si no se pudo traducir o la traducción es igual al original, añadir a faltantes
+            if index in skipped_units:
+                pending_units.append((unit_id, source_text_clean))
+                pending_positions.append(position)
+            elif index in failed_units:
+                retry_failures.append((unit_id, source_text_clean))
+            else:
+                missing_translations.append((unit_id, source_text_clean))
     
-    # ET.tostring devuelve bytes, necesitamos decodificarlo a string
-    # y luego añadir la declaración XML
-    content_str = ET.tostring(root, encoding='utf-8', xml_declaration=False).decode('utf-8')
-    final_content = xml_declaration + content_str
+    # Lo que el límite de tiempo no llegó a enviar queda pendiente para la próxima
+    # ejecución; lo que falló antes sigue contando como fallo
+    pending_translations = len(pending_units)
+    failed_translations = len(missing_translations) + len(retry_failures)
     
-    with open(output_file, 'w', encoding='utf-8') as f:
-        f.write(final_content)
+    # Escribir el archivo actualizado copiando el original y modificando solo las
+    # unidades afectadas, de modo que el diff muestre únicamente los targets cambiados
+    patches = []
+    for position, span in enumerate(catalog.spans):
+        inserted = []
+        if plan.incremental and catalog.fingerprints[position] is not None:
+            # Guardar la huella del source para la próxima fusión
+            inserted.append(f'<note priority="1" from="{SOURCE_FINGERPRINT_NOTE}">{catalog.fingerprints[position]}</note>'.encode('utf-8'))
+        target = new_targets.get(position)
+        if target is not None:
+            if span.target_start is not None:
+                patches.append((span.target_start, span.target_end, target))
+            else:
+                inserted.append(target)
+        if inserted:
+            patches.append((span.insert_at, span.insert_at, b''.join(b'\n' + span.child_indent + element for element in inserted)))
+    patches.sort(key=lambda patch: patch[0])
+    write_patched_copy(catalog.source_file_path, output_file, patches, catalog.source_signature)
     
     # Actualizar el archivo de registro con traducciones faltantes
     with open(log_file, 'a', encoding='utf-8') as log:
@@ -483,9 +3742,17 @@ def translate_xlf_file_automatic(source_file_path: str, target_lang: str, output
         log.write(f"Total strings found: {total_translations}\n")
         log.write(f"Successfully translated: {successful_translations}\n")
         log.write(f"Skipped (complex/empty): {skipped_translations}\n")
-        log.write(f"Failed translations: {len(missing_translations)}\n")
+        log.write(f"Failed translations: {failed_translations}\n")
+        if retry_failures:
+            log.write(f"Kept failing after retries: {len(retry_failures)}\n")
+        if pending_translations:
+            log.write(f"Pending (time budget exhausted): {pending_translations}\n")
         
-        translatable_strings = total_translations - skipped_translations
+        if plan.incremental:
+            log.write(f"Kept from existing file: {len(plan.kept_targets)}\n")
+            log.write(f"Obsolete units dropped: {len(plan.obsolete_ids)}\n")
+        
+        translatable_strings = total_translations - skipped_translations - plan.kept_translatable
         if translatable_strings > 0:
             success_rate = (successful_translations / translatable_strings) * 100
             log.write(f"Success rate: {success_rate:.1f}%\n\n")
@@ -498,57 +3765,448 @@ def translate_xlf_file_automatic(source_file_path: str, target_lang: str, output
                 log.write(f"ID: {unit_id}\n")
                 log.write(f"Source: {source_text[:100]}{'...' if len(source_text) > 100 else ''}\n")
                 log.write("-" * 50 + "\n")
+        
+        if pending_units:
+            log.write("\n=== Pending Translations ===\n")
+            for unit_id, source_text in pending_units:
+                log.write(f"ID: {unit_id}\n")
+                log.write(f"Source: {source_text[:100]}{'...' if len(source_text) > 100 else ''}\n")
+                log.write("-" * 50 + "\n")
+        
+        if retry_failures:
+            log.write("\n=== Kept Failing After Retries ===\n")
+            for unit_id, source_text in retry_failures:
+                log.write(f"ID: {unit_id}\n")
+                log.write(f"Source: {source_text[:100]}{'...' if len(source_text) > 100 else ''}\n")
+                log.write("-" * 50 + "\n")
+        
+        if proposals:
+            log.write("\n=== Similar Translations (review) ===\n")
+            for source_text, match in proposals.items():
+                log.write(f"Source: {source_text[:100]}{'...' if len(source_text) > 100 else ''}\n")
+                log.write(f"Similar ({match.similarity:.0%}): {match.source[:100]}{'...' if len(match.source) > 100 else ''}\n")
+                log.write(f"Its translation: {match.target[:100]}{'...' if len(match.target) > 100 else ''}\n")
+                log.write("-" * 50 + "\n")
     
     print(f"\n=== Translation Summary ===")
     print(f"Total strings found: {total_translations}")
     print(f"Successfully translated: {successful_translations}")
     print(f"Skipped (complex/empty): {skipped_translations}")
-    print(f"Failed translations: {len(missing_translations)}")
+    print(f"Failed translations: {failed_translations}")
+    if retry_failures:
+        print(f"Kept failing after retries: {len(retry_failures)} (see log file for details)")
+    if proposals:
+        print(f"Similar translations to review: {len(proposals)} (see log file for details)")
+    if pending_translations:
+        print(f"⏰ Time budget exhausted: {pending_translations} units still pending (run again to continue)")
+        if translator.priority is not None and translator.priority.patterns:
+            levels = collections.Counter(
+                translator.priority.rank(catalog.sourcefiles[position], '')[0] for position in pending_positions
+            )
+            names = translator.priority.patterns + ['other']
+            print("  Pending by priority: " + ', '.join(f"{names[level]}: {levels[level]}" for level in range(len(names))))
+    if plan.incremental:
+        print(f"Kept from existing file: {len(plan.kept_targets)}")
+        print(f"Obsolete units dropped: {len(plan.obsolete_ids)}")
     if translatable_strings > 0:
         success_rate = (successful_translations / translatable_strings) * 100
         print(f"Success rate: {success_rate:.1f}%")
     print(f"File saved: {output_file}")
-    print(f"Missing translations: {len(missing_translations)} (see log file for details)")
+    print(f"Missing translations: {failed_translations + pending_translations} (see log file for details)")
+    if translator.translation_memory is not None:
+        tm = translator.translation_memory
+        print(f"Translation memory: {tm.hits} hits, {tm.misses} misses ({tm.db_path})")
+    if translator.hedge:
+        stats = translator.hedge_stats
+        print(f"Hedged requests: {stats['hedged']} of {stats['requests']} ({stats['won']} won by the backup)")
+    if translator.retry_stats['deferred']:
+        stats = translator.retry_stats
+        print(f"Deferred retries: {stats['deferred']} segments queued, {stats['retried']} retried, "
+              f"{stats['recovered']} recovered, {stats['gave_up']} gave up")
+    print("Backend health:")
+    for line in translator.router.summary():
+        print(f"  {line}")
+    
+    return {
+        'units': max(0, translatable_strings),
+        'translated': successful_translations,
+        'failed': failed_translations,
+        'retry_failed': len(retry_failures),
+        'pending': pending_translations,
+    }
 
-def translate_all_languages(source_file_path: str, output_dir: str = None):
+def translate_all_languages(source_file_path: str, output_dir: str = None,
+                            translation_memory_path: str = None, languages: List[str] = None,
+                            incremental: bool = False, dry_run: bool = False, metrics_dir: str = None,
+                            resume: bool = False, bundles: bool = True, trace_file: str = None,
+                            **translator_options):
     """
     Traduce el archivo base a todos los idiomas soportados.
+    
+    El archivo de origen se parsea una sola vez y todos los idiomas comparten el
+    mismo traductor (caché, textos enmascarados, memoria de traducción y límites
+    por backend). Antes de cualquier petición se planifica el trabajo de todos los
+    idiomas; con dry_run=True solo se muestra ese plan. Los idiomas se traducen y
+    se escriben en paralelo, cada uno con su diario de unidades traducidas para
+    poder reanudar (resume=True) una ejecución interrumpida. Las métricas de todos
+    los idiomas se escriben juntas en metrics_dir (por defecto RUN_STATE_DIRNAME).
+    Con bundles=True se generan además los bundles JSON de cada idioma, y con
+    trace_file la traza de la ejecución (ver RunTracer).
+    Devuelve un resumen de la ejecución (ver _run_summary).
     """
-    languages = ['en', 'fr', 'ru']
+    if languages is None:
+        languages = list(SUPPORTED_LANGUAGES)
+    if output_dir is None:
+        output_dir = os.path.dirname(source_file_path)
+    if translation_memory_path is None:
+        translation_memory_path = os.path.join(_run_state_dir(), TRANSLATION_MEMORY_FILENAME)
     
     print(f"🌍 Starting translation to all languages...")
     print(f"📁 Source file: {source_file_path}")
     
-    for lang in languages:
-        print(f"\n{'='*50}")
-        print(f"🔄 Translating to {lang.upper()}...")
-        print(f"{'='*50}")
-        
+    translation_memory = TranslationMemory(translation_memory_path)
+    translator = AutomaticTranslator(translation_memory, **translator_options)
+    if trace_file:
+        translator.metrics.tracer = RunTracer()
+    try:
+        with translator.metrics.stage('parse'):
+            catalog = ParsedCatalog(source_file_path)
+        results = _translate_languages_with(translator, catalog, output_dir, languages, incremental, dry_run, resume)
+        if not dry_run:
+            if bundles:
+                _write_bundles(translator, source_file_path, output_dir, list(results))
+            _write_metrics_reports(translator, results, metrics_dir or _run_state_dir())
+        summary = _run_summary(translator, results)
+    finally:
+        translator.close()
+        translation_memory.close()
+        if trace_file:
+            translator.metrics.tracer.write(trace_file)
+    
+    if not dry_run:
+        print(f"\n🎉 All translations completed!")
+    return summary
+
+def _translate_languages_with(translator: AutomaticTranslator, catalog: ParsedCatalog, output_dir: str,
+                              languages: List[str], incremental: bool = False, dry_run: bool = False,
+                              resume: bool = False, log_dir: Optional[str] = None) -> Dict[str, Dict[str, int]]:
+    """
+    Planifica, traduce y escribe en paralelo los idiomas de un catálogo ya
+    parseado con un traductor ya configurado. Los registros de cada idioma van a
+    log_dir (por defecto output_dir). Devuelve los recuentos de
+    _write_translated_catalog por idioma (vacío con dry_run=True).
+    """
+    metrics = translator.metrics
+    
+    def translate_language(lang: str) -> Dict[str, int]:
+        plan = translation_plan.language_plans[lang]
+        print(f"🔄 Translating to {lang.upper()} ({len(plan.units_to_translate)} units)...")
+        with metrics.stage('translate'):
+            translated_texts = translator.translate_prepared(translation_plan.batches[lang],
+                                                             plan.journal_writer(catalog, journals[lang]))
+        with metrics.stage('write'):
+            batch = translation_plan.batches[lang]
+            result = _write_translated_catalog(translator, catalog, plan, translated_texts, output_dir,
+                                               batch.failed_units, batch.proposals, batch.skipped_units, log_dir)
+        journals[lang].discard()
+        return result
+    
+    results: Dict[str, Dict[str, int]] = {}
+    journals: Dict[str, TranslationJournal] = {}
+    try:
+        with metrics.stage('parse'):
+            language_plans = [LanguagePlan(catalog, lang, output_dir, incremental) for lang in languages]
+            for plan in language_plans:
+                journals[plan.target_lang] = TranslationJournal(_journal_path(plan.output_file), plan.target_lang, resume)
+                plan.resume_from(catalog, journals[plan.target_lang])
+        with metrics.stage('mask'):
+            translation_plan = TranslationPlan(translator, catalog, language_plans)
+        translation_plan.print_summary()
+        if dry_run:
+            return results
+        with ThreadPoolExecutor(max_workers=len(languages)) as pool:
+            futures = {lang: pool.submit(translate_language, lang) for lang in languages}
+            for lang, future in futures.items():
+                try:
+                    results[lang] = future.result()
+                    print(f"✅ {lang.upper()} translation completed!")
+                except Exception as e:
+                    print(f"❌ Error translating to {lang}: {e}")
+    finally:
+        # Los diarios de los idiomas que no llegaron a escribirse se conservan para --resume
+        for journal in journals.values():
+            journal.close()
+    return results
+
+def watch_translations(source_file_path: str, output_dir: str = None, translation_memory_path: str = None,
+                       languages: List[str] = None, metrics_dir: str = None, resume: bool = False,
+                       bundles: bool = True, poll_interval: float = WATCH_POLL_INTERVAL, trace_file: str = None,
+                       stop: Optional[threading.Event] = None, **translator_options):
+    """
+    Modo watch: vigila el archivo de origen (p. ej. tras cada ng extract-i18n) y
+    actualiza los archivos de idioma en cuanto cambia.
+    
+    El traductor vive durante toda la sesión, así que la caché, los textos
+    enmascarados, la memoria aproximada y las conexiones HTTP se mantienen
+    calientes entre actualizaciones. Cada actualización vuelve a leer en streaming
+    el archivo de origen y los archivos de idioma, y es incremental: solo se
+    traducen las trans-unit nuevas o cuyo source cambió, y con bundles=True se
+    regeneran los bundles JSON de los idiomas. Las métricas se reinician en cada
+    actualización (ver AutomaticTranslator.start_run), así que los informes, su
+    duración y el resumen que se muestra corresponden solo a esa actualización.
+    Los registros de cada idioma se escriben junto a las métricas (metrics_dir,
+    por defecto RUN_STATE_DIRNAME) y no en el directorio de salida, que puede ser
+    el de los assets de la aplicación. El archivo se comprueba por tamaño y fecha
+    de modificación cada poll_interval segundos y se procesa cuando deja de
+    cambiar entre dos comprobaciones. Con trace_file la traza de la sesión se
+    reescribe tras cada actualización. Termina con Ctrl+C o al activarse stop.
+    """
+    if languages is None:
+        languages = list(SUPPORTED_LANGUAGES)
+    if output_dir is None:
+        output_dir = os.path.dirname(source_file_path)
+    if translation_memory_path is None:
+        translation_memory_path = os.path.join(_run_state_dir(), TRANSLATION_MEMORY_FILENAME)
+    
+    if stop is None:
+        stop = threading.Event()
+    state_dir = metrics_dir or _run_state_dir()
+    
+    translation_memory = TranslationMemory(translation_memory_path)
+    translator = AutomaticTranslator(translation_memory, **translator_options)
+    if trace_file:
+        translator.metrics.tracer = RunTracer()
+    print(f"👀 Watching {source_file_path} for changes ({', '.join(languages)}; Ctrl+C to stop)...")
+    
+    processed = None
+    previous_units: Optional[Dict[Optional[str], Optional[str]]] = None
+    try:
+        while not stop.is_set():
+            try:
+                signature = _file_signature(source_file_path)
+            except FileNotFoundError:
+                signature = None
+            if signature is None or signature == processed:
+                stop.wait(poll_interval)
+                continue
+            # El archivo puede estar escribiéndose todavía: se espera a que no cambie
+            if stop.wait(poll_interval):
+                break
+            try:
+                if _file_signature(source_file_path) != signature:
+                    continue
+            except FileNotFoundError:
+                continue
+            processed = signature
+            
+            translator.start_run()
+            try:
+                with translator.metrics.stage('parse'):
+                    catalog = ParsedCatalog(source_file_path)
+            except (xml.parsers.expat.ExpatError, ET.ParseError, ValueError, OSError) as e:
+                print(f"⚠️  Could not parse {source_file_path}: {e} (waiting for the next change)")
+                continue
+            
+            units = dict(zip(catalog.unit_ids, catalog.fingerprints))
+            if previous_units is not None:
+                added = sum(1 for unit_id in units if unit_id not in previous_units)
+                changed = sum(1 for unit_id, fingerprint in units.items()
+                              if unit_id in previous_units and previous_units[unit_id] != fingerprint)
+                removed = sum(1 for unit_id in previous_units if unit_id not in units)
+                print(f"\n🔔 {os.path.basename(source_file_path)} changed: {added} new, {changed} modified, "
+                      f"{removed} removed trans-units")
+            previous_units = units
+            
+            results = _translate_languages_with(translator, catalog, output_dir, languages, incremental=True,
+                                                resume=resume, log_dir=state_dir)
+            resume = False
+            translation_memory.flush()
+            if bundles:
+                _write_bundles(translator, source_file_path, output_dir, list(results))
+            _write_metrics_reports(translator, results, state_dir)
+            if trace_file:
+                translator.metrics.tracer.write(trace_file)
+            print(f"⚡ Locale files updated: {_summary_line(_run_summary(translator, results))}; watching for changes...")
+    except KeyboardInterrupt:
+        print("\n👋 Stopped watching")
+    finally:
+        translator.close()
+        translation_memory.close()
+
+@contextlib.contextmanager
+def profile_run(dump_path: str, top: int = PROFILE_TOP):
+    """
+    Perfila el bloque con cProfile y tracemalloc (opción --profile).
+    
+    cProfile solo ve el hilo que lo activa, así que cada hilo nuevo (pool de
+    traducción, escritura por idioma) recibe su propio perfilador y al terminar se
+    suman todos. Se muestran las funciones con más tiempo acumulado y las líneas
+    que más memoria reservan; las estadísticas completas quedan en dump_path para
+    abrirlas con pstats o snakeviz.
+    """
+    profilers: List[cProfile.Profile] = []
+    lock = threading.Lock()
+    
+    def profile_thread(*_):
+        profiler = cProfile.Profile()
         try:
-            translate_xlf_file_automatic(source_file_path, lang, output_dir)
-            print(f"✅ {lang.upper()} translation completed!")
-        except Exception as e:
-            print(f"❌ Error translating to {lang}: {e}")
+            profiler.enable()
+        except ValueError:
+            # Python 3.12+ (sys.monitoring): el perfilador principal ya ve todos los hilos
+            sys.setprofile(None)
+            return
+        with lock:
+            profilers.append(profiler)
     
-    print(f"\n🎉 All translations completed!")
+    tracemalloc.start()
+    main_profiler = cProfile.Profile()
+    threading.setprofile(profile_thread)
+    main_profiler.enable()
+    try:
+        yield
+    finally:
+        main_profiler.disable()
+        threading.setprofile(None)
+        current, peak = tracemalloc.get_traced_memory()
+        snapshot = tracemalloc.take_snapshot().filter_traces((tracemalloc.Filter(False, tracemalloc.__file__),))
+        tracemalloc.stop()
+        
+        stats = pstats.Stats(main_profiler)
+        with lock:
+            for profiler in profilers:
+                stats.add(profiler)
+        directory = os.path.dirname(os.path.abspath(dump_path))
+        os.makedirs(directory, exist_ok=True)
+        stats.dump_stats(dump_path)
+        
+        print(f"\n🔬 Profile ({len(profilers) + 1} threads): top {top} functions by cumulative time")
+        stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(top)
+        print(f"🧠 Memory: {current / 1024 / 1024:.1f} MiB still allocated, {peak / 1024 / 1024:.1f} MiB peak; "
+              f"top {top} allocation sites:")
+        for statistic in snapshot.statistics('lineno')[:top]:
+            print(f"   {statistic}")
+        print(f"💾 Profile data: {dump_path} (python -m pstats {dump_path})")
+
+def parse_priority_patterns(value: str) -> List[str]:
+    """Convierte 'login,funds,orders' en la lista de patrones de UnitPriority."""
+    patterns = [pattern.strip() for pattern in value.split(',') if pattern.strip()]
+    if not patterns:
+        raise argparse.ArgumentTypeError(f"Prioridad inválida: '{value}' (use patrones separados por comas, p. ej. login,funds)")
+    return patterns
+
+def parse_backend_limits(value: str) -> Dict[str, int]:
+    """Convierte 'google=8,mymemory=2' en un diccionario de límites por backend."""
+    limits = {}
+    for item in value.split(','):
+        backend, _, limit = item.partition('=')
+        backend = backend.strip()
+        if backend not in BACKEND_CONCURRENCY or not limit.strip().isdigit():
+            raise argparse.ArgumentTypeError(f"Límite inválido: '{item}' (use backend=N con backend en {', '.join(BACKEND_CONCURRENCY)})")
+        limits[backend] = int(limit)
+    return limits
+
+def parse_backend_rates(value: str) -> Dict[str, Tuple[float, int]]:
+    """Convierte 'google=5:10,mymemory=1' en (peticiones/segundo, ráfaga) por backend."""
+    rates = {}
+    for item in value.split(','):
+        backend, _, spec = item.partition('=')
+        backend = backend.strip()
+        rate, _, burst = spec.partition(':')
+        try:
+            if backend not in BACKEND_RATE_LIMITS:
+                raise ValueError(backend)
+            rate_value = float(rate)
+            burst_value = int(burst) if burst else BACKEND_RATE_LIMITS[backend][1]
+            if rate_value <= 0 or burst_value < 1:
+                raise ValueError(spec)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"Límite inválido: '{item}' (use backend=peticiones_por_segundo[:ráfaga])")
+        rates[backend] = (rate_value, burst_value)
+    return rates
 
 if __name__ == "__main__":
-    if len(sys.argv) < 2:
-        print("Uso:")
-        print("  python auto_translate_complete.py <archivo.xlf> [idioma]")
-        print("  python auto_translate_complete.py <archivo.xlf> all")
-        print("")
-        print("Idiomas soportados: en, fr, ru, all")
-        print("")
-        print("Ejemplos:")
-        print("  python auto_translate_complete.py src/locale/messages.xlf en")
-        print("  python auto_translate_complete.py src/locale/messages.xlf all")
-        print("")
-        print("El script creará copias del archivo original para cada idioma")
-        print("sin modificar el archivo fuente.")
-        sys.exit(1)
+    parser = argparse.ArgumentParser(
+        description="Traduce automáticamente un archivo XLIFF usando APIs gratuitas.",
+        epilog="Ejemplos:\n"
+               "  python auto_translate_complete.py src/locale/messages.xlf en\n"
+               "  python auto_translate_complete.py src/locale/messages.xlf all\n\n"
+               "El script creará copias del archivo original para cada idioma\n"
+               "sin modificar el archivo fuente.",
+        formatter_class=argparse.RawDescriptionHelpFormatter,
+    )
+    parser.add_argument('source_file', help="Archivo XLIFF de origen")
+    parser.add_argument('language', nargs='?', default=None,
+                        help="Idioma destino: en, fr, ru, all (por defecto todos)")
+    parser.add_argument('--concurrency', type=parse_backend_limits, default=None,
+                        help="Peticiones simultáneas por backend, p. ej. google=8,mymemory=2")
+    parser.add_argument('--rate-limit', type=parse_backend_rates, default=None,
+                        help="Peticiones por segundo y ráfaga por backend, p. ej. google=5:10,mymemory=1")
+    parser.add_argument('--incremental', action='store_true',
+                        help="Fusionar con los archivos de idioma existentes y traducir solo unidades nuevas o modificadas")
+    parser.add_argument('--priority', type=parse_priority_patterns, default=None, metavar='PATRONES',
+                        help="Traducir primero las unidades de estos archivos de origen, en orden, p. ej. login,funds,orders")
+    parser.add_argument('--shortest-first', action='store_true',
+                        help="Dentro de cada prioridad, traducir antes los textos cortos")
+    parser.add_argument('--time-budget', type=float, default=None, metavar='SEGUNDOS',
+                        help="Dejar de enviar peticiones al agotar este tiempo y escribir lo traducido hasta entonces")
+    parser.add_argument('--glossary', default=None, metavar='ARCHIVO',
+                        help="Glosario JSON de términos protegidos y traducciones forzadas "
+                             f"(por defecto {GLOSSARY_FILENAME} junto a este script, si existe)")
+    parser.add_argument('--no-glossary', action='store_true',
+                        help=f"No usar ningún glosario, ni siquiera {GLOSSARY_FILENAME}")
+    parser.add_argument('--no-bundles', action='store_true',
+                        help=f"No generar los bundles JSON por idioma ({BUNDLE_DIRNAME}/{BUNDLE_MANIFEST_FILENAME}) "
+                             "para cargar las traducciones en tiempo de ejecución")
+    parser.add_argument('--no-fuzzy', action='store_true',
+                        help="No reutilizar traducciones de textos casi idénticos (memoria aproximada)")
+    parser.add_argument('--resume', action='store_true',
+                        help="Reanudar una ejecución interrumpida con las unidades ya anotadas en su diario")
+    parser.add_argument('--watch', action='store_true',
+                        help="Vigilar el archivo de origen y actualizar los archivos de idioma en cada cambio "
+                             "(modo incremental; termina con Ctrl+C)")
+    parser.add_argument('--dry-run', action='store_true',
+                        help="Mostrar el plan (segmentos únicos, peticiones y tiempo estimados) sin traducir")
+    parser.add_argument('--hedge', nargs='?', type=float, const=HEDGE_PERCENTILE * 100, default=None, metavar='PERCENTIL',
+                        help="Reenviar a un segundo backend las peticiones más lentas que este percentil "
+                             f"de la latencia reciente (por defecto {HEDGE_PERCENTILE * 100:.0f})")
+    parser.add_argument('--hedge-budget', type=float, default=HEDGE_MAX_RATIO, metavar='FRACCIÓN',
+                        help=f"Fracción máxima de peticiones extra por hedging (por defecto {HEDGE_MAX_RATIO})")
+    parser.add_argument('--metrics-dir', default=None, metavar='DIRECTORIO',
+                        help=f"Directorio de {METRICS_REPORT_FILENAME} y {METRICS_TEXTFILE_FILENAME} "
+                             f"(por defecto {RUN_STATE_DIRNAME} junto a este script)")
+    parser.add_argument('--trace', default=None, metavar='ARCHIVO',
+                        help="Escribir la traza de la ejecución (fases, lotes, peticiones y esperas) en formato "
+                             "Chrome trace-event JSON, para abrirla en ui.perfetto.dev o chrome://tracing")
+    parser.add_argument('--profile', action='store_true',
+                        help="Perfilar la ejecución con cProfile y tracemalloc y mostrar las funciones y líneas "
+                             f"más costosas (volcado en {PROFILE_FILENAME} junto a las métricas)")
+    args = parser.parse_args()
     
-    source_file_path = sys.argv[1]
+    source_file_path = args.source_file
+    run_options = {'concurrency': args.concurrency, 'rate_limits': args.rate_limit,
+                   'incremental': args.incremental, 'dry_run': args.dry_run, 'metrics_dir': args.metrics_dir,
+                   'resume': args.resume, 'bundles': not args.no_bundles}
+    if args.trace:
+        run_options['trace_file'] = args.trace
+    if args.priority or args.shortest_first:
+        run_options['priority'] = UnitPriority(args.priority, args.shortest_first)
+    if args.no_fuzzy:
+        run_options['fuzzy'] = False
+    if args.no_glossary:
+        run_options['glossary'] = False
+    elif args.glossary:
+        try:
+            run_options['glossary'] = Glossary.load(args.glossary)
+        except (OSError, ValueError) as e:
+            parser.error(f"No se pudo leer el glosario {args.glossary}: {e}")
+    if args.time_budget is not None:
+        if args.time_budget <= 0:
+            parser.error("--time-budget debe ser un número de segundos mayor que 0")
+        run_options['time_budget'] = args.time_budget
+    if args.hedge is not None:
+        if not 0 < args.hedge < 100:
+            parser.error("--hedge debe ser un percentil entre 0 y 100")
+        run_options.update(hedge=True, hedge_percentile=args.hedge / 100, hedge_max_ratio=args.hedge_budget)
     
     # Verificar que el archivo existe
     try:
@@ -558,43 +4216,60 @@ if __name__ == "__main__":
         print(f"❌ Error: Archivo {source_file_path} no encontrado")
         sys.exit(1)
     
-    if len(sys.argv) >= 3:
-        language = sys.argv[2]
+    # El directorio de estado solo se crea si de verdad se va a perfilar
+    if args.profile:
+        profiling = profile_run(os.path.join(args.metrics_dir or _run_state_dir(), PROFILE_FILENAME))
+    else:
+        profiling = contextlib.nullcontext()
+    with profiling:
+        if args.watch:
+            if args.dry_run or args.time_budget is not None:
+                parser.error("--watch no se puede combinar con --dry-run ni con --time-budget")
+            if args.language not in (None, 'all') and args.language not in SUPPORTED_LANGUAGES:
+                print("❌ Idioma no soportado. Use: en, fr, ru, all")
+                sys.exit(1)
+            watch_options = {key: value for key, value in run_options.items() if key not in ('incremental', 'dry_run')}
+            languages = [args.language] if args.language in SUPPORTED_LANGUAGES else None
+            watch_translations(source_file_path, languages=languages, **watch_options)
+            sys.exit(0)
         
-        if language == 'all':
-            print(f"🚀 Iniciando traducción automática a TODOS los idiomas")
-            print("⚠️  Este proceso puede tomar varios minutos...")
-            print("💡 Se usarán múltiples APIs de traducción como fallback")
+        if args.language is not None:
+            language = args.language
             
-            try:
-                translate_all_languages(source_file_path)
-                print(f"\n✅ Todas las traducciones completadas")
-            except Exception as e:
-                print(f"\n❌ Error durante las traducciones: {e}")
+            if language == 'all':
+                print(f"🚀 Iniciando traducción automática a TODOS los idiomas")
+                print("⚠️  Este proceso puede tomar varios minutos...")
+                print("💡 Se usarán múltiples APIs de traducción como fallback")
+                
+                try:
+                    translate_all_languages(source_file_path, **run_options)
+                    print("\n📋 Plan calculado (--dry-run), no se tradujo nada" if args.dry_run else "\n✅ Todas las traducciones completadas")
+                except Exception as e:
+                    print(f"\n❌ Error durante las traducciones: {e}")
+                    sys.exit(1)
+            
+            elif language in SUPPORTED_LANGUAGES:
+                print(f"🚀 Iniciando traducción automática a {language}")
+                print("⚠️  Este proceso puede tomar varios minutos...")
+                print("💡 Se usarán múltiples APIs de traducción como fallback")
+                
+                try:
+                    translate_xlf_file_automatic(source_file_path, language, **run_options)
+                    print("\n📋 Plan calculado (--dry-run), no se tradujo nada" if args.dry_run else f"\n✅ Traducción completada para {language}")
+                except Exception as e:
+                    print(f"\n❌ Error durante la traducción: {e}")
+                    sys.exit(1)
+            else:
+                print("❌ Idioma no soportado. Use: en, fr, ru, all")
                 sys.exit(1)
-        
-        elif language in ['en', 'fr', 'ru']:
-            print(f"🚀 Iniciando traducción automática a {language}")
+        else:
+            # Si no se especifica idioma, traducir a todos
+            print(f"🚀 No se especificó idioma, traduciendo a TODOS los idiomas")
             print("⚠️  Este proceso puede tomar varios minutos...")
-            print("💡 Se usarán múltiples APIs de traducción como fallback")
             
             try:
-                translate_xlf_file_automatic(source_file_path, language)
-                print(f"\n✅ Traducción completada para {language}")
+                translate_all_languages(source_file_path, **run_options)
+                print("\n📋 Plan calculado (--dry-run), no se tradujo nada" if args.dry_run else "\n✅ Todas las traducciones completadas")
             except Exception as e:
-                print(f"\n❌ Error durante la traducción: {e}")
+                print(f"\n❌ Error durante las traducciones: {e}")
                 sys.exit(1)
-        else:
-            print("❌ Idioma no soportado. Use: en, fr, ru, all")
-            sys.exit(1)
-    else:
-        # Si no se especifica idioma, traducir a todos
-        print(f"🚀 No se especificó idioma, traduciendo a TODOS los idiomas")
-        print("⚠️  Este proceso puede tomar varios minutos...")
-        
-        try:
-            translate_all_languages(source_file_path)
-            print(f"\n✅ Todas las traducciones completadas")
-        except Exception as e:
-            print(f"\n❌ Error durante las traducciones: {e}")
-            sys.exit(1)
@@ -0,0 +1,411 @@
+#!/usr/bin/env python3
+"""
+Benchmark sin conexión de auto_translate_complete.py.
+
+Levanta un servidor HTTP local que imita los protocolos de Google Translate
+(translate_a/single), MyMemory (/get) y LibreTranslate (/translate), con latencia,
+tasa de errores y respuestas 429 configurables, y ejecuta sobre el messages.xlf real
+los escenarios de translate_xlf_file_automatic y translate_all_languages.
+
+Cada escenario corre en un proceso aparte para medir su pico de memoria. Se
+informa del tiempo total, peticiones por unidad, aciertos de la memoria de
+traducción y memoria máxima; con --baseline se compara contra un informe anterior
+y se termina con código 1 si algún escenario empeora más de la tolerancia.
+
+Uso:
+    python benchmark_translate.py [--latency lognormal:0.08,0.5] [--error-rate 0.02]
+                                  [--json informe.json] [--baseline anterior.json]
+"""
+import os
+import sys
+import argparse
+import json
+import math
+import random
+import shutil
+import subprocess
+import tempfile
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Callable, Dict, List, Optional
+
+try:
+    import resource
+except ImportError:  # Windows: sin getrusage no se mide la memoria
+    resource = None
+
+import auto_translate_complete as translate
+
+DEFAULT_SOURCE_FILE = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'src', 'assets', 'locale', 'messages.xlf')
+
+# Escenarios: (nombre, idiomas o None para todos, reutiliza el directorio anterior)
+# Los escenarios "warm" repiten la ejecución con la memoria de traducción ya llena
+SCENARIOS = [
+    ('single-cold', ['fr'], False),
+    ('single-warm', ['fr'], True),
+    ('all-cold', None, False),
+    ('all-warm', None, True),
+]
+
+# Métricas comparadas con --baseline y si un valor mayor es peor
+REGRESSION_METRICS = {
+    'wall_seconds': True,
+    'requests_per_unit': True,
+    'peak_rss_mb': True,
+    'cache_hit_rate': False,
+}
+DEFAULT_TOLERANCE = 0.25
+
+def parse_latency(value: str) -> Callable[[random.Random], float]:
+    """
+    Interpreta un modelo de latencia (segundos):
+    'fixed:0.05', 'uniform:0.02,0.2' o 'lognormal:MEDIANA,SIGMA'.
+    """
+    kind, _, params = value.partition(':')
+    try:
+        numbers = [float(number) for number in params.split(',')] if params else []
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Latencia inválida: '{value}'")
+    if kind == 'fixed' and len(numbers) == 1:
+        delay = numbers[0]
+        return lambda rng: delay
+    if kind == 'uniform' and len(numbers) == 2:
+        low, high = numbers
+        return lambda rng: rng.uniform(low, high)
+    if kind == 'lognormal' and len(numbers) == 2:
+        median, sigma = numbers
+        return lambda rng: rng.lognormvariate(math.log(median), sigma)
+    raise argparse.ArgumentTypeError(
+        f"Latencia inválida: '{value}' (use fixed:S, uniform:MIN,MAX o lognormal:MEDIANA,SIGMA)"
+    )
+
+def parse_fraction(value: str) -> float:
+    """Interpreta una fracción entre 0 y 1 (tasa de errores o de 429)."""
+    try:
+        fraction = float(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Fracción inválida: '{value}'")
+    if not 0.0 <= fraction <= 1.0:
+        raise argparse.ArgumentTypeError(f"Fracción fuera de rango: '{value}' (use un valor entre 0 y 1)")
+    return fraction
+
+def fake_translate(text: str, target_lang: str) -> str:
+    """
+    Traducción simulada: antepone el idioma a cada línea no vacía, de modo que se
+    conservan los saltos de línea del modo por lotes y los marcadores enmascarados.
+    """
+    return '\n'.join(f'[{target_lang}] {line}' if line.strip() else line for line in text.split('\n'))
+
+class FakeTranslationServer:
+    """
+    Servidor local que responde como los tres backends de traducción.
+
+    Cada petición espera una latencia tomada del modelo configurado; una fracción
+    error_rate responde 500 y una fracción rate_limit_rate responde 429 con
+    Retry-After. Lleva la cuenta de peticiones y respuestas por backend.
+    """
+
+    def __init__(self, latency: Callable[[random.Random], float], error_rate: float = 0.0,
+                 rate_limit_rate: float = 0.0, retry_after: float = 1.0, seed: int = 0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.rate_limit_rate = rate_limit_rate
+        self.retry_after = retry_after
+        self._random = random.Random(seed)
+        self._lock = threading.Lock()
+        self.counts: Dict[str, int] = {}
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread: Optional[threading.Thread] = None
+
+    @property
+    def base_url(self) -> str:
+        host, port = self._server.server_address[:2]
+        return f'http://{host}:{port}'
+
+    def base_urls(self) -> Dict[str, str]:
+        """URL base de cada backend, en el formato de AutomaticTranslator(base_urls=...)."""
+        return {backend: f'{self.base_url}/{backend}' for backend in translate.BACKEND_BASE_URLS}
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever, daemon=True)
+        self._thread.start()
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def reset_counts(self) -> Dict[str, int]:
+        """Devuelve los contadores acumulados y los pone a cero."""
+        with self._lock:
+            counts, self.counts = self.counts, {}
+        return counts
+
+    def _draw(self):
+        """Decide la latencia y el resultado (ok, error o 429) de una petición."""
+        with self._lock:
+            delay = max(0.0, self.latency(self._random))
+            roll = self._random.random()
+        if roll < self.rate_limit_rate:
+            return delay, 429
+        if roll < self.rate_limit_rate + self.error_rate:
+            return delay, 500
+        return delay, 200
+
+    def _count(self, key: str):
+        with self._lock:
+            self.counts[key] = self.counts.get(key, 0) + 1
+
+    def _handler_class(self):
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def log_message(self, format, *args):
+                pass
+
+            def do_GET(self):
+                url = urllib.parse.urlparse(self.path)
+                query = urllib.parse.parse_qs(url.query, keep_blank_values=True)
+                if url.path == '/google/translate_a/single':
+                    self._answer('google', lambda: self._google(query))
+                elif url.path == '/mymemory/get':
+                    self._answer('mymemory', lambda: self._mymemory(query))
+                else:
+                    self._send(404, {'error': 'not found'})
+
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length') or 0)
+                form = urllib.parse.parse_qs(self.rfile.read(length).decode('utf-8'), keep_blank_values=True)
+                if urllib.parse.urlparse(self.path).path == '/libretranslate/translate':
+                    self._answer('libretranslate', lambda: self._libretranslate(form))
+                else:
+                    self._send(404, {'error': 'not found'})
+
+            def _answer(self, backend: str, build: Callable[[], object]):
+                delay, status = server._draw()
+                time.sleep(delay)
+                server._count(backend)
+                if status == 429:
+                    server._count('rate_limited')
+                    self._send(429, {'error': 'Too Many Requests'}, {'Retry-After': f'{server.retry_after:g}'})
+                elif status == 500:
+                    server._count('errors')
+                    self._send(500, {'error': 'Internal Server Error'})
+                else:
+                    self._send(200, build())
+
+            @staticmethod
+            def _google(query) -> list:
+                # Google devuelve la traducción troceada en frases: [[[traducido, original], ...], ...]
+                translated = fake_translate(query['q'][0], query['tl'][0])
+                return [[[line, None] for line in translated.splitlines(True)], None, query['sl'][0]]
+
+            @staticmethod
+            def _mymemory(query) -> dict:
+                target_lang = query['langpair'][0].split('|')[1]
+                return {'responseData': {'translatedText': fake_translate(query['q'][0], target_lang)}, 'responseStatus': 200}
+
+            @staticmethod
+            def _libretranslate(form) -> dict:
+                return {'translatedText': fake_translate(form['q'][0], form['target'][0])}
+
+            def _send(self, status: int, payload, headers: Optional[Dict[str, str]] = None):
+                body = json.dumps(payload).encode('utf-8')
+                self.send_response(status)
+                self.send_header('Content-Type', 'application/json')
+                self.send_header('Content-Length', str(len(body)))
+                for name, value in (headers or {}).items():
+                    self.send_header(name, value)
+                self.end_headers()
+                self.wfile.write(body)
+
+        return Handler
+
+def run_worker(config: Dict) -> Dict:
+    """
+    Ejecuta un escenario dentro del proceso actual (invocado como subproceso con
+    --worker) y devuelve sus métricas salvo las peticiones, que cuenta el servidor.
+    """
+    # La memoria de traducción y las métricas viven en el directorio del escenario
+    # (los escenarios en caliente reutilizan el del anterior)
+    translator_options = {
+        'base_urls': config['base_urls'],
+        'translation_memory_path': os.path.join(config['workdir'], translate.TRANSLATION_MEMORY_FILENAME),
+        'metrics_dir': config['workdir'],
+    }
+    if config.get('concurrency'):
+        translator_options['concurrency'] = translate.parse_backend_limits(config['concurrency'])
+    if config.get('rate_limit'):
+        translator_options['rate_limits'] = translate.parse_backend_rates(config['rate_limit'])
+
+    source_file = os.path.join(config['workdir'], 'messages.xlf')
+    start = time.perf_counter()
+    if config['languages'] is None:
+        summary = translate.translate_all_languages(source_file, **translator_options)
+    else:
+        summary = translate.translate_xlf_file_automatic(source_file, config['languages'][0], **translator_options)
+    wall_seconds = time.perf_counter() - start
+
+    peak_rss_mb = None
+    if resource is not None:
+        # ru_maxrss está en KiB en Linux y en bytes en macOS
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        peak_rss_mb = peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+    languages = summary['languages']
+    memory = summary['translation_memory']
+    lookups = memory['hits'] + memory['misses']
+    return {
+        'wall_seconds': wall_seconds,
+        'units': sum(stats['units'] for stats in languages.values()),
+        'translated': sum(stats['translated'] for stats in languages.values()),
+        'failed': sum(stats['failed'] for stats in languages.values()),
+        'cache_hit_rate': memory['hits'] / lookups if lookups else 0.0,
+        'peak_rss_mb': peak_rss_mb,
+    }
+
+def run_scenario(server: FakeTranslationServer, workdir: str, languages: Optional[List[str]],
+                 args: argparse.Namespace) -> Dict:
+    """Lanza un escenario en un subproceso y completa sus métricas con las del servidor."""
+    config = {
+        'workdir': workdir,
+        'languages': languages,
+        'base_urls': server.base_urls(),
+        'concurrency': args.concurrency,
+        'rate_limit': args.rate_limit,
+    }
+    result_file = os.path.join(workdir, 'benchmark-result.json')
+    server.reset_counts()
+    completed = subprocess.run(
+        [sys.executable, os.path.abspath(__file__), '--worker', json.dumps(config), result_file],
+        stdout=None if args.verbose else subprocess.DEVNULL,
+    )
+    if completed.returncode != 0:
+        raise RuntimeError(f"El escenario terminó con código {completed.returncode}")
+    counts = server.reset_counts()
+    with open(result_file, 'r', encoding='utf-8') as f:
+        metrics = json.load(f)
+
+    requests = sum(counts.get(backend, 0) for backend in translate.BACKEND_BASE_URLS)
+    metrics.update({
+        'requests': requests,
+        'requests_by_backend': {backend: counts.get(backend, 0) for backend in translate.BACKEND_BASE_URLS},
+        'server_errors': counts.get('errors', 0),
+        'rate_limited': counts.get('rate_limited', 0),
+        'requests_per_unit': requests / metrics['units'] if metrics['units'] else 0.0,
+    })
+    return metrics
+
+def run_benchmarks(args: argparse.Namespace) -> Dict[str, Dict]:
+    """Ejecuta todos los escenarios contra un servidor simulado y devuelve sus métricas."""
+    server = FakeTranslationServer(args.latency, args.error_rate, args.rate_limit_rate, args.retry_after, args.seed)
+    server.start()
+    results: Dict[str, Dict] = {}
+    root = tempfile.mkdtemp(prefix='translate-benchmark-')
+    try:
+        workdir = None
+        for name, languages, warm in SCENARIOS:
+            if args.scenario and name not in args.scenario:
+                continue
+            if not warm or workdir is None:
+                # Directorio nuevo: memoria de traducción vacía y copia limpia del origen
+                workdir = os.path.join(root, name)
+                os.makedirs(workdir)
+                shutil.copyfile(args.source_file, os.path.join(workdir, 'messages.xlf'))
+            print(f"⏱️  Running {name}...")
+            results[name] = run_scenario(server, workdir, languages, args)
+    finally:
+        server.close()
+        shutil.rmtree(root, ignore_errors=True)
+    return results
+
+def print_report(results: Dict[str, Dict]):
+    print(f"\n{'Scenario':<12} {'Wall (s)':>9} {'Units':>6} {'Requests':>9} {'Req/unit':>9} {'TM hits':>8} {'Failed':>7} {'Peak MB':>8}")
+    for name, metrics in results.items():
+        peak = f"{metrics['peak_rss_mb']:.1f}" if metrics['peak_rss_mb'] is not None else '-'
+        print(f"{name:<12} {metrics['wall_seconds']:>9.2f} {metrics['units']:>6} {metrics['requests']:>9} "
+              f"{metrics['requests_per_unit']:>9.3f} {metrics['cache_hit_rate']:>7.1%} {metrics['failed']:>7} {peak:>8}")
+
+def compare_with_baseline(results: Dict[str, Dict], baseline: Dict[str, Dict], tolerance: float) -> List[str]:
+    """Devuelve las regresiones respecto al informe base (una línea por métrica)."""
+    regressions = []
+    for name, metrics in results.items():
+        previous = baseline.get(name)
+        if not previous:
+            continue
+        for metric, higher_is_worse in REGRESSION_METRICS.items():
+            current, reference = metrics.get(metric), previous.get(metric)
+            if current is None or reference is None:
+                continue
+            if higher_is_worse:
+                worse = current > reference * (1 + tolerance) and current - reference > 1e-9
+            else:
+                worse = current < reference * (1 - tolerance)
+            if worse:
+                regressions.append(f"{name}: {metric} {reference:.3f} -> {current:.3f}")
+    return regressions
+
+if __name__ == "__main__":
+    if len(sys.argv) == 4 and sys.argv[1] == '--worker':
+        worker_result = run_worker(json.loads(sys.argv[2]))
+        with open(sys.argv[3], 'w', encoding='utf-8') as f:
+            json.dump(worker_result, f)
+        sys.exit(0)
+
+    parser = argparse.ArgumentParser(
+        description="Benchmark sin conexión del traductor automático contra un servidor de traducción simulado.",
+    )
+    parser.add_argument('--source-file', default=DEFAULT_SOURCE_FILE, help="Archivo XLIFF de origen (por defecto el messages.xlf del proyecto)")
+    parser.add_argument('--scenario', action='append', choices=[name for name, _, _ in SCENARIOS],
+                        help="Ejecutar solo este escenario (se puede repetir)")
+    parser.add_argument('--latency', type=parse_latency, default=parse_latency('lognormal:0.05,0.5'), metavar='MODELO',
+                        help="Latencia del servidor: fixed:S, uniform:MIN,MAX o lognormal:MEDIANA,SIGMA (por defecto lognormal:0.05,0.5)")
+    parser.add_argument('--error-rate', type=parse_fraction, default=0.0, help="Fracción de peticiones que responden 500")
+    parser.add_argument('--rate-limit-rate', type=parse_fraction, default=0.0, help="Fracción de peticiones que responden 429")
+    parser.add_argument('--retry-after', type=float, default=1.0, metavar='SEGUNDOS', help="Cabecera Retry-After de las respuestas 429")
+    parser.add_argument('--seed', type=int, default=0, help="Semilla de la latencia y los errores simulados")
+    parser.add_argument('--concurrency', type=str, default=None, metavar='BACKEND=N,...',
+                        help="Peticiones simultáneas por backend, como en auto_translate_complete.py")
+    parser.add_argument('--rate-limit', type=str, default=None, metavar='BACKEND=RPS[:RÁFAGA],...',
+                        help="Límite de peticiones por backend, como en auto_translate_complete.py")
+    parser.add_argument('--json', dest='json_file', default=None, metavar='ARCHIVO', help="Guardar las métricas en un archivo JSON")
+    parser.add_argument('--baseline', default=None, metavar='ARCHIVO', help="Informe JSON anterior con el que comparar")
+    parser.add_argument('--tolerance', type=float, default=DEFAULT_TOLERANCE,
+                        help=f"Empeoramiento relativo permitido frente a --baseline (por defecto {DEFAULT_TOLERANCE:g})")
+    parser.add_argument('--verbose', action='store_true', help="Mostrar la salida del traductor")
+    args = parser.parse_args()
+
+    # Validar las opciones del traductor antes de lanzar ningún escenario
+    for value, parse in ((args.concurrency, translate.parse_backend_limits), (args.rate_limit, translate.parse_backend_rates)):
+        if value:
+            try:
+                parse(value)
+            except argparse.ArgumentTypeError as e:
+                parser.error(str(e))
+
+    if not os.path.exists(args.source_file):
+        print(f"❌ Error: No se encontró el archivo {args.source_file}")
+        sys.exit(1)
+
+    benchmark_results = run_benchmarks(args)
+    print_report(benchmark_results)
+
+    if args.json_file:
+        with open(args.json_file, 'w', encoding='utf-8') as f:
+            json.dump(benchmark_results, f, indent=2)
+        print(f"💾 Métricas guardadas en {args.json_file}")
+
+    if args.baseline:
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline_results = json.load(f)
+        regressions = compare_with_baseline(benchmark_results, baseline_results, args.tolerance)
+        if regressions:
+            print(f"❌ Regresiones respecto a {args.baseline} (tolerancia {args.tolerance:.0%}):")
+            for line in regressions:
+                print(f"  {line}")
+            sys.exit(1)
+        print(f"✅ Sin regresiones respecto a {args.baseline}")
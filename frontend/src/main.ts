@@ -30,34 +30,73 @@ function getLanguage(): string {
   return 'es';
 }
 
-// --- El nuevo corazón del sistema ---
-
-// 1. Obtener el idioma actual
-const language = getLanguage();
+/**
+ * Carga las traducciones de un idioma desde su bundle JSON (generado por
+ * auto_translate_complete.py). El manifiesto se revalida en cada carga; el
+ * bundle lleva el hash de su contenido en el nombre, así que el navegador
+ * puede guardarlo en caché independientemente del código de la aplicación.
+ * @param language El código del idioma (ej. 'en').
+ * @returns Un mapa id -> traducción para loadTranslations.
+ */
+function loadTranslationBundle(language: string): Promise<{ [key: string]: string }> {
+  return fetch('assets/locale/bundles/manifest.json', { cache: 'no-cache' })
+    .then(response => {
+      if (!response.ok) {
+        throw new Error(`Could not find translation manifest. Status: ${response.status}`);
+      }
+      return response.json();
+    })
+    .then(manifest => {
+      const entry = manifest.locales?.[language];
+      if (!entry) {
+        throw new Error(`No translation bundle for ${language} in the manifest`);
+      }
+      return fetch(`assets/locale/bundles/${entry.file}`);
+    })
+    .then(response => {
+      if (!response.ok) {
+        throw new Error(`Could not find translation bundle for ${language}. Status: ${response.status}`);
+      }
+      return response.json();
+    })
+    .then(bundle => {
+      const translationPairs: { [key: string]: string } = {};
+      for (const [id, message] of Object.entries<string>(bundle.translations)) {
+        translationPairs[id] = message;
+        // Igual que desde el XLIFF: también con el formato :@@id: que es como Angular busca las traducciones
+        translationPairs[`:@@${id}:`] = message;
+      }
+      console.log(`✅ Loaded ${Object.keys(translationPairs).length} translations from bundle`);
+      return translationPairs;
+    });
+}
 
-// 2. Exponer una función global simple para cambiar de idioma
-if (typeof window !== 'undefined') {
-  (window as any).changeAppLanguage = (newLang: string) => {
-    if (['es', 'en', 'fr', 'ru'].includes(newLang)) {
-      localStorage.setItem('preferred-language', newLang);
-      window.location.reload();
+/**
+ * Texto de un <target> en el formato de traducciones de $localize, igual que
+ * runtime_message en auto_translate_complete.py: cada elemento en línea
+ * (<x id="INTERPOLATION"/>...) pasa a ser {$INTERPOLATION}.
+ * @param target El elemento <target> de una trans-unit.
+ * @returns El mensaje sin espacios exteriores.
+ */
+function runtimeMessage(target: Element): string {
+  let message = '';
+  target.childNodes.forEach(node => {
+    if (node.nodeType === Node.ELEMENT_NODE) {
+      message += `{$${(node as Element).getAttribute('id') ?? ''}}`;
+    } else if (node.nodeType === Node.TEXT_NODE || node.nodeType === Node.CDATA_SECTION_NODE) {
+      message += node.textContent ?? '';
     }
-  };
-  // También exponemos el idioma actual para que los componentes puedan leerlo si es necesario
-  (window as any).currentAppLanguage = language;
+  });
+  return message.trim();
 }
 
-// 3. Si el idioma no es el base (español), cargar el archivo de traducción
-if (language === 'es') {
-  // Si es español, arrancar la aplicación directamente sin cargar traducciones
-  console.log('🚀 Bootstrapping application in base language: Spanish');
-  bootstrapApplication(AppComponent, appConfig).catch((err) =>
-    console.error(err)
-  );
-} else {
-  // Si es otro idioma, buscar el archivo XLIFF y luego arrancar
-  console.log(`⏳ Loading translation file for: ${language}`);
-  fetch(`assets/locale/messages.${language}.xlf`)
+/**
+ * Carga las traducciones de un idioma directamente desde su archivo XLIFF.
+ * @param language El código del idioma (ej. 'en').
+ * @returns Un mapa id -> traducción para loadTranslations.
+ */
+function loadXliffTranslations(language: string): Promise<{ [key: string]: string }> {
+  return fetch(`assets/locale/messages.${language}.xlf`)
     .then(response => {
       console.log(`✅ Fetch response status: ${response.status}`);
       if (!response.ok) {
@@ -95,13 +134,15 @@ if (language === 'es') {
             const id = transUnit.getAttribute('id');
             const targetNodes = transUnit.getElementsByTagName('target');
             
-            if (id && targetNodes.length > 0 && targetNodes[0].textContent) {
+            const message = targetNodes.length > 0 ? runtimeMessage(targetNodes[0]) : '';
+            
+            if (id && message) {
               // Añadir la traducción con el ID correcto
-              translationPairs[id] = targetNodes[0].textContent.trim();
+              translationPairs[id] = message;
               
               // También probamos con el formato :@@id: que es como Angular busca las traducciones
               const altId = `:@@${id}:`;
-              translationPairs[altId] = targetNodes[0].textContent.trim();
+              translationPairs[altId] = message;
             }
           }
           console.log(`✅ Loaded ${Object.keys(translationPairs).length} translations from XLIFF file`);
@@ -113,6 +154,43 @@ if (language === 'es') {
         throw error;
       }
       
+      return translationPairs;
+    });
+}
+
+// --- El nuevo corazón del sistema ---
+
+// 1. Obtener el idioma actual
+const language = getLanguage();
+
+// 2. Exponer una función global simple para cambiar de idioma
+if (typeof window !== 'undefined') {
+  (window as any).changeAppLanguage = (newLang: string) => {
+    if (['es', 'en', 'fr', 'ru'].includes(newLang)) {
+      localStorage.setItem('preferred-language', newLang);
+      window.location.reload();
+    }
+  };
+  // También exponemos el idioma actual para que los componentes puedan leerlo si es necesario
+  (window as any).currentAppLanguage = language;
+}
+
+// 3. Si el idioma no es el base (español), cargar el archivo de traducción
+if (language === 'es') {
+  // Si es español, arrancar la aplicación directamente sin cargar traducciones
+  console.log('🚀 Bootstrapping application in base language: Spanish');
+  bootstrapApplication(AppComponent, appConfig).catch((err) =>
+    console.error(err)
+  );
+} else {
+  // Si es otro idioma, cargar su bundle JSON (o, si no existe, el archivo XLIFF) y luego arrancar
+  console.log(`⏳ Loading translations for: ${language}`);
+  loadTranslationBundle(language)
+    .catch(err => {
+      console.warn(`⚠️ Translation bundle not available for ${language}, falling back to XLIFF`, err);
+      return loadXliffTranslations(language);
+    })
+    .then(translationPairs => {
       // Cargar las traducciones antes del bootstrap usando loadTranslations
       console.log(`🚀 Loading translations and bootstrapping application`);
       // Establecer el idioma actual
@@ -129,4 +207,3 @@ if (language === 'es') {
       return bootstrapApplication(AppComponent, appConfig);
     });
 }
-
@@ -0,0 +1,646 @@
+"""
+Pruebas de auto_translate_complete.py, sin conexión: las piezas puras se prueban
+directamente y los flujos completos contra el servidor falso de
+benchmark_translate.py.
+
+Uso:
+    python -m pytest test_auto_translate_complete.py
+    python -m unittest test_auto_translate_complete
+"""
+import io
+import json
+import os
+import shutil
+import tempfile
+import threading
+import time
+import unittest
+from unittest import mock
+import xml.etree.ElementTree as ET
+
+import auto_translate_complete as atc
+from benchmark_translate import FakeTranslationServer
+
+class AdaptFuzzyMatchTest(unittest.TestCase):
+    def test_transfers_numbers(self):
+        self.assertEqual(atc.adapt_fuzzy_match('Nuevos (7 días)', 'Nuevos (30 días)', 'Nouveaux (30 jours)'),
+                         'Nouveaux (7 jours)')
+
+    def test_transfers_edge_punctuation_and_case(self):
+        self.assertEqual(atc.adapt_fuzzy_match('Activo:', 'activo', 'active'), 'Active:')
+
+    def test_does_not_copy_spanish_only_marks(self):
+        self.assertEqual(atc.adapt_fuzzy_match('¿Activo?', 'Activo', 'Active'), 'Active?')
+        self.assertEqual(atc.adapt_fuzzy_match('¡Bienvenido!', 'Bienvenido', 'Welcome'), 'Welcome!')
+
+    def test_rejects_numbers_across_plural_forms(self):
+        self.assertIsNone(atc.adapt_fuzzy_match('1 día', '3 día', '3 days'))
+        self.assertIsNone(atc.adapt_fuzzy_match('5 días', '3 días', '3 дня'))
+
+    def test_rejects_different_words(self):
+        self.assertIsNone(atc.adapt_fuzzy_match('Saldo disponible', 'Saldo bloqueado', 'Blocked balance'))
+
+class IcuParserTest(unittest.TestCase):
+    def test_text_without_braces_is_plain(self):
+        message = atc.parse_icu_message("It''s plain")
+        self.assertTrue(message.is_plain)
+        self.assertEqual(message.text, "It''s plain")
+
+    def test_plural_cases_are_leaves(self):
+        text = '{count, plural, =1 {una orden} other {# órdenes}}'
+        message = atc.parse_icu_message(text)
+        self.assertEqual(message.text, '__ICU_PLACEHOLDER_0__')
+        self.assertEqual(message.leaves, ['una orden', '__ICU_PLACEHOLDER_0__ órdenes'])
+        self.assertEqual(message.render({}), text)
+        self.assertEqual(message.render({'una orden': 'one order', '__ICU_PLACEHOLDER_0__ órdenes': '__ICU_PLACEHOLDER_0__ orders'}),
+                         '{count, plural, =1 {one order} other {# orders}}')
+
+    def test_escaped_apostrophe_is_literal_text(self):
+        text = "It''s {n, plural, =1 {one} other {many}}"
+        message = atc.parse_icu_message(text)
+        self.assertEqual(message.text, "It's __ICU_PLACEHOLDER_0__")
+        self.assertEqual(message.render({}), text)
+        self.assertEqual(message.render({"It's __ICU_PLACEHOLDER_0__": "C'est __ICU_PLACEHOLDER_0__"}),
+                         "C''est {n, plural, =1 {one} other {many}}")
+
+    def test_quoted_braces_are_masked(self):
+        text = "{n, plural, other {'{'# items'}'}}"
+        message = atc.parse_icu_message(text)
+        self.assertEqual(message.leaves, ['__ICU_PLACEHOLDER_0____ICU_PLACEHOLDER_1__ items__ICU_PLACEHOLDER_2__'])
+        self.assertEqual(message.render({}), text)
+
+    def test_invalid_syntax_falls_back_to_plain(self):
+        message = atc.parse_icu_message('{count, plural, =1 {una orden}')
+        self.assertTrue(message.is_plain)
+
+def inline(kind: str, number: int) -> str:
+    return f'__INLINE_{kind}_{number}__'
+
+class InlineTokensTest(unittest.TestCase):
+    def test_tokens_may_be_reordered(self):
+        source = f'{inline("OPEN", 1)}Hola{inline("CLOSE", 1)} y {inline("PLACEHOLDER", 2)}'
+        translated = f'{inline("PLACEHOLDER", 2)} and {inline("OPEN", 1)}Hello{inline("CLOSE", 1)}'
+        self.assertTrue(atc.inline_tokens_preserved(source, translated))
+
+    def test_missing_or_crossed_tokens_are_rejected(self):
+        source = f'{inline("OPEN", 1)}Hola{inline("CLOSE", 1)}'
+        self.assertFalse(atc.inline_tokens_preserved(source, 'Hello'))
+        self.assertFalse(atc.inline_tokens_preserved(source, f'{inline("CLOSE", 1)}Hello{inline("OPEN", 1)}'))
+
+    def test_orphan_tokens_of_a_split_sentence(self):
+        source = f'fin{inline("CLOSE", 1)}. {inline("OPEN", 3)}más{inline("CLOSE", 3)}'
+        self.assertTrue(atc.inline_tokens_preserved(source, f'end{inline("CLOSE", 1)}. {inline("OPEN", 3)}more{inline("CLOSE", 3)}'))
+        self.assertFalse(atc.inline_tokens_preserved(source, f'end. {inline("OPEN", 3)}more{inline("CLOSE", 1)}{inline("CLOSE", 3)}'))
+
+class GlossaryTest(unittest.TestCase):
+    def setUp(self):
+        self.glossary = atc.Glossary(['ROI', 'Visenture', 'Visenture Premium'], {'Premium': {'fr': 'Premium+'}})
+
+    def test_masks_whole_words_only(self):
+        self.assertEqual(self.glossary.mask('El ROI es HEROICO'), 'El __TERM_0__ es HEROICO')
+
+    def test_prefers_the_longest_term(self):
+        self.assertEqual(self.glossary.mask('Visenture Premium y Visenture'), '__TERM_2__ y __TERM_1__')
+
+    def test_restores_terms_and_forced_translations(self):
+        masked = self.glossary.mask('Plan Premium de Visenture')
+        self.assertEqual(self.glossary.restore(masked, 'fr'), 'Plan Premium+ de Visenture')
+        self.assertEqual(self.glossary.restore(masked, 'en'), 'Plan Premium de Visenture')
+
+    def test_lost_terms_are_detected(self):
+        self.assertFalse(atc.placeholders_preserved('Ver __TERM_0__', 'See ROI'))
+
+    def test_fingerprint_depends_only_on_the_terms_of_the_text(self):
+        masked = self.glossary.mask('Plan Premium de Visenture')
+        self.assertEqual(self.glossary.fingerprint(self.glossary.mask('Sin términos'), 'fr'), '')
+        self.assertNotEqual(self.glossary.fingerprint(masked, 'fr'), self.glossary.fingerprint(masked, 'en'))
+        # Un término nuevo que el texto no contiene no cambia su huella
+        extended = atc.Glossary(['ROI', 'Visenture', 'Visenture Premium', 'NYSE'], {'Premium': {'fr': 'Premium+'}})
+        self.assertEqual(extended.fingerprint(extended.mask('Plan Premium de Visenture'), 'fr'),
+                         self.glossary.fingerprint(masked, 'fr'))
+
+    def test_units_made_only_of_terms_need_no_backend(self):
+        translator = atc.AutomaticTranslator(glossary=self.glossary)
+        try:
+            self.assertTrue(translator.is_glossary_only('Visenture'))
+            self.assertFalse(translator.is_glossary_only('Bienvenido a Visenture'))
+            self.assertEqual(translator.translate_text('Visenture', 'en'), 'Visenture')
+        finally:
+            translator.close()
+
+    def test_default_glossary_is_loaded_unless_disabled(self):
+        translator = atc.AutomaticTranslator()
+        self.addCleanup(translator.close)
+        self.assertEqual(translator.glossary.terms, atc.Glossary.default().terms)
+        disabled = atc.AutomaticTranslator(glossary=False)
+        self.addCleanup(disabled.close)
+        self.assertIsNone(disabled.glossary)
+
+class RuntimeMessageTest(unittest.TestCase):
+    def test_inline_elements_become_localize_placeholders(self):
+        target = ET.fromstring('<target>Hola <x id="INTERPOLATION" equiv-text="{{ name }}"/>, bienvenido</target>')
+        self.assertEqual(atc.runtime_message(target), 'Hola {$INTERPOLATION}, bienvenido')
+
+class SegmentedTextTest(unittest.TestCase):
+    def test_splits_sentences_and_rebuilds_the_text(self):
+        segmented = atc.SegmentedText('Primera frase. Segunda frase.\nTercera')
+        self.assertTrue(segmented.is_split)
+        self.assertEqual(segmented.leaves, ['Primera frase.', 'Segunda frase.', 'Tercera'])
+        self.assertEqual(segmented.render({'Segunda frase.': 'Second sentence.'}),
+                         'Primera frase. Second sentence.\nTercera')
+
+    def test_long_sentences_fit_the_limit(self):
+        segmented = atc.SegmentedText('uno dos tres cuatro cinco seis', limit=10)
+        self.assertTrue(all(len(leaf.encode('utf-8')) <= 10 for leaf in segmented.leaves))
+        self.assertEqual(segmented.render({}), 'uno dos tres cuatro cinco seis')
+
+    def test_texts_split_when_they_have_several_sentences_or_do_not_fit(self):
+        self.assertIsNone(atc.AutomaticTranslator._segment('Una sola frase, con una coma'))
+        self.assertEqual(atc.AutomaticTranslator._segment('Hola. ¿Qué tal?').leaves, ['Hola.', '¿Qué tal?'])
+        # El límite cuenta bytes UTF-8, no caracteres
+        words = ' '.join(['canción'] * (atc.SEGMENT_MAX_BYTES // 8))
+        self.assertLessEqual(len(words), atc.SEGMENT_MAX_BYTES)
+        segmented = atc.AutomaticTranslator._segment(words)
+        self.assertTrue(all(len(leaf.encode('utf-8')) <= atc.SEGMENT_MAX_BYTES for leaf in segmented.leaves))
+        self.assertIsNone(atc.AutomaticTranslator._segment('x' * (atc.SEGMENT_MAX_BYTES + 1)))
+
+class PackBatchesTest(unittest.TestCase):
+    def test_respects_payload_limit_and_segment_count(self):
+        segments = ['a' * 10, 'b' * 10, 'c' * 10, 'd']
+        size = 10 + len(atc.BATCH_DELIMITER)
+        self.assertEqual(atc.AutomaticTranslator._pack_batches(segments, 2 * size),
+                         [['a' * 10, 'b' * 10], ['c' * 10, 'd']])
+        self.assertEqual(atc.AutomaticTranslator._pack_batches(segments, 1000, max_segments=3),
+                         [['a' * 10, 'b' * 10, 'c' * 10], ['d']])
+
+    def test_oversized_segment_gets_its_own_batch(self):
+        self.assertEqual(atc.AutomaticTranslator._pack_batches(['x' * 50, 'y'], 20), [['x' * 50], ['y']])
+
+class BackendRouterTest(unittest.TestCase):
+    def test_circuit_opens_after_failures_and_closes_when_a_probe_succeeds(self):
+        recovered = threading.Event()
+        probes = []
+
+        def probe(backend: str):
+            probes.append(backend)
+            # El primer sondeo falla; el segundo responde y cierra el circuito
+            router.record(backend, len(probes) > 1, 0.01)
+            if len(probes) > 1:
+                recovered.set()
+
+        router = atc.BackendRouter(['google', 'mymemory'], probe, failure_threshold=3)
+        self.addCleanup(router.close)
+        router.health['google'].reset_timeout = 0.05
+        router.record('mymemory', True, 0.5)
+        for _ in range(2):
+            router.record('google', False, 0.01)
+        self.assertEqual(router.order()[0], 'google')
+
+        router.record('google', False, 0.01)
+        self.assertEqual(router.order(), ['mymemory'])
+        self.assertFalse(router.is_available('google'))
+        self.assertEqual(router.health['google'].trips, 1)
+
+        self.assertTrue(recovered.wait(5))
+        self.assertEqual(probes, ['google', 'google'])
+        self.assertTrue(router.is_available('google'))
+        self.assertEqual(router.health['google'].reset_timeout, atc.ROUTER_RESET_TIMEOUT)
+        self.assertEqual(router.order(), ['google', 'mymemory'])
+
+class RetryQueueTest(unittest.TestCase):
+    def test_backoff_runs_out_after_max_attempts(self):
+        queue = atc.RetryQueue(base_delay=1.0, max_delay=2.0, max_attempts=2)
+        self.assertTrue(queue.defer('a'))
+        self.assertEqual(queue.pop_ready(time.monotonic()), [])
+        self.assertEqual(queue.pop_ready(time.monotonic() + 1.0), [('a', 1)])
+        self.assertTrue(queue.defer('a', 2))
+        self.assertFalse(queue.defer('a', 3))
+        self.assertEqual(queue.drain(), ['a'])
+        self.assertEqual(len(queue), 0)
+
+    def test_failed_segments_are_retried_between_rounds(self):
+        translator = atc.AutomaticTranslator(concurrency=dict.fromkeys(atc.BACKEND_CONCURRENCY, 1))
+        self.addCleanup(translator.close)
+        calls = []
+
+        def backend(name: str):
+            def translate(text: str, target_lang: str, source_lang: str) -> str:
+                calls.append(text)
+                # El segmento falla en los tres backends la primera vez
+                if text.startswith('Falla') and calls.count(text) <= 3:
+                    raise atc.HttpStatusError(name, 503, 'Service Unavailable', {})
+                time.sleep(0.15)
+                return '\n'.join(f'[{target_lang}] {line}' for line in text.split('\n'))
+            return translate
+
+        for name in atc.BACKEND_CONCURRENCY:
+            setattr(translator, f'_translate_with_{name}', backend(name))
+        texts = ['Falla la primera vez'] + [f'Texto {number}' for number in range(12)]
+        # Un segmento por petición: cada ronda de la primera pasada es una sola petición
+        with mock.patch.dict(atc.BACKEND_PAYLOAD_LIMITS, {'google': 12}):
+            self.assertEqual(translator.translate_batch(texts, 'en'), [f'[en] {text}' for text in texts])
+        # El reintento no espera a que termine la primera pasada
+        retry = [position for position, text in enumerate(calls) if text == texts[0]][3]
+        self.assertLess(retry, len(calls) - 1)
+        self.assertEqual(translator.retry_stats,
+                         {'segments': 13, 'deferred': 1, 'retried': 1, 'recovered': 1, 'gave_up': 0})
+
+class StoreTestCase(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+
+    def tearDown(self):
+        shutil.rmtree(self.directory, ignore_errors=True)
+
+class FakeServerTestCase(StoreTestCase):
+    """Traductores apuntados a un servidor falso local (sin errores y con la latencia de la clase)."""
+    latency = 0.0
+
+    def setUp(self):
+        super().setUp()
+        self.server = FakeTranslationServer(lambda rng: self.latency)
+        self.server.start()
+        self.addCleanup(self.server.close)
+
+    def translator(self, **options) -> atc.AutomaticTranslator:
+        translator = atc.AutomaticTranslator(base_urls=self.server.base_urls(), **options)
+        self.addCleanup(translator.close)
+        return translator
+
+    def requests(self) -> int:
+        """Peticiones recibidas por los backends desde la última llamada."""
+        counts = self.server.reset_counts()
+        return sum(counts.get(backend, 0) for backend in atc.BACKEND_BASE_URLS)
+
+class HedgedRequestTest(FakeServerTestCase):
+    def hedged_translator(self, latency: float) -> atc.AutomaticTranslator:
+        translator = self.translator(hedge=True)
+        # Latencias recientes de google: el percentil del hedging queda en 'latency'
+        for _ in range(atc.HEDGE_MIN_SAMPLES):
+            translator.router.record('google', True, latency)
+        return translator
+
+    def test_slow_primary_is_hedged_to_the_next_backend(self):
+        release = threading.Event()
+        self.addCleanup(release.set)
+
+        def stalled(text: str, target_lang: str, source_lang: str) -> str:
+            release.wait(5)
+            return 'demasiado tarde'
+
+        translator = self.hedged_translator(0.01)
+        translated, backend = translator._request(stalled, 'google', 'Hola', 'en', 'es')
+        self.assertEqual((translated, backend), ('[en] Hola', 'mymemory'))
+        self.assertEqual(translator.hedge_stats, {'requests': 1, 'hedged': 1, 'won': 1})
+
+    def test_fast_primary_is_not_hedged(self):
+        translator = self.hedged_translator(2.0)
+        translated, backend = translator._request(lambda text, target_lang, source_lang: 'Hello', 'google', 'Hola', 'en', 'es')
+        self.assertEqual((translated, backend), ('Hello', 'google'))
+        self.assertEqual(translator.hedge_stats, {'requests': 1, 'hedged': 0, 'won': 0})
+        self.assertEqual(self.requests(), 0)
+
+class TranslationJournalTest(StoreTestCase):
+    def test_resume_replays_recorded_units(self):
+        path = os.path.join(self.directory, 'messages.fr.xlf.journal')
+        journal = atc.TranslationJournal(path, 'fr')
+        journal.append('unit-1', 'abc', 'Bonjour')
+        journal.append('unit-2', None, 'Au revoir')
+        journal.close()
+        # Una ejecución cortada a mitad de escritura deja la última línea incompleta
+        with open(path, 'a', encoding='utf-8') as f:
+            f.write('{"id": "unit-3", "lang": "fr"')
+
+        resumed = atc.TranslationJournal(path, 'fr', resume=True)
+        self.assertEqual(resumed.entries, {'unit-1': ('abc', 'Bonjour'), 'unit-2': (None, 'Au revoir')})
+        self.assertEqual(atc.TranslationJournal(path, 'en', resume=True).entries, {})
+        resumed.discard()
+        self.assertFalse(os.path.exists(path))
+
+class TranslationBundlesTest(StoreTestCase):
+    XLIFF = ('<?xml version="1.0" encoding="UTF-8" ?>\n'
+             '<xliff version="1.2" xmlns="urn:oasis:names:tc:xliff:document:1.2">\n'
+             '  <file source-language="es" datatype="plaintext" original="ng2.template">\n'
+             '    <body>\n'
+             '      <trans-unit id="greeting" datatype="html">\n'
+             '        <source>Hola <x id="INTERPOLATION"/></source>\n'
+             '        <target> Hello <x id="INTERPOLATION"/> </target>\n'
+             '      </trans-unit>\n'
+             '      <trans-unit id="untranslated" datatype="html">\n'
+             '        <source>Sin traducir</source>\n'
+             '      </trans-unit>\n'
+             '    </body>\n'
+             '  </file>\n'
+             '</xliff>\n')
+
+    def write_locale(self, content: str) -> str:
+        path = os.path.join(self.directory, 'messages.en.xlf')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write(content)
+        return path
+
+    def test_bundle_name_hashes_its_content(self):
+        bundle_dir = os.path.join(self.directory, 'bundles')
+        locale_file = self.write_locale(self.XLIFF)
+        entry = atc.write_translation_bundles({'en': locale_file}, bundle_dir)['en']
+        with open(os.path.join(bundle_dir, entry['file']), 'r', encoding='utf-8') as f:
+            content = f.read()
+        self.assertEqual(json.loads(content), {'locale': 'en', 'translations': {'greeting': 'Hello {$INTERPOLATION}'}})
+        self.assertEqual(entry['file'], f"messages.en.{entry['hash']}.json")
+        self.assertEqual(entry['hash'], atc.hashlib.sha256(content.encode('utf-8')).hexdigest()[:atc.BUNDLE_HASH_LENGTH])
+        with open(os.path.join(bundle_dir, atc.BUNDLE_MANIFEST_FILENAME), 'r', encoding='utf-8') as f:
+            self.assertEqual(json.load(f)['locales']['en']['file'], entry['file'])
+
+        # Otro contenido da otro nombre, y el bundle anterior se elimina
+        self.write_locale(self.XLIFF.replace('Hello', 'Hi'))
+        changed = atc.write_translation_bundles({'en': locale_file}, bundle_dir)['en']
+        self.assertNotEqual(changed['hash'], entry['hash'])
+        self.assertEqual(sorted(os.listdir(bundle_dir)), sorted([atc.BUNDLE_MANIFEST_FILENAME, changed['file']]))
+
+class CatalogTestCase(FakeServerTestCase):
+    """Catálogos XLIFF 1.2 mínimos traducidos de extremo a extremo en el directorio temporal."""
+
+    def write_source(self, units: list) -> str:
+        """Escribe messages.xlf con las unidades (id, source) indicadas."""
+        body = ''.join(f'      <trans-unit id="{unit_id}" datatype="html">\n'
+                       f'        <source>{source}</source>\n'
+                       f'      </trans-unit>\n' for unit_id, source in units)
+        path = os.path.join(self.directory, 'messages.xlf')
+        with open(path, 'w', encoding='utf-8') as f:
+            f.write('<?xml version="1.0" encoding="UTF-8" ?>\n'
+                    '<xliff version="1.2" xmlns="urn:oasis:names:tc:xliff:document:1.2">\n'
+                    '  <file source-language="es" datatype="plaintext" original="ng2.template">\n'
+                    f'    <body>\n{body}    </body>\n'
+                    '  </file>\n'
+                    '</xliff>\n')
+        return path
+
+    def run_options(self, **options) -> dict:
+        """Opciones para las funciones de entrada que dejan todo el estado en el directorio temporal."""
+        defaults = {'translation_memory_path': os.path.join(self.directory, 'tm.sqlite3'),
+                    'metrics_dir': self.directory, 'bundles': False, 'base_urls': self.server.base_urls()}
+        defaults.update(options)
+        return defaults
+
+    def translate(self, target_lang: str = 'en', **options) -> dict:
+        source_file = os.path.join(self.directory, 'messages.xlf')
+        return atc.translate_xlf_file_automatic(source_file, target_lang, **self.run_options(**options))
+
+    def targets(self, target_lang: str = 'en') -> dict:
+        """id -> texto del target de cada unidad traducida del archivo de idioma."""
+        ns = '{urn:oasis:names:tc:xliff:document:1.2}'
+        root = ET.parse(os.path.join(self.directory, f'messages.{target_lang}.xlf')).getroot()
+        return {unit.get('id'): unit.find(f'{ns}target').text
+                for unit in root.iter(f'{ns}trans-unit') if unit.find(f'{ns}target') is not None}
+
+class TranslationMemoryTest(FakeServerTestCase):
+    def test_round_trip_survives_reopening(self):
+        path = os.path.join(self.directory, 'tm.sqlite3')
+        memory = atc.TranslationMemory(path)
+        memory.put('Hola  mundo', 'Hello world', 'es', 'en', 'google')
+        memory.close()
+
+        memory = atc.TranslationMemory(path)
+        try:
+            # Los espacios y la forma Unicode se normalizan antes de buscar
+            self.assertEqual(memory.get('Hola mundo', 'es', 'en'), 'Hello world')
+            self.assertIsNone(memory.get('Hola mundo', 'es', 'fr'))
+            self.assertEqual((memory.hits, memory.misses), (1, 1))
+            self.assertEqual(memory.entries('es', 'en'), [('Hola mundo', 'Hello world')])
+        finally:
+            memory.close()
+
+    def test_translator_reuses_remembered_translations(self):
+        path = os.path.join(self.directory, 'tm.sqlite3')
+        memory = atc.TranslationMemory(path)
+        self.assertEqual(self.translator(translation_memory=memory).translate_text('Hola mundo', 'en'), '[en] Hola mundo')
+        self.assertEqual(self.requests(), 1)
+        memory.close()
+
+        memory = atc.TranslationMemory(path)
+        self.addCleanup(memory.close)
+        self.assertEqual(self.translator(translation_memory=memory).translate_text('Hola mundo', 'en'), '[en] Hola mundo')
+        self.assertEqual(self.requests(), 0)
+
+class BatchTranslationTest(FakeServerTestCase):
+    def test_batch_mode_packs_texts_into_one_request(self):
+        texts = ['Hola mundo', 'Buenos días', 'Adiós']
+        self.assertEqual(self.translator().translate_batch(texts, 'en'), [f'[en] {text}' for text in texts])
+        self.assertEqual(self.requests(), 1)
+        self.assertEqual(self.translator(batch_mode=False).translate_batch(texts, 'fr'), [f'[fr] {text}' for text in texts])
+        self.assertEqual(self.requests(), 3)
+
+class XliffStreamTest(StoreTestCase):
+    DOCUMENT = ('<?xml version="1.0" encoding="UTF-8" ?>\r\n'
+                '<xliff version="1.2" xmlns="urn:oasis:names:tc:xliff:document:1.2">\r\n'
+                '  <file source-language="es" datatype="plaintext" original="ng2.template">\r\n'
+                '    <body>\r\n'
+                '      <!-- <trans-unit id="commented"> no es una unidad -->\r\n'
+                '      <trans-unit id="empty" datatype="html">\r\n'
+                '        <source>Hola</source>\r\n'
+                '        <target/>\r\n'
+                '      </trans-unit>\r\n'
+                '      <trans-unit id="done" datatype="html">\r\n'
+                '        <source>Adiós <x id="INTERPOLATION"/></source>\r\n'
+                '        <target state="final">Au revoir <x id="INTERPOLATION"/></target>\r\n'
+                '        <!-- revisado -->\r\n'
+                '      </trans-unit>\r\n'
+                '      <trans-unit id="new" datatype="html">\r\n'
+                '        <source>Gracias</source>\r\n'
+                '      </trans-unit>\r\n'
+                '    </body>\r\n'
+                '  </file>\r\n'
+                '</xliff>\r\n').encode('utf-8')
+
+    def setUp(self):
+        super().setUp()
+        self.source_file = os.path.join(self.directory, 'messages.xlf')
+        with open(self.source_file, 'wb') as f:
+            f.write(self.DOCUMENT)
+
+    def test_reports_byte_spans_of_each_unit(self):
+        # Un bloque pequeño obliga a partir etiquetas y comentarios entre lecturas
+        for chunk_size in (7, atc.XLIFF_CHUNK_SIZE):
+            spans = [span for span, _ in atc.XliffStreamReader(self.source_file, chunk_size)]
+            self.assertEqual([span.unit_id for span in spans], ['empty', 'done', 'new'])
+            for span in spans:
+                self.assertTrue(self.DOCUMENT[span.start:span.end].startswith(b'<trans-unit'))
+                self.assertTrue(self.DOCUMENT[span.start:span.end].endswith(b'</trans-unit>'))
+                self.assertEqual(span.child_indent, b'        ')
+            self.assertEqual(spans[0].target_raw, b'<target/>')
+            self.assertEqual(spans[1].target_raw, b'<target state="final">Au revoir <x id="INTERPOLATION"/></target>')
+            self.assertIsNone(spans[2].target_start)
+            self.assertTrue(self.DOCUMENT[:spans[2].insert_at].endswith(b'<source>Gracias</source>'))
+
+    def test_patched_copy_changes_only_the_patched_bytes(self):
+        output_file = os.path.join(self.directory, 'messages.fr.xlf')
+        atc.write_patched_copy(self.source_file, output_file, [])
+        with open(output_file, 'rb') as f:
+            self.assertEqual(f.read(), self.DOCUMENT)
+
+        empty, _, new = [span for span, _ in atc.XliffStreamReader(self.source_file)]
+        patches = [(empty.target_start, empty.target_end, atc.build_target('Bonjour')),
+                   (new.insert_at, new.insert_at, b'\r\n' + new.child_indent + atc.build_target('Merci'))]
+        atc.write_patched_copy(self.source_file, output_file, patches, atc._file_signature(self.source_file))
+        with open(output_file, 'rb') as f:
+            self.assertEqual(f.read(), self.DOCUMENT.replace(b'<target/>', b'<target>Bonjour</target>').replace(
+                b'<source>Gracias</source>', b'<source>Gracias</source>\r\n        <target>Merci</target>'))
+
+class IncrementalMergeTest(CatalogTestCase):
+    def test_only_new_or_changed_units_are_translated(self):
+        self.write_source([('a', 'Hola'), ('b', 'Adiós'), ('c', 'Gracias')])
+        self.translate()
+        self.assertEqual(self.targets(), {'a': '[en] Hola', 'b': '[en] Adiós', 'c': '[en] Gracias'})
+        # Un target revisado a mano debe sobrevivir a la fusión
+        locale_file = os.path.join(self.directory, 'messages.en.xlf')
+        with open(locale_file, 'r', encoding='utf-8') as f:
+            content = f.read()
+        with open(locale_file, 'w', encoding='utf-8') as f:
+            f.write(content.replace('[en] Hola', 'Hello (reviewed)'))
+        self.requests()
+
+        self.write_source([('a', 'Hola'), ('b', 'Hasta luego'), ('d', 'Bienvenido')])
+        summary = self.translate(incremental=True, translation_memory_path=os.path.join(self.directory, 'fresh.sqlite3'))
+        self.assertEqual(self.targets(), {'a': 'Hello (reviewed)', 'b': '[en] Hasta luego', 'd': '[en] Bienvenido'})
+        self.assertEqual((summary['languages']['en']['units'], summary['languages']['en']['translated']), (2, 2))
+        self.assertEqual(self.requests(), 1)
+
+class GlossaryTranslationTest(FakeServerTestCase):
+    def test_remembered_translations_follow_glossary_changes(self):
+        memory = atc.TranslationMemory(os.path.join(self.directory, 'tm.sqlite3'))
+        self.addCleanup(memory.close)
+        before = self.translator(translation_memory=memory, glossary=False)
+        self.assertEqual(before.translate_batch(['Plan Premium', 'Hola mundo'], 'fr'), ['[fr] Plan Premium', '[fr] Hola mundo'])
+        self.requests()
+
+        # Con el término protegido, solo el texto que lo contiene se vuelve a pedir
+        glossary = atc.Glossary([], {'Premium': {'fr': 'Premium+'}})
+        after = self.translator(translation_memory=memory, glossary=glossary)
+        self.assertEqual(after.translate_batch(['Plan Premium', 'Hola mundo'], 'fr'), ['[fr] Plan Premium+', '[fr] Hola mundo'])
+        self.assertEqual(self.requests(), 1)
+        self.assertEqual(after.translate_text('Plan Premium', 'fr'), '[fr] Plan Premium+')
+
+class SegmentedTranslationTest(FakeServerTestCase):
+    def test_editing_one_sentence_sends_only_that_sentence(self):
+        memory = atc.TranslationMemory(os.path.join(self.directory, 'tm.sqlite3'))
+        self.addCleanup(memory.close)
+        self.assertEqual(self.translator(translation_memory=memory).translate_text('Primera frase. Segunda frase.', 'en'),
+                         '[en] Primera frase. [en] Segunda frase.')
+        self.requests()
+
+        translator = self.translator(translation_memory=memory)
+        translator.start_run()
+        self.assertEqual(translator.translate_text('Primera frase. Otra frase.', 'en'), '[en] Primera frase. [en] Otra frase.')
+        self.assertEqual(self.requests(), 1)
+        self.assertEqual(memory.hits, 1)
+
+class FuzzyMatchTranslationTest(FakeServerTestCase):
+    def test_near_identical_texts_reuse_the_remembered_translation(self):
+        memory = atc.TranslationMemory(os.path.join(self.directory, 'tm.sqlite3'))
+        self.addCleanup(memory.close)
+        memory.put('Nuevos (30 días)', 'Nouveaux (30 jours)', 'es', 'fr', 'google')
+        memory.put('Saldo bloqueado', 'Solde bloqué', 'es', 'fr', 'google')
+
+        translator = self.translator(translation_memory=memory)
+        batch = translator.prepare_batch(['Nuevos (7 días)', 'Saldo bloqueados'], 'fr')
+        self.assertEqual(batch.fuzzy, 1)
+        # Un texto solo parecido se propone para revisar y se traduce igualmente
+        self.assertEqual(batch.proposals['Saldo bloqueados'].target, 'Solde bloqué')
+        self.assertEqual(translator.translate_prepared(batch), ['Nouveaux (7 jours)', '[fr] Saldo bloqueados'])
+        self.assertEqual(self.requests(), 1)
+
+        # La adaptación se guarda como cualquier otra traducción; sin memoria aproximada se pide
+        self.assertEqual(memory.get('Nuevos (7 días)', 'es', 'fr'), 'Nouveaux (7 jours)')
+        self.assertEqual(self.translator(translation_memory=memory, fuzzy=False).translate_batch(['Nuevos (9 días)'], 'fr'),
+                         ['[fr] Nuevos (9 días)'])
+
+class IcuMessageTranslationTest(FakeServerTestCase):
+    def test_only_the_plural_cases_are_sent(self):
+        translated = self.translator().translate_text('{count, plural, =1 {una orden} other {# órdenes}}', 'en')
+        self.assertEqual(translated, '{count, plural, =1 {[en] una orden} other {[en] # órdenes}}')
+
+class ResumeTest(CatalogTestCase):
+    def test_interrupted_run_is_resumed_from_its_journal(self):
+        self.write_source([('a', 'Hola'), ('b', 'Adiós')])
+        catalog = atc.ParsedCatalog(os.path.join(self.directory, 'messages.xlf'))
+        journal_file = atc._journal_path(os.path.join(self.directory, 'messages.fr.xlf'))
+        journal = atc.TranslationJournal(journal_file, 'fr')
+        self.addCleanup(lambda: os.path.exists(journal_file) and os.remove(journal_file))
+        journal.append('a', catalog.fingerprints[0], 'Salut (journal)')
+        # Una entrada cuyo source cambió después no se reutiliza
+        journal.append('b', 'huella-antigua', 'Au revoir (journal)')
+        journal.close()
+
+        self.translate('fr', resume=True)
+        self.assertEqual(self.targets('fr'), {'a': 'Salut (journal)', 'b': '[fr] Adiós'})
+        self.assertEqual(self.requests(), 1)
+        self.assertFalse(os.path.exists(journal_file))
+
+class TimeBudgetTest(CatalogTestCase):
+    latency = 0.2
+
+    def test_units_left_when_the_budget_runs_out_stay_pending(self):
+        units = [(f'u{number}', f'Texto número {number}') for number in range(10)]
+        self.write_source(units)
+        concurrency = dict.fromkeys(atc.BACKEND_CONCURRENCY, 1)
+        summary = self.translate(time_budget=0.5, batch_mode=False, concurrency=concurrency)['languages']['en']
+        self.assertGreater(summary['translated'], 0)
+        self.assertGreater(summary['pending'], 0)
+        self.assertEqual((summary['translated'] + summary['pending'], summary['failed']), (len(units), 0))
+        # Lo traducido se escribe; lo pendiente queda sin target para la próxima ejecución
+        targets = self.targets()
+        self.assertEqual(len(targets), summary['translated'])
+        self.assertTrue(all(targets[unit_id] == f'[en] {source}' for unit_id, source in units if unit_id in targets))
+
+        summary = self.translate(incremental=True)['languages']['en']
+        self.assertEqual((summary['translated'], summary['pending']), (len(units) - len(targets), 0))
+        self.assertEqual(len(self.targets()), len(units))
+
+class InlineElementsTest(CatalogTestCase):
+    def test_inline_elements_survive_translation(self):
+        self.write_source([('greeting', 'Hola <x id="INTERPOLATION" equiv-text="{{ name }}"/>, bienvenido'),
+                           ('icon', '<x id="START_TAG_SPAN"/><x id="CLOSE_TAG_SPAN"/>')])
+        self.translate()
+        with open(os.path.join(self.directory, 'messages.en.xlf'), 'r', encoding='utf-8') as f:
+            content = f.read()
+        self.assertIn('<target>[en] Hola <x id="INTERPOLATION" equiv-text="{{ name }}"/>, bienvenido</target>', content)
+        # Sin texto traducible el target copia el source sin pasar por los backends
+        self.assertIn('<target><x id="START_TAG_SPAN"/><x id="CLOSE_TAG_SPAN"/></target>', content)
+        self.assertEqual(self.requests(), 1)
+
+class WatchTest(CatalogTestCase):
+    def wait_for(self, condition, timeout: float = 10.0):
+        deadline = time.monotonic() + timeout
+        while not condition():
+            self.assertLess(time.monotonic(), deadline, 'watch mode did not update in time')
+            time.sleep(0.02)
+
+    def test_each_update_prints_a_summary_and_logs_outside_the_output_dir(self):
+        source_file = self.write_source([('a', 'Hola')])
+        state_dir = os.path.join(self.directory, 'state')
+        stop = threading.Event()
+        output = io.StringIO()
+        with mock.patch('sys.stdout', output):
+            watcher = threading.Thread(target=atc.watch_translations, args=(source_file, self.directory),
+                                       kwargs=self.run_options(languages=['en'], metrics_dir=state_dir,
+                                                               poll_interval=0.05, stop=stop))
+            watcher.start()
+            try:
+                self.wait_for(lambda: output.getvalue().count('Locale files updated') == 1)
+                self.assertEqual(self.targets(), {'a': '[en] Hola'})
+                self.write_source([('a', 'Hola'), ('b', 'Adiós')])
+                self.wait_for(lambda: output.getvalue().count('Locale files updated') == 2)
+                self.assertEqual(self.targets(), {'a': '[en] Hola', 'b': '[en] Adiós'})
+            finally:
+                stop.set()
+                watcher.join(timeout=10)
+        self.assertFalse(watcher.is_alive())
+        # El resumen de cada actualización cuenta solo lo de esa actualización
+        self.assertIn('Locale files updated: 1/1 units translated, 1 requests, 0 translation memory hits', output.getvalue())
+        self.assertEqual(output.getvalue().count('1/1 units translated'), 2)
+        self.assertFalse([name for name in os.listdir(self.directory) if name.endswith('.log')])
+        self.assertTrue([name for name in os.listdir(state_dir) if name.endswith('.log')])
+        self.assertTrue(os.path.exists(os.path.join(state_dir, atc.METRICS_REPORT_FILENAME)))
+
+if __name__ == '__main__':
+    unittest.main()